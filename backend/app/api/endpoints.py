@@ -1,28 +1,95 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from pydantic import BaseModel
-from ..services.deployment_service import deployment_service
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Header, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime
+from typing import Optional
+import asyncio
+import base64
+import orjson
+from ..services.deployment_service import deployment_service, DEFAULT_INSTANCE_TYPE
+from ..services.aws_client_pool import client_pool
+from ..services.monitor_service import monitor_service
+from ..services.expiry_service import expiry_service
+from ..services.event_bus import event_bus
+from ..services.log_sink import system_log
+from ..services.deploy_queue import deploy_queue, PRIORITY_ORDER
+from ..services.warm_pool import warm_pool
+from ..services.cluster import cluster
+from ..services.rate_limiter import rate_limiter
+from ..core.config import settings
 from ..db.crud import crud
-from ..db.models import Account
+from ..db.cache import status_cache
+from ..db.capacity import capacity_index
+from ..db.models import Account, Instance, InstanceStatus, JobStatus, LogLevel
 
 router = APIRouter()
 
+# Fields a client may ask for in /instances?fields=
+INSTANCE_FIELDS = {field.alias or name for name, field in Instance.model_fields.items()}
+
 class DeployRequest(BaseModel):
     user_id: str
     region: str = "us-east-1"
 
+class BatchDeployRequest(BaseModel):
+    user_id: str
+    count: int = Field(ge=1, le=500)
+    region: str = "us-east-1"
+    instance_type: str = DEFAULT_INSTANCE_TYPE
+
 class AccountCreate(BaseModel):
     access_key: str
     secret_key: str
     regions: list[str] = ["us-east-1"]
     total_quota: int = 10
 
-@router.post("/deploy")
-async def deploy(request: DeployRequest):
+def _check_user_id(user_id: Optional[str]):
+    # Warm pool instances (and their passwords) must not be reachable as a user
+    if user_id == settings.WARM_POOL_USER_ID:
+        raise HTTPException(status_code=400, detail="Reserved user_id")
+
+@router.post("/deploy", status_code=202)
+async def deploy(request: DeployRequest, response: Response, idempotency_key: Optional[str] = Header(None)):
+    """
+    Queues the deploy and returns at once. Poll /deploy/jobs/{job_id} for the
+    outcome. Retrying with the same Idempotency-Key header returns the
+    original job instead of launching again.
+    """
+    _check_user_id(request.user_id)
+    if await crud.count_deploy_jobs(JobStatus.QUEUED) >= settings.DEPLOY_QUEUE_MAX_DEPTH:
+        raise HTTPException(status_code=503, detail="Deploy queue is full, try again later")
+    job, created = await deploy_queue.enqueue(
+        "order", request.user_id, request.region, priority=PRIORITY_ORDER, idempotency_key=idempotency_key
+    )
+    response.headers["Location"] = f"{settings.API_V1_STR}/deploy/jobs/{job['_id']}"
+    return {"status": job["status"], "job_id": str(job["_id"]), "duplicate": not created}
+
+@router.get("/deploy/jobs/{job_id}")
+async def get_deploy_job(job_id: str):
     try:
-        result = await deployment_service.deploy_instance(request.user_id, request.region)
-        return {"status": "success", "data": result}
+        job = await crud.get_deploy_job(job_id)
+    except InvalidId:
+        job = None
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job["_id"] = str(job["_id"])
+    job.pop("owner", None)
+    return ORJSONResponse(job)
+
+@router.post("/deploy/batch")
+async def deploy_batch(request: BatchDeployRequest):
+    _check_user_id(request.user_id)
+    try:
+        result = await deployment_service.deploy_batch(
+            request.user_id, request.count, request.region, request.instance_type
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if result["launched"] == 0:
+        raise HTTPException(status_code=503, detail=result)
+    return {"status": result["status"], "data": result}
 
 @router.post("/admin/accounts")
 async def add_account(account: AccountCreate):
@@ -34,26 +101,212 @@ async def add_account(account: AccountCreate):
         remaining_quota=account.total_quota,
         total_quota=account.total_quota
     )
-    # Insert manually using motor directly for now or add create_account to CRUD
-    from ..db.mongodb import db
-    result = await db.db.accounts.insert_one(new_account.model_dump(by_alias=True, exclude=["id"]))
-    return {"status": "created", "id": str(result.inserted_id)}
+    account_id = await crud.create_account(new_account)
+    # Re-adding a key (e.g. with a rotated secret) must not reuse a stale client
+    client_pool.invalidate(account.access_key)
+    return {"status": "created", "id": account_id}
+
+@router.get("/capacity")
+async def get_capacity():
+    """
+    Free quota slots per region, summed over active accounts.
+    """
+    return {"regions": capacity_index.snapshot()}
+
+@router.get("/admin/stats")
+async def get_stats():
+    return {
+        "aws_client_pool": client_pool.stats(),
+        "aws_rate_limiter": rate_limiter.stats(),
+        "monitor": monitor_service.stats(),
+        "expiry": expiry_service.stats(),
+        "status_cache": status_cache.stats(),
+        "capacity_index": capacity_index.stats(),
+        "event_bus": event_bus.stats(),
+        "system_log": system_log.stats(),
+        "deploy_queue": await deploy_queue.stats(),
+        "warm_pool": await warm_pool.stats(),
+        "cluster": await cluster.stats(),
+    }
+
+@router.get("/admin/logs")
+async def list_logs(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    level: Optional[LogLevel] = None,
+    account_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """
+    System logs, newest first. Pass `next_cursor` back as `cursor` for older records.
+    """
+    before = None
+    if cursor:
+        try:
+            ts, last_id = _decode_token(cursor).split("|")
+            before = (datetime.fromisoformat(ts), str(ObjectId(last_id)))
+        except (ValueError, InvalidId):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    docs = await crud.list_logs(before, limit, level=level, account_id=account_id, since=since, until=until)
+    next_cursor = None
+    if len(docs) > limit:
+        last = docs[limit - 1]
+        next_cursor = _encode_token(f"{last['timestamp'].isoformat()}|{last['_id']}")
+    docs = docs[:limit]
+    for doc in docs:
+        doc["_id"] = str(doc["_id"])
+    return ORJSONResponse({"items": docs, "next_cursor": next_cursor})
 
 @router.get("/status/{instance_id}")
-async def get_status(instance_id: str):
-    # Retrieve from DB
-    from ..db.mongodb import db
-    from bson import ObjectId
-    doc = await db.db.instances.find_one({"_id": ObjectId(instance_id)})
-    if not doc:
+async def get_status(instance_id: str, if_none_match: Optional[str] = Header(None)):
+    # Served from the status cache; pollers that send If-None-Match get a bodyless 304
+    try:
+        cached = await crud.get_instance_status(instance_id)
+    except InvalidId:
+        cached = None
+    if not cached:
         raise HTTPException(status_code=404, detail="Instance not found")
-    
+
+    headers = {"ETag": cached.etag, "Last-Modified": cached.last_modified, "Cache-Control": "no-cache"}
+    if if_none_match and cached.etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
     # In real world, we might trigger a live check here if it's still pending
     # But for now, just return DB state
-    doc["_id"] = str(doc["_id"])
-    return doc
+    return ORJSONResponse(cached.doc, headers=headers)
+
+@router.get("/instances/stream")
+async def stream_instance_events(request: Request, user_id: str):
+    """
+    Server-Sent Events feed of a user's instance transitions (created,
+    running, terminated, replaced, expired). Replaces polling /status.
+    """
+    _check_user_id(user_id)
+    sub = event_bus.subscribe(user_id)
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                if sub.dropped and sub.queue.empty():
+                    # Fell behind and was cut off; the client should resync and reconnect
+                    yield "event: dropped\ndata: {}\n\n"
+                    return
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), settings.EVENT_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {orjson.dumps(event).decode()}\n\n"
+        finally:
+            event_bus.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _encode_token(value: str) -> str:
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+def _decode_token(token: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(token.encode()).decode()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _parse_fields(fields: Optional[str]) -> Optional[list]:
+    if not fields:
+        return None
+    projection = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = set(projection) - INSTANCE_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return projection
+
+@router.get("/instances/changes")
+async def list_instance_changes(
+    since: Optional[str] = Query(None, description="next_since from the previous call; omit for a full sync"),
+    user_id: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=5000),
+):
+    """
+    Delta sync: instances changed since the given position, oldest first.
+    Terminated instances come back as tombstones. Keep calling with
+    next_since while has_more is true, then poll with the last next_since.
+    Without user_id the feed spans every customer, so it leaves out
+    passwords and the warm pool's stock.
+    """
+    _check_user_id(user_id)
+    position = None
+    if since:
+        try:
+            ts, last_id = _decode_token(since).split("|")
+            position = (datetime.fromisoformat(ts), str(ObjectId(last_id)))
+        except (ValueError, InvalidId):
+            raise HTTPException(status_code=400, detail="Invalid since token")
+
+    if user_id:
+        docs = await crud.list_instance_changes(position, user_id=user_id, limit=limit)
+    else:
+        docs = await crud.list_instance_changes(
+            position, limit=limit, exclude_user_id=settings.WARM_POOL_USER_ID, projection={"initial_password": 0}
+        )
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    changes, tombstones = [], []
+    for doc in docs:
+        doc["_id"] = str(doc["_id"])
+        if doc.get("status") == InstanceStatus.TERMINATED:
+            tombstones.append({key: doc.get(key) for key in ("_id", "instance_id", "user_id", "updated_at")})
+        else:
+            changes.append(doc)
+
+    if docs:
+        last = docs[-1]
+        next_since = _encode_token(f"{last['updated_at'].isoformat()}|{last['_id']}")
+    else:
+        next_since = since
+    return ORJSONResponse({
+        "changes": changes,
+        "tombstones": tombstones,
+        "next_since": next_since,
+        "has_more": has_more,
+    })
 
 @router.get("/instances")
-async def list_instances(user_id: str):
-    instances = await crud.get_user_instances(user_id)
-    return [inst.model_dump(by_alias=True) for inst in instances]
+async def list_instances(
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    status: Optional[str] = None,
+    region: Optional[str] = None,
+):
+    """
+    Keyset-paginated listing. Pass `next_cursor` back as `cursor` for the next page.
+    Served from a secondary when one is available (MONGO_LISTING_READ_PREFERENCE),
+    so a just-deployed instance can take a moment to appear.
+    """
+    _check_user_id(user_id)
+    after = None
+    if cursor:
+        try:
+            after = str(ObjectId(_decode_token(cursor)))
+        except InvalidId:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    docs, next_after = await crud.list_user_instances(
+        user_id, after=after, limit=limit, fields=_parse_fields(fields), status=status, region=region
+    )
+    # Straight from BSON to JSON: no model validation round trip
+    for doc in docs:
+        doc["_id"] = str(doc["_id"])
+    return ORJSONResponse({
+        "items": docs,
+        "next_cursor": _encode_token(next_after) if next_after else None,
+    })
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "RentMachine"
@@ -8,10 +8,153 @@ class Settings(BaseSettings):
     # MongoDB
     MONGODB_URL: str
     DATABASE_NAME: str = "rentmachine"
-    
+    # Client pool and timeouts (None leaves pymongo's default)
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_MAX_IDLE_TIME_MS: Optional[int] = None
+    MONGO_MAX_CONNECTING: int = 2
+    MONGO_CONNECT_TIMEOUT_MS: int = 20000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 30000
+    MONGO_SOCKET_TIMEOUT_MS: Optional[int] = None
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: Optional[int] = None
+    # Comma-separated wire compressors in order of preference, e.g.
+    # "zstd,snappy,zlib" (zstd and snappy need their Python packages)
+    MONGO_COMPRESSORS: str = ""
+    # Client-wide defaults; an empty write concern uses the server's default
+    MONGO_READ_PREFERENCE: str = "primary"
+    MONGO_WRITE_CONCERN: str = ""
+    # Per-operation profiles (db.mongodb LISTING / CRITICAL / LOGS). Write
+    # concerns are "majority" or a node count such as "1".
+    MONGO_LISTING_READ_PREFERENCE: str = "secondaryPreferred"
+    # At least 90 when set; None accepts any lag
+    MONGO_LISTING_MAX_STALENESS_SECONDS: Optional[int] = None
+    MONGO_CRITICAL_WRITE_CONCERN: str = "majority"
+    MONGO_LOG_WRITE_CONCERN: str = "1"
+    # A timed-out write may still have been applied, so keep this unset
+    # unless callers can cope with that
+    MONGO_WRITE_TIMEOUT_MS: Optional[int] = None
+
     # AWS Defaults (Can be overridden per account in DB, but global defaults here if needed)
     AWS_DEFAULT_REGION: str = "us-east-1"
     
+    # AWS client pool (shared boto3 clients, keyed by access key + region)
+    AWS_CLIENT_POOL_MAX_SIZE: int = 256
+    AWS_CLIENT_POOL_TTL_SECONDS: int = 1800
+    AWS_MAX_POOL_CONNECTIONS: int = 20
+    AWS_CONNECT_TIMEOUT: int = 5
+    AWS_READ_TIMEOUT: int = 30
+    AWS_RETRY_MODE: str = "standard"
+    # botocore's total attempts per call, first try included (1 = botocore
+    # never retries). Retries happen in AWSService._call instead, where the
+    # rate limiter can see every throttle.
+    AWS_TOTAL_MAX_ATTEMPTS: int = 1
+    
+    # Blocking boto3 calls run on a bounded thread pool
+    AWS_EXECUTOR_MAX_WORKERS: int = 32
+    AWS_MAX_CONCURRENCY_PER_ACCOUNT_REGION: int = 8
+    
+    # EC2 rate limiting per account/region and API category (requests/second
+    # and burst). Rates back off on throttling and recover on success.
+    AWS_RATE_LIMITS: Dict[str, Dict[str, float]] = {
+        "describe": {"rate": 20, "burst": 50},
+        "mutating": {"rate": 5, "burst": 20},
+    }
+    AWS_RATE_MIN: float = 0.5
+    AWS_RATE_DECREASE_FACTOR: float = 0.5
+    AWS_RATE_INCREASE_PER_SUCCESS: float = 0.1
+    # Retries after a throttle or transient error, with full-jitter backoff
+    AWS_CALL_MAX_RETRIES: int = 4
+    AWS_RETRY_BASE_SECONDS: float = 0.2
+    AWS_RETRY_MAX_SECONDS: float = 5
+    # Consecutive transient failures that take an account/region out of rotation, and for how long
+    AWS_BREAKER_FAILURE_THRESHOLD: int = 5
+    AWS_BREAKER_OPEN_SECONDS: float = 30
+    
+    # Account selection: most_remaining | round_robin | weighted_random
+    ACCOUNT_SELECTION_STRATEGY: str = "weighted_random"
+    
+    # Monitor jobs
+    MONITOR_PENDING_INTERVAL_SECONDS: int = 5
+    # Per-instance poll delays while PENDING: fixed steps first (IPs usually
+    # show up within 10-20s), then doubling up to the cap.
+    POLL_SCHEDULE_SECONDS: List[int] = [10, 5, 5, 5, 10, 20]
+    POLL_MAX_INTERVAL_SECONDS: int = 300
+    MONITOR_CONCURRENCY: int = 8
+    MONITOR_TICK_BUDGET_SECONDS: float = 25
+    REPLENISH_INTERVAL_MINUTES: int = 5
+    REPLENISH_CONCURRENCY: int = 4
+    REPLENISH_TICK_BUDGET_SECONDS: float = 240
+    REPLENISH_LEASE_SECONDS: int = 600
+    REPLENISH_RETRY_BASE_SECONDS: int = 60
+    REPLENISH_RETRY_MAX_SECONDS: int = 3600
+    RECONCILE_INTERVAL_MINUTES: int = 10
+    RECONCILE_CONCURRENCY: int = 4
+    # Records younger than this may not be visible in DescribeInstances yet
+    RECONCILE_GRACE_SECONDS: int = 300
+    # Only list instances tagged ManagedBy=rentmachine. Leave off until every
+    # live instance carries the tag (instances launched before tagging don't).
+    RECONCILE_TAGGED_ONLY: bool = False
+    
+    # Expiry engine
+    EXPIRY_INTERVAL_SECONDS: int = 5
+    EXPIRY_CONCURRENCY: int = 4
+    # Backoff for records that couldn't be terminated (missing or dead account, EC2 error)
+    EXPIRY_RETRY_BASE_SECONDS: int = 60
+    EXPIRY_RETRY_MAX_SECONDS: int = 3600
+    
+    # /status read-through cache
+    STATUS_CACHE_TTL_SECONDS: float = 5
+    STATUS_CACHE_MAX_SIZE: int = 10000
+    
+    # Rebuild the in-memory capacity index this often to pick up other processes' writes
+    CAPACITY_REBUILD_INTERVAL_SECONDS: int = 60
+    
+    # Warm pool: pre-launched instances handed out on deploy.
+    # Targets are {region: {instance_type: count}}, e.g. {"us-east-1": {"t2.micro": 5}}
+    WARM_POOL_ENABLED: bool = False
+    WARM_POOL_TARGETS: Dict[str, Dict[str, int]] = {}
+    WARM_POOL_REFILL_INTERVAL_SECONDS: int = 30
+    # Pool instances belong to this user until handed out
+    WARM_POOL_USER_ID: str = "__warm_pool__"
+    # On-demand $/hour, only used to estimate what idle pool instances cost
+    WARM_POOL_HOURLY_PRICES: Dict[str, float] = {"t2.micro": 0.0116, "t3.small": 0.0208}
+    
+    # Server-sent instance event stream
+    EVENT_STREAM_QUEUE_SIZE: int = 100
+    EVENT_STREAM_HEARTBEAT_SECONDS: float = 15
+
+    # Deploy job queue
+    DEPLOY_WORKERS: int = 8
+    # Jobs running at once per region, per process; overrides by region name
+    DEPLOY_REGION_CONCURRENCY: int = 4
+    DEPLOY_REGION_CONCURRENCY_OVERRIDES: Dict[str, int] = {}
+    DEPLOY_JOB_LEASE_SECONDS: int = 300
+    DEPLOY_JOB_MAX_ATTEMPTS: int = 3
+    DEPLOY_JOB_RETRY_SECONDS: int = 10
+    DEPLOY_QUEUE_POLL_SECONDS: float = 1
+    # /deploy answers 503 once this many jobs are waiting
+    DEPLOY_QUEUE_MAX_DEPTH: int = 5000
+    # Also how long an idempotency key is remembered
+    DEPLOY_JOB_RETENTION_DAYS: int = 7
+
+    # Multi-process coordination: workers heartbeat into Mongo, split
+    # monitor/expiry work by account:region and elect a leader for singleton jobs
+    CLUSTER_HEARTBEAT_SECONDS: float = 5
+    # A worker that misses heartbeats this long is presumed dead; also the leader lease length
+    CLUSTER_WORKER_TTL_SECONDS: float = 20
+    CLUSTER_SHARDING_ENABLED: bool = True
+
+    # System log sink
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_BATCH_SIZE: int = 500
+    LOG_FLUSH_INTERVAL_SECONDS: float = 2
+    # Changing this after the TTL index exists needs a collMod on the logs collection
+    LOG_RETENTION_DAYS: int = 14
+
+    # /metrics
+    METRICS_ENABLED: bool = True
+    METRICS_LOOP_LAG_INTERVAL_SECONDS: float = 0.5
+
     # Security
     SECRET_KEY: str = "your-secret-key-here"
     
@@ -0,0 +1,237 @@
+from .config import settings
+from typing import Dict, List, Optional, Sequence, Tuple
+import asyncio
+import bisect
+import functools
+import time
+
+# In-process metrics in Prometheus text format, served on /metrics. Metrics
+# are declared next to the code they measure. With METRICS_ENABLED off every
+# recording call returns straight away and instrument_methods leaves
+# classes untouched. Read once at import, so toggling needs a restart.
+ENABLED = settings.METRICS_ENABLED
+
+# Seconds; spans a cached Mongo read up to a slow paginated DescribeInstances
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def error_code(exc: BaseException) -> str:
+    # botocore ClientError carries the AWS error code; anything else by class
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code", type(exc).__name__)
+    return type(exc).__name__
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._values.items()):
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        if not ENABLED:
+            return
+        self._values[self._key(labels)] = value
+
+class _HistogramValue:
+    __slots__ = ("buckets", "sum", "count")
+
+    def __init__(self, size: int):
+        self.buckets = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+class _Timer:
+    def __init__(self, histogram: "Histogram", errors: Optional[Counter], labels: dict):
+        self.histogram = histogram
+        self.errors = errors
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        if exc is not None and self.errors is not None:
+            self.errors.inc(code=error_code(exc), **self.labels)
+        return False
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = _HistogramValue(len(self.buckets) + 1)
+        entry.buckets[bisect.bisect_left(self.buckets, value)] += 1
+        entry.sum += value
+        entry.count += 1
+
+    def time(self, errors: Optional[Counter] = None, **labels):
+        """
+        Context manager that observes the elapsed time, and on an exception
+        also bumps `errors` (which must have the same labels plus `code`).
+        """
+        if not ENABLED:
+            return _NULL_TIMER
+        return _Timer(self, errors, labels)
+
+    def _render_sample(self, key, entry) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), entry.buckets):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+        labels = _format_labels(self.labels, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(entry.sum)}")
+        lines.append(f"{self.name}_count{labels} {entry.count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+def instrument_methods(histogram: Histogram, errors: Counter):
+    """
+    Class decorator: times every public coroutine method, labeled by
+    operation=<method name>. A no-op when metrics are disabled.
+    """
+    def decorator(cls):
+        if not ENABLED:
+            return cls
+        for name, fn in list(vars(cls).items()):
+            if name.startswith("_") or not asyncio.iscoroutinefunction(fn):
+                continue
+            setattr(cls, name, _timed(fn, histogram, errors, name))
+        return cls
+    return decorator
+
+def _timed(fn, histogram: Histogram, errors: Counter, operation: str):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        with histogram.time(errors, operation=operation):
+            return await fn(*args, **kwargs)
+    return wrapper
+
+EVENT_LOOP_LAG = registry.gauge(
+    "event_loop_lag_seconds", "How late the last event loop probe woke up"
+)
+EVENT_LOOP_LAG_HISTOGRAM = registry.histogram(
+    "event_loop_lag_probe_seconds", "Event loop probe wake-up delay",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+class LoopLagMonitor:
+    """
+    Sleeps for a fixed interval and records how much later than asked it
+    woke up. Sustained lag means something is blocking the event loop.
+    """
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if ENABLED:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        interval = settings.METRICS_LOOP_LAG_INTERVAL_SECONDS
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            lag = max(0.0, loop.time() - started - interval)
+            EVENT_LOOP_LAG.set(lag)
+            EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
+
+loop_lag_monitor = LoopLagMonitor()
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Iterable, Optional
+import hashlib
+import time
+import orjson
+from ..core.config import settings
+
+class CachedStatus:
+    __slots__ = ("doc", "etag", "last_modified", "expires_at")
+
+    def __init__(self, doc: dict, ttl: float):
+        self.doc = doc
+        body = orjson.dumps(doc, default=str, option=orjson.OPT_SORT_KEYS)
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        modified = doc.get("updated_at") or doc.get("launch_time") or datetime.utcnow()
+        self.last_modified = format_datetime(modified.replace(tzinfo=timezone.utc), usegmt=True)
+        self.expires_at = time.monotonic() + ttl
+
+class StatusCache:
+    """
+    Bounded in-process TTL cache of instance documents for /status polling.
+    Write paths in crud invalidate entries, so the TTL only bounds staleness
+    for writes made by other processes.
+    """
+    def __init__(self, max_size: int = None, ttl_seconds: float = None):
+        self.max_size = max_size or settings.STATUS_CACHE_MAX_SIZE
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.STATUS_CACHE_TTL_SECONDS
+        self._entries: "OrderedDict[str, CachedStatus]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, instance_db_id: str) -> Optional[CachedStatus]:
+        entry = self._entries.get(instance_db_id)
+        if entry is None or entry.expires_at < time.monotonic():
+            if entry is not None:
+                del self._entries[instance_db_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(instance_db_id)
+        self.hits += 1
+        return entry
+
+    def put(self, instance_db_id: str, doc: dict) -> CachedStatus:
+        entry = CachedStatus(doc, self.ttl_seconds)
+        self._entries[instance_db_id] = entry
+        self._entries.move_to_end(instance_db_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def invalidate(self, instance_db_id) -> None:
+        if self._entries.pop(str(instance_db_id), None) is not None:
+            self.invalidations += 1
+
+    def invalidate_many(self, instance_db_ids: Iterable) -> None:
+        for instance_db_id in instance_db_ids:
+            self.invalidate(instance_db_id)
+
+    def clear(self) -> None:
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+status_cache = StatusCache()
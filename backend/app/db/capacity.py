@@ -0,0 +1,123 @@
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+from .models import AccountStatus
+from ..core.metrics import registry
+
+CAPACITY_AVAILABLE = registry.gauge(
+    "capacity_available", "Remaining quota summed over active accounts, per region", ["region"]
+)
+
+class CapacityIndex:
+    """
+    In-process sum of remaining_quota over active accounts, per region.
+    crud's account writes keep it current; a periodic rebuild picks up
+    writes made by other processes.
+
+    Accounts don't carry instance types (every slot fits any type), so the
+    index is keyed by region alone.
+    """
+    def __init__(self):
+        # account id -> (regions, remaining_quota, active)
+        self._accounts: Dict[str, Tuple[Tuple[str, ...], int, bool]] = {}
+        self._regions: Dict[str, int] = defaultdict(int)
+        self._account_counts: Dict[str, int] = defaultdict(int)
+        self.loaded = False
+        self.rebuilds = 0
+
+    def load(self, docs: Iterable[dict]) -> None:
+        """
+        Replaces the index with the given account documents.
+        """
+        self._accounts = {}
+        self._regions = defaultdict(int)
+        self._account_counts = defaultdict(int)
+        for doc in docs:
+            self._add(str(doc["_id"]), doc.get("regions", []), doc.get("remaining_quota", 0),
+                      doc.get("status") == AccountStatus.ACTIVE)
+        self.loaded = True
+        self.rebuilds += 1
+        self._publish(self._regions)
+
+    def clear(self) -> None:
+        self._accounts = {}
+        self._regions = defaultdict(int)
+        self._account_counts = defaultdict(int)
+        self.loaded = False
+
+    def _add(self, account_id: str, regions, quota: int, active: bool) -> None:
+        regions = tuple(regions)
+        self._accounts[account_id] = (regions, quota, active)
+        if active:
+            for region in regions:
+                self._regions[region] += max(quota, 0)
+                self._account_counts[region] += quota > 0
+
+    def _remove(self, account_id: str):
+        entry = self._accounts.pop(account_id, None)
+        if entry is None:
+            return None
+        regions, quota, active = entry
+        if active:
+            for region in regions:
+                self._regions[region] -= max(quota, 0)
+                self._account_counts[region] -= quota > 0
+        return entry
+
+    def _publish(self, regions: Iterable[str]) -> None:
+        for region in regions:
+            CAPACITY_AVAILABLE.set(self._regions[region], region=region)
+
+    def put_account(self, doc: dict) -> None:
+        """
+        Adds or replaces one account from its document.
+        """
+        account_id = str(doc["_id"])
+        old = self._remove(account_id)
+        self._add(account_id, doc.get("regions", []), doc.get("remaining_quota", 0),
+                  doc.get("status") == AccountStatus.ACTIVE)
+        self._publish(set(doc.get("regions", [])) | set(old[0] if old else ()))
+
+    def set_quota(self, account_id: str, quota: int) -> None:
+        entry = self._remove(account_id)
+        if entry is None:
+            return
+        regions, _, active = entry
+        self._add(account_id, regions, quota, active)
+        self._publish(regions)
+
+    def adjust_quota(self, account_id: str, delta: int) -> None:
+        entry = self._accounts.get(account_id)
+        if entry is not None:
+            self.set_quota(account_id, entry[1] + delta)
+
+    def set_status(self, account_id: str, status: AccountStatus) -> None:
+        entry = self._remove(account_id)
+        if entry is None:
+            return
+        regions, quota, _ = entry
+        self._add(account_id, regions, quota, status == AccountStatus.ACTIVE)
+        self._publish(regions)
+
+    def available(self, region: str) -> Optional[int]:
+        """
+        Free slots in the region, or None before the index has been loaded.
+        """
+        if not self.loaded:
+            return None
+        return self._regions.get(region, 0)
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {
+            region: {"available": self._regions[region], "accounts": self._account_counts[region]}
+            for region in sorted(self._regions)
+        }
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "accounts": len(self._accounts),
+            "regions": len(self._regions),
+            "rebuilds": self.rebuilds,
+        }
+
+capacity_index = CapacityIndex()
@@ -1,12 +1,548 @@
-    async def update_instance_info(self, instance_db_id: str, public_ip: str, status: InstanceStatus):
+from .mongodb import db, CRITICAL, LISTING, LOGS
+from .cache import status_cache, CachedStatus
+from .capacity import capacity_index
+from .models import Account, AccountStatus, DeployJob, Instance, InstanceStatus, JobStatus, SystemLog, LIVE_STATUSES
+from ..core.metrics import instrument_methods, registry
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Scheduler bookkeeping that clients never see; writes touching only these
+# don't bump updated_at, so delta sync isn't flooded by poll reschedules.
+BOOKKEEPING_FIELDS = {
+    "next_check_at",
+    "check_attempts",
+    "metadata.replenish_lease_until",
+    "metadata.replenish_owner",
+    "metadata.replenish_attempts",
+    "metadata.replenish_retry_at",
+    "metadata.replenish_error",
+    "metadata.expiry_retry_at",
+    "metadata.expiry_attempts",
+}
+
+def _touch(update: dict) -> dict:
+    """
+    Adds updated_at to an instance update unless it only changes bookkeeping.
+    """
+    fields = {field for operator in update.values() for field in operator}
+    if fields <= BOOKKEEPING_FIELDS:
+        return update
+    return {**update, "$set": {**update.get("$set", {}), "updated_at": datetime.utcnow()}}
+
+DB_OPERATION_SECONDS = registry.histogram(
+    "db_operation_duration_seconds", "Latency of crud operations, including any cache hit", ["operation"]
+)
+DB_OPERATION_ERRORS = registry.counter(
+    "db_operation_errors_total", "Failed crud operations by error", ["operation", "code"]
+)
+
+@instrument_methods(DB_OPERATION_SECONDS, DB_OPERATION_ERRORS)
+class CRUD:
+    # Operations name the consistency they need through db.collection profiles:
+    # CRITICAL for quota and lease state, LISTING for dashboard reads that
+    # can trail the primary, LOGS for log inserts. Everything else uses the
+    # client defaults.
+
+    # Accounts
+    async def create_account(self, account: Account) -> str:
+        doc = account.model_dump(by_alias=True, exclude=["id"])
+        result = await db.collection("accounts", CRITICAL).insert_one(doc)
+        capacity_index.put_account({**doc, "_id": result.inserted_id})
+        return str(result.inserted_id)
+
+    async def rebuild_capacity_index(self):
+        """
+        Reloads the in-memory capacity index from every account.
+        """
+        cursor = db.collection("accounts", CRITICAL).find({}, {"regions": 1, "remaining_quota": 1, "status": 1})
+        capacity_index.load(await cursor.to_list(length=None))
+
+    async def get_account_by_id(self, account_id: str) -> Optional[Account]:
+        doc = await db.db.accounts.find_one({"_id": ObjectId(account_id)})
+        return Account(**doc) if doc else None
+
+    async def get_accounts_by_ids(self, account_ids: Iterable[str]) -> Dict[str, Account]:
+        """
+        Fetches several accounts with a single $in query, keyed by string id.
+        """
+        ids = [ObjectId(acc_id) for acc_id in set(account_ids)]
+        if not ids:
+            return {}
+        cursor = db.db.accounts.find({"_id": {"$in": ids}})
+        return {str(doc["_id"]): Account(**doc) async for doc in cursor}
+
+    async def get_accounts_for_instances(self, query: dict) -> Dict[str, Optional[Account]]:
+        """
+        The accounts behind every instance matching query: one distinct and
+        one $in. Ids with no account map to None.
+        """
+        account_ids = await db.db.instances.distinct("account_id", query)
+        accounts = await self.get_accounts_by_ids(account_ids)
+        return {account_id: accounts.get(account_id) for account_id in account_ids}
+
+    async def list_account_regions(self) -> List[Tuple[str, str]]:
+        """
+        Every (account_id, region) pair an account is configured for,
+        whatever its status.
+        """
+        cursor = db.db.accounts.find({}, {"regions": 1})
+        return [(str(doc["_id"]), region) async for doc in cursor for region in doc.get("regions", [])]
+
+    def _reservable_query(self, region: str, exclude: Iterable[str] = ()) -> dict:
+        query = {
+            "status": AccountStatus.ACTIVE,
+            "regions": region,
+            "remaining_quota": {"$gt": 0}
+        }
+        excluded = [ObjectId(account_id) for account_id in exclude if ObjectId.is_valid(account_id)]
+        if excluded:
+            query["_id"] = {"$nin": excluded}
+        return query
+
+    async def get_reservable_quotas(self, region: str, limit: int = 50, exclude: Iterable[str] = ()) -> List[dict]:
+        """
+        Lightweight (_id, remaining_quota) view of reservable accounts, served
+        from the account_reservation index.
+        """
+        cursor = db.collection("accounts", CRITICAL).find(
+            self._reservable_query(region, exclude),
+            {"_id": 1, "remaining_quota": 1}
+        ).sort("remaining_quota", -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def reserve_account_quota(self, region: str, count: int = 1, sort: list = None,
+                                    account_id: str = None, exclude: Iterable[str] = ()) -> Optional[Tuple[Account, int]]:
+        """
+        Atomically takes up to `count` quota slots from one eligible account,
+        skipping the account ids in `exclude`. Returns (account as it was
+        before the reservation, slots reserved) or None if no account matched.
+        """
+        query = self._reservable_query(region, exclude)
+        if account_id:
+            query["_id"] = ObjectId(account_id)
+        now = datetime.utcnow()
+        if count == 1:
+            update = {"$inc": {"remaining_quota": -1}, "$set": {"last_reserved_at": now}}
+        else:
+            # Pipeline update so a single round trip takes min(remaining, count)
+            update = [{"$set": {
+                "remaining_quota": {"$max": [0, {"$subtract": ["$remaining_quota", count]}]},
+                "last_reserved_at": now
+            }}]
+        doc = await db.collection("accounts", CRITICAL).find_one_and_update(
+            query, update, sort=sort, return_document=ReturnDocument.BEFORE
+        )
+        if not doc:
+            return None
+        reserved = min(doc["remaining_quota"], count)
+        capacity_index.set_quota(str(doc["_id"]), doc["remaining_quota"] - reserved)
+        return Account(**doc), reserved
+
+    async def update_account_status(self, account_id: str, status: AccountStatus):
+        await db.collection("accounts", CRITICAL).update_one(
+            {"_id": ObjectId(account_id)},
+            {"$set": {"status": status, "updated_at": datetime.utcnow()}}
+        )
+        capacity_index.set_status(account_id, status)
+
+    async def adjust_account_quotas(self, deltas: Dict[str, int]):
+        """
+        Applies one $inc on remaining_quota per account in a single bulk_write.
+        """
+        ops = [
+            UpdateOne({"_id": ObjectId(account_id)}, {"$inc": {"remaining_quota": delta}})
+            for account_id, delta in deltas.items() if delta
+        ]
+        if ops:
+            await db.collection("accounts", CRITICAL).bulk_write(ops, ordered=False)
+            for account_id, delta in deltas.items():
+                capacity_index.adjust_quota(account_id, delta)
+
+    # Instances
+    async def create_instance(self, instance: Instance) -> str:
+        result = await db.db.instances.insert_one(instance.model_dump(by_alias=True, exclude=["id"]))
+        return str(result.inserted_id)
+
+    async def create_instances(self, instances: List[Instance]) -> List[str]:
+        if not instances:
+            return []
+        result = await db.db.instances.insert_many(
+            [inst.model_dump(by_alias=True, exclude=["id"]) for inst in instances],
+            ordered=False
+        )
+        return [str(_id) for _id in result.inserted_ids]
+
+    async def get_instance_status(self, instance_db_id: str) -> Optional[CachedStatus]:
+        """
+        Read-through: serves /status polling from status_cache, falling back
+        to one find_one on a miss.
+        """
+        cached = status_cache.get(instance_db_id)
+        if cached:
+            return cached
+        doc = await db.db.instances.find_one({"_id": ObjectId(instance_db_id)})
+        if not doc:
+            return None
+        doc["_id"] = str(doc["_id"])
+        return status_cache.put(instance_db_id, doc)
+
+    async def bulk_update_instances(self, updates: List[Tuple[object, dict]]) -> int:
+        """
+        Sends (instance db id, update document) pairs as one unordered bulk_write.
+        """
+        if not updates:
+            return 0
+        ops = [UpdateOne({"_id": ObjectId(_id)}, _touch(update)) for _id, update in updates]
+        result = await db.db.instances.bulk_write(ops, ordered=False)
+        status_cache.invalidate_many(_id for _id, _ in updates)
+        return result.modified_count
+
+    async def mark_instances_expired(self, instance_db_ids: List[object]) -> int:
+        """
+        Marks still-live records TERMINATED/expired in one bulk_write. The
+        status guard makes this idempotent, so the modified count is exactly
+        the quota to give back.
+        """
+        if not instance_db_ids:
+            return 0
+        now = datetime.utcnow()
+        ops = [
+            UpdateOne(
+                {"_id": ObjectId(_id), "status": {"$in": LIVE_STATUSES}},
+                {"$set": {
+                    "status": InstanceStatus.TERMINATED,
+                    "public_ip": None,
+                    "terminated_at": now,
+                    "updated_at": now,
+                    "metadata.expired": True
+                }}
+            )
+            for _id in instance_db_ids
+        ]
+        result = await db.db.instances.bulk_write(ops, ordered=False)
+        status_cache.invalidate_many(instance_db_ids)
+        return result.modified_count
+
+    # Replenishment claims
+    async def claim_replenish_candidate(self, owner: str, lease_seconds: int) -> Optional[dict]:
+        """
+        Atomically claims one terminated instance that still has paid time
+        left and isn't leased or waiting out a retry backoff. Only the claim
+        holder may replace it until the lease expires.
+        """
+        now = datetime.utcnow()
+        doc = await db.db.instances.find_one_and_update(
+            {
+                "status": InstanceStatus.TERMINATED,
+                "expire_at": {"$gt": now},
+                "metadata.replenished": {"$ne": True},
+                # $not/$gt also matches missing or null fields
+                "metadata.replenish_lease_until": {"$not": {"$gt": now}},
+                "metadata.replenish_retry_at": {"$not": {"$gt": now}},
+            },
+            {
+                "$set": {
+                    "metadata.replenish_lease_until": now + timedelta(seconds=lease_seconds),
+                    "metadata.replenish_owner": owner,
+                },
+                "$inc": {"metadata.replenish_attempts": 1},
+            },
+            sort=[("expire_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if doc:
+            status_cache.invalidate(doc["_id"])
+        return doc
+
+    async def complete_replenish(self, old_db_id, new_db_id: str, expire_at: datetime):
+        # New instance inherits the original expiration
+        await db.db.instances.update_one(
+            {"_id": ObjectId(new_db_id)},
+            _touch({"$set": {"expire_at": expire_at, "metadata.replaces": str(old_db_id)}})
+        )
+        await db.db.instances.update_one(
+            {"_id": ObjectId(old_db_id)},
+            _touch({
+                "$set": {"metadata.replenished": True, "metadata.replaced_by": new_db_id},
+                "$unset": {"metadata.replenish_lease_until": "", "metadata.replenish_owner": ""},
+            })
+        )
+        status_cache.invalidate_many([old_db_id, new_db_id])
+
+    async def release_replenish_claim(self, db_id, retry_at: datetime, error: str):
         await db.db.instances.update_one(
-            {"_id": ObjectId(instance_db_id)},
-            {"$set": {"public_ip": public_ip, "status": status}}
+            {"_id": ObjectId(db_id)},
+            {
+                "$set": {"metadata.replenish_retry_at": retry_at, "metadata.replenish_error": error},
+                "$unset": {"metadata.replenish_lease_until": "", "metadata.replenish_owner": ""},
+            }
         )
-    
-    async def get_user_instances(self, user_id: str) -> List[Instance]:
-        cursor = db.db.instances.find({"user_id": user_id})
-        instances = await cursor.to_list(length=100)
-        return [Instance(**inst) for inst in instances]
+        status_cache.invalidate(db_id)
+
+    # Warm pool
+    async def claim_warm_instance(self, pool_user_id: str, user_id: str, region: str,
+                                  instance_type: str) -> Optional[dict]:
+        """
+        Atomically reassigns the oldest ready pool instance to user_id and
+        returns it as updated, or None if none is ready.
+        """
+        doc = await db.db.instances.find_one_and_update(
+            {
+                "user_id": pool_user_id,
+                "status": InstanceStatus.RUNNING,
+                "region": region,
+                "instance_type": instance_type,
+                "public_ip": {"$ne": None},
+            },
+            _touch({"$set": {"user_id": user_id, "metadata.warm_pool_handed_at": datetime.utcnow()}}),
+            sort=[("_id", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if doc:
+            status_cache.invalidate(doc["_id"])
+        return doc
+
+    async def count_warm_instances(self, pool_user_id: str, region: str, instance_type: str) -> int:
+        return await db.db.instances.count_documents({
+            "user_id": pool_user_id,
+            "status": {"$in": LIVE_STATUSES},
+            "region": region,
+            "instance_type": instance_type,
+        })
+
+    async def list_warm_instances(self, pool_user_id: str) -> List[dict]:
+        cursor = db.collection("instances", LISTING).find(
+            {"user_id": pool_user_id, "status": {"$in": LIVE_STATUSES}},
+            {"region": 1, "instance_type": 1, "status": 1, "public_ip": 1, "launch_time": 1}
+        )
+        return await cursor.to_list(length=None)
+
+    async def list_user_instances(self, user_id: str, after: Optional[str] = None, limit: int = 100,
+                                  fields: Optional[List[str]] = None, status: Optional[str] = None,
+                                  region: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        One page of a user's instances in _id order, as raw documents.
+        Keyset pagination on (user_id, _id): pass the returned id back as
+        `after` to get the next page. Returns (docs, next_after or None).
+        """
+        query = {"user_id": user_id}
+        if after:
+            query["_id"] = {"$gt": ObjectId(after)}
+        if status:
+            query["status"] = status
+        if region:
+            query["region"] = region
+        projection = {field: 1 for field in fields} if fields else None
+
+        cursor = db.collection("instances", LISTING).find(query, projection).sort("_id", 1).limit(limit + 1)
+        docs = await cursor.to_list(length=limit + 1)
+        next_after = str(docs[limit - 1]["_id"]) if len(docs) > limit else None
+        return docs[:limit], next_after
+
+    async def list_instance_changes(self, since: Optional[Tuple[datetime, str]] = None,
+                                    user_id: Optional[str] = None, limit: int = 500,
+                                    settle_seconds: float = 2, exclude_user_id: Optional[str] = None,
+                                    projection: Optional[dict] = None) -> List[dict]:
+        """
+        Instances whose updated_at is past the (updated_at, _id) keyset
+        position `since`, oldest change first. Changes from the last
+        `settle_seconds` are held back so a write still in flight with a
+        slightly older timestamp isn't skipped by the next sync. Reads the
+        primary: a lagging secondary could move the cursor past changes it
+        hasn't replicated yet.
+        """
+        upper = datetime.utcnow() - timedelta(seconds=settle_seconds)
+        query = {"updated_at": {"$lte": upper}}
+        if user_id:
+            query["user_id"] = user_id
+        elif exclude_user_id:
+            query["user_id"] = {"$ne": exclude_user_id}
+        if since:
+            ts, last_id = since
+            query["$or"] = [
+                {"updated_at": {"$gt": ts}},
+                {"updated_at": ts, "_id": {"$gt": ObjectId(last_id)}},
+            ]
+        cursor = db.db.instances.find(query, projection).sort([("updated_at", 1), ("_id", 1)]).limit(limit + 1)
+        return await cursor.to_list(length=limit + 1)
+
+    async def backfill_instance_updated_at(self):
+        """
+        Records written before updated_at existed never match a delta sync;
+        stamp them with their last known change time.
+        """
+        await db.db.instances.update_many(
+            {"updated_at": None},
+            [{"$set": {"updated_at": {"$ifNull": ["$terminated_at", "$launch_time"]}}}]
+        )
+
+    # Deploy jobs
+    async def enqueue_deploy_job(self, job: DeployJob) -> Tuple[dict, bool]:
+        """
+        Inserts a queued job. If its idempotency key is already taken, the
+        existing job is returned instead. Returns (job doc, created).
+        """
+        doc = job.model_dump(by_alias=True, exclude=["id"])
+        if doc["idempotency_key"] is None:
+            del doc["idempotency_key"]
+        try:
+            result = await db.db.deploy_jobs.insert_one(doc)
+        except DuplicateKeyError:
+            existing = await db.db.deploy_jobs.find_one({"idempotency_key": job.idempotency_key})
+            if existing:
+                return existing, False
+            raise
+        doc["_id"] = result.inserted_id
+        return doc, True
+
+    async def get_deploy_job(self, job_id: str) -> Optional[dict]:
+        return await db.db.deploy_jobs.find_one({"_id": ObjectId(job_id)})
+
+    async def claim_deploy_job(self, owner: str, lease_seconds: int,
+                               exclude_regions: Iterable[str] = ()) -> Optional[dict]:
+        """
+        Atomically takes the most urgent due job (lowest priority value, then
+        oldest) outside the excluded regions and leases it to `owner`.
+        """
+        now = datetime.utcnow()
+        query = {"status": JobStatus.QUEUED, "available_at": {"$lte": now}}
+        exclude_regions = list(exclude_regions)
+        if exclude_regions:
+            query["region"] = {"$nin": exclude_regions}
+        return await db.db.deploy_jobs.find_one_and_update(
+            query,
+            {
+                "$set": {
+                    "status": JobStatus.RUNNING,
+                    "owner": owner,
+                    "lease_until": now + timedelta(seconds=lease_seconds),
+                    "started_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", 1), ("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def finish_deploy_job(self, job_id, owner: str, status: JobStatus,
+                                result: Optional[dict] = None, error: Optional[str] = None) -> bool:
+        # Owner-guarded: a worker whose lease was taken over can't overwrite the outcome
+        update = await db.db.deploy_jobs.update_one(
+            {"_id": ObjectId(job_id), "owner": owner, "status": JobStatus.RUNNING},
+            {"$set": {
+                "status": status,
+                "result": result,
+                "error": error,
+                "finished_at": datetime.utcnow(),
+                "lease_until": None,
+            }}
+        )
+        return update.modified_count == 1
+
+    async def retry_deploy_job(self, job_id, owner: str, available_at: datetime, error: str) -> bool:
+        update = await db.db.deploy_jobs.update_one(
+            {"_id": ObjectId(job_id), "owner": owner, "status": JobStatus.RUNNING},
+            {"$set": {
+                "status": JobStatus.QUEUED,
+                "available_at": available_at,
+                "error": error,
+                "owner": None,
+                "lease_until": None,
+            }}
+        )
+        return update.modified_count == 1
+
+    async def requeue_expired_deploy_jobs(self) -> int:
+        """
+        Puts jobs whose worker died mid-run (lease expired) back in the queue.
+        """
+        result = await db.db.deploy_jobs.update_many(
+            {"status": JobStatus.RUNNING, "lease_until": {"$lt": datetime.utcnow()}},
+            {"$set": {"status": JobStatus.QUEUED, "owner": None, "lease_until": None}}
+        )
+        return result.modified_count
+
+    async def count_deploy_jobs(self, status: JobStatus) -> int:
+        return await db.db.deploy_jobs.count_documents({"status": status})
+
+    # Logs
+    async def insert_logs(self, logs: List[SystemLog]):
+        if logs:
+            await db.collection("logs", LOGS).insert_many(
+                [log.model_dump(by_alias=True, exclude=["id"]) for log in logs], ordered=False
+            )
+
+    async def list_logs(self, before: Optional[Tuple[datetime, str]] = None, limit: int = 100,
+                        level: Optional[str] = None, account_id: Optional[str] = None,
+                        since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[dict]:
+        """
+        Newest-first page of log records, keyset-paginated on (timestamp, _id):
+        pass the last record's position back as `before`. Returns up to
+        limit + 1 docs so the caller can tell whether there is another page.
+        """
+        query = {}
+        if level:
+            query["level"] = level
+        if account_id:
+            query["metadata.account_id"] = account_id
+        if since or until:
+            query["timestamp"] = {}
+            if since:
+                query["timestamp"]["$gte"] = since
+            if until:
+                query["timestamp"]["$lt"] = until
+        if before:
+            ts, last_id = before
+            query["$or"] = [
+                {"timestamp": {"$lt": ts}},
+                {"timestamp": ts, "_id": {"$lt": ObjectId(last_id)}},
+            ]
+        cursor = db.collection("logs", LISTING).find(query).sort([("timestamp", -1), ("_id", -1)]).limit(limit + 1)
+        return await cursor.to_list(length=limit + 1)
+
+    # Cluster membership and leases
+    async def heartbeat_worker(self, worker_id: str, ttl_seconds: float, info: dict):
+        now = datetime.utcnow()
+        await db.db.workers.update_one(
+            {"_id": worker_id},
+            {
+                "$set": {"heartbeat_at": now, "expires_at": now + timedelta(seconds=ttl_seconds), **info},
+                "$setOnInsert": {"started_at": now},
+            },
+            upsert=True
+        )
+
+    async def list_live_workers(self) -> List[str]:
+        cursor = db.db.workers.find({"expires_at": {"$gt": datetime.utcnow()}}, {"_id": 1})
+        return [doc["_id"] async for doc in cursor]
+
+    async def remove_worker(self, worker_id: str):
+        await db.db.workers.delete_one({"_id": worker_id})
+
+    async def acquire_lease(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        """
+        Takes or renews the named lease. Succeeds if nobody holds it, we
+        already do, or the holder let it expire.
+        """
+        now = datetime.utcnow()
+        try:
+            await db.collection("leases", CRITICAL).find_one_and_update(
+                {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=ttl_seconds)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Someone else holds it: the upsert tried to insert a second doc with this _id
+            return False
+        return True
+
+    async def release_lease(self, name: str, owner: str):
+        await db.collection("leases", CRITICAL).delete_one({"_id": name, "owner": owner})
+
+    async def get_lease(self, name: str) -> Optional[dict]:
+        return await db.db.leases.find_one({"_id": name, "expires_at": {"$gt": datetime.utcnow()}})
 
-    async def log_event(self, log: SystemLog):
+crud = CRUD()
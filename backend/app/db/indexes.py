@@ -0,0 +1,196 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from datetime import datetime
+from typing import List
+from .models import AccountStatus, InstanceStatus, JobStatus, LogLevel, LIVE_STATUSES
+from ..core.config import settings
+
+# Indexes the backend relies on, per collection. create_indexes is a no-op
+# for indexes that already exist with the same spec, so this runs on every
+# startup.
+INDEXES = {
+    "accounts": [
+        # Quota reservation: equality on status/regions, then sort by quota
+        IndexModel(
+            [("status", ASCENDING), ("regions", ASCENDING), ("remaining_quota", DESCENDING)],
+            name="account_reservation"
+        ),
+        IndexModel(
+            [("status", ASCENDING), ("regions", ASCENDING), ("last_reserved_at", ASCENDING)],
+            name="account_round_robin"
+        ),
+    ],
+    "instances": [
+        IndexModel([("instance_id", ASCENDING)], name="instance_id_unique", unique=True),
+        # User listings, and keyset pagination on _id within a user
+        IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)], name="user_instances"),
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING), ("_id", ASCENDING)], name="user_instances_by_status"),
+        # Monitor due-time queue. Partial, so historical records don't bloat it.
+        IndexModel(
+            [("status", ASCENDING), ("next_check_at", ASCENDING)],
+            name="pending_due",
+            partialFilterExpression={"status": InstanceStatus.PENDING.value}
+        ),
+        # Delta sync (/instances/changes), per user and fleet-wide
+        IndexModel(
+            [("user_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+            name="user_changes"
+        ),
+        IndexModel([("updated_at", ASCENDING), ("_id", ASCENDING)], name="changes"),
+        # Reconciliation: live records per account/region
+        IndexModel(
+            [("account_id", ASCENDING), ("region", ASCENDING), ("status", ASCENDING)],
+            name="account_region_status"
+        ),
+        # auto_replenish (terminated with a future expire_at) and expiry sweeps
+        IndexModel([("status", ASCENDING), ("expire_at", ASCENDING)], name="status_expire_at"),
+    ],
+    "deploy_jobs": [
+        # Worker claims: queued jobs by lane, oldest first
+        IndexModel(
+            [("status", ASCENDING), ("priority", ASCENDING), ("created_at", ASCENDING)],
+            name="job_claim"
+        ),
+        # Reaper for jobs whose worker died
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="job_lease"),
+        # Sparse: jobs without a key don't store the field at all
+        IndexModel([("idempotency_key", ASCENDING)], name="job_idempotency_key", unique=True, sparse=True),
+        # Finished jobs (and with them their idempotency keys) age out
+        IndexModel(
+            [("finished_at", ASCENDING)],
+            name="job_ttl",
+            expireAfterSeconds=settings.DEPLOY_JOB_RETENTION_DAYS * 86400
+        ),
+    ],
+    "workers": [
+        # Liveness is checked against expires_at; the TTL just clears out dead workers
+        IndexModel([("expires_at", ASCENDING)], name="worker_ttl", expireAfterSeconds=0),
+    ],
+    "logs": [
+        # Retention: mongod deletes records older than LOG_RETENTION_DAYS
+        IndexModel(
+            [("timestamp", ASCENDING)],
+            name="log_ttl",
+            expireAfterSeconds=settings.LOG_RETENTION_DAYS * 86400
+        ),
+        # /admin/logs: newest first, optionally by level or account
+        IndexModel([("timestamp", DESCENDING), ("_id", DESCENDING)], name="log_recent"),
+        IndexModel([("level", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="log_level"),
+        IndexModel(
+            [("metadata.account_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+            name="log_account"
+        ),
+    ],
+}
+
+async def ensure_indexes(database):
+    for collection, models in INDEXES.items():
+        await database[collection].create_indexes(models)
+
+def hot_queries() -> List[tuple]:
+    """
+    (name, collection, filter, sort) for every query on a hot path. Built on
+    call because some filters depend on the current time.
+    """
+    now = datetime.utcnow()
+    return [
+        ("pending_due", "instances", {
+            "status": InstanceStatus.PENDING.value,
+            "next_check_at": {"$lte": now}
+        }, [("next_check_at", ASCENDING)]),
+        ("expiry_due", "instances", {
+            "status": {"$in": [s.value for s in LIVE_STATUSES]},
+            "expire_at": {"$lte": now},
+            "metadata.expiry_retry_at": {"$not": {"$gt": now}}
+        }, [("expire_at", ASCENDING)]),
+        ("replenish_candidates", "instances", {
+            "status": InstanceStatus.TERMINATED.value,
+            "expire_at": {"$gt": now},
+            "metadata.replenished": {"$ne": True}
+        }, None),
+        ("replenish_claim", "instances", {
+            "status": InstanceStatus.TERMINATED.value,
+            "expire_at": {"$gt": now},
+            "metadata.replenished": {"$ne": True},
+            "metadata.replenish_lease_until": {"$not": {"$gt": now}},
+            "metadata.replenish_retry_at": {"$not": {"$gt": now}}
+        }, [("expire_at", ASCENDING)]),
+        ("reconcile_live", "instances", {
+            "account_id": "000000000000000000000000",
+            "region": "us-east-1",
+            "status": {"$in": [s.value for s in LIVE_STATUSES]}
+        }, None),
+        ("user_instances", "instances", {"user_id": "user_123"}, [("_id", ASCENDING)]),
+        ("user_instances_by_status", "instances", {
+            "user_id": "user_123",
+            "status": InstanceStatus.RUNNING.value
+        }, [("_id", ASCENDING)]),
+        ("user_changes", "instances", {
+            "user_id": "user_123",
+            "updated_at": {"$gt": now}
+        }, [("updated_at", ASCENDING), ("_id", ASCENDING)]),
+        ("warm_pool_claim", "instances", {
+            "user_id": settings.WARM_POOL_USER_ID,
+            "status": InstanceStatus.RUNNING.value,
+            "region": "us-east-1",
+            "instance_type": "t2.micro",
+            "public_ip": {"$ne": None}
+        }, [("_id", ASCENDING)]),
+        ("instance_by_instance_id", "instances", {"instance_id": "i-0123456789abcdef0"}, None),
+        ("reservable_accounts", "accounts", {
+            "status": AccountStatus.ACTIVE.value,
+            "regions": "us-east-1",
+            "remaining_quota": {"$gt": 0}
+        }, [("remaining_quota", DESCENDING)]),
+        ("deploy_job_claim", "deploy_jobs", {
+            "status": JobStatus.QUEUED.value,
+            "available_at": {"$lte": now},
+            "region": {"$nin": ["us-east-1"]}
+        }, [("priority", ASCENDING), ("created_at", ASCENDING)]),
+        ("deploy_job_expired_leases", "deploy_jobs", {
+            "status": JobStatus.RUNNING.value,
+            "lease_until": {"$lt": now}
+        }, None),
+        ("live_workers", "workers", {"expires_at": {"$gt": now}}, None),
+        ("recent_logs", "logs", {}, [("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        ("logs_by_level", "logs", {"level": LogLevel.ERROR.value}, [("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        ("logs_by_account", "logs", {
+            "metadata.account_id": "000000000000000000000000",
+            "timestamp": {"$gte": now}
+        }, [("timestamp", DESCENDING), ("_id", DESCENDING)]),
+    ]
+
+def _plan_stages(plan) -> List[str]:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+async def find_collection_scans(database) -> List[str]:
+    """
+    Runs explain() on every hot query and returns the names of those whose
+    winning plan falls back to a COLLSCAN.
+    """
+    offenders = []
+    for name, collection, query, sort in hot_queries():
+        cursor = database[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = await cursor.explain()
+        if "COLLSCAN" in _plan_stages(plan.get("queryPlanner", {}).get("winningPlan", {})):
+            offenders.append(name)
+    return offenders
+
+async def assert_no_collection_scans(database):
+    """
+    Test helper: run against a real mongod after ensure_indexes() and fail
+    if any hot query isn't index-backed. tests/test_indexes.py runs it when
+    MONGODB_TEST_URL is set.
+    """
+    offenders = await find_collection_scans(database)
+    assert not offenders, f"Hot queries falling back to COLLSCAN: {', '.join(offenders)}"
@@ -19,6 +19,7 @@ class Account(BaseModel):
     status: AccountStatus = AccountStatus.ACTIVE
     remaining_quota: int = 10
     total_quota: int = 10
+    last_reserved_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -28,19 +29,67 @@ class InstanceStatus(str, Enum):
     STOPPED = "stopped"
     TERMINATED = "terminated"
 
+# States in which an instance still exists (and counts against quota)
+LIVE_STATUSES = [InstanceStatus.PENDING, InstanceStatus.RUNNING, InstanceStatus.STOPPED]
+
+# EC2 instance-state-name -> our status
+EC2_STATE_MAP = {
+    "pending": InstanceStatus.PENDING,
+    "running": InstanceStatus.RUNNING,
+    "stopping": InstanceStatus.STOPPED,
+    "stopped": InstanceStatus.STOPPED,
+    "shutting-down": InstanceStatus.TERMINATED,
+    "terminated": InstanceStatus.TERMINATED,
+}
+
 class Instance(BaseModel):
     id: Optional[PyObjectId] = Field(alias="_id", default=None)
     instance_id: str
     account_id: str  # Reference to Account ID
     region: str
     user_id: str
+    instance_type: Optional[str] = None
     public_ip: Optional[str] = None
     initial_password: Optional[str] = None
     status: InstanceStatus = InstanceStatus.PENDING
     launch_time: datetime = Field(default_factory=datetime.utcnow)
+    # Bumped by every crud write path; drives /instances/changes
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    terminated_at: Optional[datetime] = None
     expire_at: Optional[datetime] = None
+    # Adaptive status polling while PENDING (see MonitorService.check_pending_instances)
+    next_check_at: Optional[datetime] = None
+    check_attempts: int = 0
     metadata: dict = Field(default_factory=dict)
     
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class DeployJob(BaseModel):
+    id: Optional[PyObjectId] = Field(alias="_id", default=None)
+    kind: str  # handler name, e.g. "order" or "replenish"
+    user_id: str
+    region: str = "us-east-1"
+    # Lower runs first
+    priority: int = 10
+    status: JobStatus = JobStatus.QUEUED
+    # Client-supplied; a second enqueue with the same key returns this job
+    idempotency_key: Optional[str] = None
+    payload: dict = Field(default_factory=dict)
+    attempts: int = 0
+    max_attempts: int = 3
+    available_at: datetime = Field(default_factory=datetime.utcnow)
+    owner: Optional[str] = None
+    lease_until: Optional[datetime] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 class LogLevel(str, Enum):
     INFO = "info"
     WARNING = "warning"
@@ -1,18 +1,92 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import WriteConcern
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+from typing import Optional, Union
 from ..core.config import settings
+from .indexes import ensure_indexes
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+# Per-operation profiles crud picks from (see MongoDB.collection)
+LISTING = "listing"    # dashboard reads that can lag the primary a little
+CRITICAL = "critical"  # quota and lease state: primary reads, majority writes
+LOGS = "logs"          # high-volume writes where losing the tail on failover is fine
+
+def _w(value: str) -> Union[int, str]:
+    # "1" -> 1, "majority" (or a tag set name) stays a string
+    return int(value) if value.isdigit() else value
+
+def _read_preference(mode: str, max_staleness: Optional[int] = None):
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {mode}")
+    if mode == "primary":
+        return Primary()
+    return READ_PREFERENCES[mode](max_staleness=max_staleness if max_staleness is not None else -1)
+
+def _write_concern(w: str) -> WriteConcern:
+    return WriteConcern(w=_w(w), wtimeout=settings.MONGO_WRITE_TIMEOUT_MS)
+
+def client_options() -> dict:
+    """
+    AsyncIOMotorClient keyword arguments from settings. Unset values are
+    left out so pymongo's defaults apply.
+    """
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS,
+        "maxConnecting": settings.MONGO_MAX_CONNECTING,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": settings.MONGO_SOCKET_TIMEOUT_MS,
+        "waitQueueTimeoutMS": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "appname": settings.PROJECT_NAME,
+    }
+    if settings.MONGO_COMPRESSORS:
+        options["compressors"] = settings.MONGO_COMPRESSORS
+    if settings.MONGO_READ_PREFERENCE != "primary":
+        options["read_preference"] = _read_preference(settings.MONGO_READ_PREFERENCE)
+    if settings.MONGO_WRITE_CONCERN:
+        options["w"] = _w(settings.MONGO_WRITE_CONCERN)
+    return {key: value for key, value in options.items() if value is not None}
 
 class MongoDB:
     client: AsyncIOMotorClient = None
     db = None
 
     async def connect_to_database(self):
-        self.client = AsyncIOMotorClient(settings.MONGODB_URL)
+        self.client = AsyncIOMotorClient(settings.MONGODB_URL, **client_options())
         self.db = self.client[settings.DATABASE_NAME]
         print("Connected to MongoDB")
+        await ensure_indexes(self.db)
 
     async def close_database_connection(self):
         if self.client:
             self.client.close()
             print("Closed MongoDB connection")
 
+    def collection(self, name: str, profile: str):
+        """
+        The collection with the read preference / write concern of a
+        profile applied. with_options makes no round trip, so this is
+        cheap enough to call per operation.
+        """
+        if profile == LISTING:
+            options = {"read_preference": _read_preference(
+                settings.MONGO_LISTING_READ_PREFERENCE, settings.MONGO_LISTING_MAX_STALENESS_SECONDS
+            )}
+        elif profile == CRITICAL:
+            options = {"read_preference": Primary(), "write_concern": _write_concern(settings.MONGO_CRITICAL_WRITE_CONCERN)}
+        elif profile == LOGS:
+            options = {"write_concern": _write_concern(settings.MONGO_LOG_WRITE_CONCERN)}
+        else:
+            raise ValueError(f"Unknown collection profile: {profile}")
+        return self.db[name].with_options(**options)
+
 db = MongoDB()
@@ -1,9 +1,19 @@
-from fastapi import FastAPI
+from datetime import datetime
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from .api.endpoints import router
 from .core.config import settings
+from .core.metrics import loop_lag_monitor, registry
 from .db.mongodb import db
+from .db.crud import crud
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from .services.monitor_service import monitor_service
+from .services.expiry_service import expiry_service
+from .services.aws_service import shutdown_executor
+from .services.log_sink import system_log
+from .services.deploy_queue import deploy_queue
+from .services.warm_pool import warm_pool
+from .services.cluster import cluster
 
 app = FastAPI(title=settings.PROJECT_NAME, docs_url="/api/docs", openapi_url="/api/openapi.json")
 scheduler = AsyncIOScheduler()
@@ -11,19 +21,67 @@ scheduler = AsyncIOScheduler()
 @app.on_event("startup")
 async def startup_db_client():
     await db.connect_to_database()
+    system_log.start()
+    loop_lag_monitor.start()
+    await crud.rebuild_capacity_index()
+    await cluster.start()
+    deploy_queue.start()
+    await monitor_service.backfill_poll_schedule()
+    await crud.backfill_instance_updated_at()
     
     # Start Scheduler
-    scheduler.add_job(monitor_service.check_pending_instances, "interval", seconds=30)
-    scheduler.add_job(monitor_service.auto_replenish, "interval", minutes=5)
+    # max_instances/coalesce: a slow tick delays the next one rather than overlapping it.
+    # Every worker runs these; the monitor and expiry passes split their
+    # work through cluster.owns, auto_replenish through atomic claims.
+    scheduler.add_job(
+        monitor_service.check_pending_instances, "interval",
+        seconds=settings.MONITOR_PENDING_INTERVAL_SECONDS, max_instances=1, coalesce=True
+    )
+    scheduler.add_job(
+        monitor_service.auto_replenish, "interval",
+        minutes=settings.REPLENISH_INTERVAL_MINUTES, max_instances=1, coalesce=True
+    )
+    scheduler.add_job(
+        monitor_service.reconcile, "interval",
+        minutes=settings.RECONCILE_INTERVAL_MINUTES, max_instances=1, coalesce=True
+    )
+    scheduler.add_job(
+        expiry_service.expire_instances, "interval",
+        seconds=settings.EXPIRY_INTERVAL_SECONDS, max_instances=1, coalesce=True
+    )
+    scheduler.add_job(
+        crud.rebuild_capacity_index, "interval",
+        seconds=settings.CAPACITY_REBUILD_INTERVAL_SECONDS, max_instances=1, coalesce=True
+    )
+    if settings.WARM_POOL_ENABLED:
+        # Leader only, or every worker would fill the pool to its target.
+        # First fill right away rather than one interval after startup.
+        scheduler.add_job(
+            cluster.leader_only(warm_pool.refill), "interval",
+            seconds=settings.WARM_POOL_REFILL_INTERVAL_SECONDS, max_instances=1, coalesce=True,
+            next_run_time=datetime.now()
+        )
     scheduler.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    # Flush buffered logs while the connection is still open
+    await deploy_queue.stop()
+    await cluster.stop()
+    await loop_lag_monitor.stop()
+    await system_log.stop()
     await db.close_database_connection()
     scheduler.shutdown()
+    shutdown_executor()
 
 app.include_router(router, prefix=settings.API_V1_STR)
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     return {"message": "RentMachine API is running"}
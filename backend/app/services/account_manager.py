@@ -1,31 +1,94 @@
 from ..db.crud import crud
-from ..db.models import Account, AccountStatus, LogLevel, SystemLog
+from ..db.models import Account, AccountStatus
+from ..core.config import settings
+from .aws_client_pool import client_pool
+from .log_sink import system_log
+from .rate_limiter import rate_limiter
+from typing import Dict, Optional, Sequence, Tuple
 import random
 
+class SortedStrategy:
+    """
+    Reserves from whichever eligible account sorts first. The sort is part of
+    the find_one_and_update, so selection and reservation are one atomic step.
+    """
+    def __init__(self, sort: list):
+        self.sort = sort
+
+    async def reserve(self, region: str, count: int, exclude: Sequence[str] = ()) -> Optional[Tuple[Account, int]]:
+        return await crud.reserve_account_quota(region, count, sort=self.sort, exclude=exclude)
+
+class WeightedRandomStrategy:
+    """
+    Picks an account with probability proportional to its remaining quota,
+    then reserves it conditionally. If another deploy drained it in between,
+    try again with a fresh sample.
+    """
+    def __init__(self, sample_size: int = 50, attempts: int = 3):
+        self.sample_size = sample_size
+        self.attempts = attempts
+
+    async def reserve(self, region: str, count: int, exclude: Sequence[str] = ()) -> Optional[Tuple[Account, int]]:
+        for _ in range(self.attempts):
+            candidates = await crud.get_reservable_quotas(region, self.sample_size, exclude=exclude)
+            if not candidates:
+                return None
+            choice = random.choices(candidates, weights=[c["remaining_quota"] for c in candidates])[0]
+            reserved = await crud.reserve_account_quota(region, count, account_id=str(choice["_id"]))
+            if reserved:
+                return reserved
+        # Heavy contention: fall back to a deterministic pick
+        return await crud.reserve_account_quota(region, count, sort=[("remaining_quota", -1)], exclude=exclude)
+
 class AccountManager:
-    async def get_available_account(self, region: str = "us-east-1") -> Account:
+    def __init__(self):
+        self.strategies: Dict[str, object] = {
+            "most_remaining": SortedStrategy([("remaining_quota", -1)]),
+            "round_robin": SortedStrategy([("last_reserved_at", 1)]),
+            "weighted_random": WeightedRandomStrategy(),
+        }
+
+    def register_strategy(self, name: str, strategy):
+        """
+        Strategies only need an async reserve(region, count, exclude) that
+        returns (account, reserved) or None, never picking an excluded account id.
         """
-        Finds an active account with quota in the specified region.
-        For now, simplistic logic: fetch all active, filter by region locally (or in query), pick one.
+        self.strategies[name] = strategy
+
+    async def reserve_account(self, region: str = "us-east-1", count: int = 1,
+                              strategy: str = None) -> Optional[Tuple[Account, int]]:
+        """
+        Atomically reserves up to `count` quota slots on an active account in
+        the region. The returned account's remaining_quota already reflects the
+        reservation. Anything that isn't launched must go back via release_account.
         """
-        # In a real app, optimize query to filter by region inside DB
-        accounts = await crud.get_active_accounts()
-        
-        # Filter by region
-        available = [acc for acc in accounts if region in acc.regions]
-        
-        if not available:
+        name = strategy or settings.ACCOUNT_SELECTION_STRATEGY
+        if name not in self.strategies:
+            raise ValueError(f"Unknown account selection strategy: {name}")
+        # Accounts whose circuit is open in this region sit out until it closes
+        reserved = await self.strategies[name].reserve(region, count, exclude=rate_limiter.open_accounts(region))
+        if not reserved:
             return None
-            
-        # Strategy: Random load balancing
-        return random.choice(available)
+        account, slots = reserved
+        account.remaining_quota -= slots
+        return account, slots
+
+    async def release_account(self, account_id: str, count: int = 1):
+        """
+        Returns reserved slots that were never used (e.g. RunInstances failed).
+        """
+        if count > 0:
+            await crud.adjust_account_quotas({account_id: count})
 
     async def mark_account_dead(self, account_id: str, reason: str):
-        await crud.update_account_status(account_id, AccountStatus.DEAD)
-        await crud.log_event(SystemLog(
-            level=LogLevel.ERROR,
-            message=f"Account {account_id} marked DEAD. Reason: {reason}",
-            metadata={"account_id": account_id}
-        ))
+        await self.set_account_status(account_id, AccountStatus.DEAD)
+        system_log.error(f"Account {account_id} marked DEAD. Reason: {reason}", account_id=account_id)
+
+    async def set_account_status(self, account_id: str, status: AccountStatus):
+        account = await crud.get_account_by_id(account_id)
+        await crud.update_account_status(account_id, status)
+        # Don't keep handing out pooled clients for an account that changed state
+        if account:
+            client_pool.invalidate(account.access_key)
 
 account_manager = AccountManager()
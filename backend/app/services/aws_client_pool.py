@@ -0,0 +1,150 @@
+import boto3
+from botocore.config import Config
+from collections import OrderedDict
+from typing import Callable, Optional
+import hashlib
+import threading
+import time
+from ..core.config import settings
+
+class _PoolEntry:
+    __slots__ = ("fingerprint", "session", "client", "resource", "created_at")
+
+    def __init__(self, fingerprint: str, session: boto3.session.Session, client):
+        self.fingerprint = fingerprint
+        self.session = session
+        self.client = client
+        self.resource = None
+        self.created_at = time.monotonic()
+
+class AWSClientPool:
+    """
+    Process-wide registry of EC2 clients keyed by (access_key, region).
+
+    boto3 clients are thread-safe and expensive to build (service model load,
+    fresh HTTPS pool), so we build one per key and hand it out again until it
+    is evicted (LRU, TTL) or invalidated because the account changed.
+    """
+
+    def __init__(self, max_size: int = None, ttl_seconds: int = None):
+        self.max_size = max_size or settings.AWS_CLIENT_POOL_MAX_SIZE
+        self.ttl_seconds = ttl_seconds or settings.AWS_CLIENT_POOL_TTL_SECONDS
+        self._entries: "OrderedDict[tuple, _PoolEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.client_factory: Optional[Callable] = None
+        self.config = Config(
+            max_pool_connections=settings.AWS_MAX_POOL_CONNECTIONS,
+            connect_timeout=settings.AWS_CONNECT_TIMEOUT,
+            read_timeout=settings.AWS_READ_TIMEOUT,
+            # botocore's "max_attempts" counts retries only; total_max_attempts includes the first try
+            retries={"mode": settings.AWS_RETRY_MODE, "total_max_attempts": settings.AWS_TOTAL_MAX_ATTEMPTS},
+            proxies={"https": settings.PROXY_URL, "http": settings.PROXY_URL} if settings.PROXY_URL else None,
+        )
+
+    @staticmethod
+    def _fingerprint(secret_key: str) -> str:
+        # Keep a hash rather than the secret so a rotated key is a cache miss.
+        return hashlib.sha256(secret_key.encode()).hexdigest()
+
+    def _build(self, access_key: str, secret_key: str, region: str) -> _PoolEntry:
+        session = boto3.session.Session(
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name=region
+        )
+        if self.client_factory:
+            client = self.client_factory(access_key, region)
+        else:
+            client = session.client('ec2', config=self.config)
+        return _PoolEntry(self._fingerprint(secret_key), session, client)
+
+    def _get_entry(self, access_key: str, secret_key: str, region: str) -> _PoolEntry:
+        key = (access_key, region)
+        fingerprint = self._fingerprint(secret_key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.fingerprint != fingerprint:
+                    del self._entries[key]
+                    self.invalidations += 1
+                elif now - entry.created_at > self.ttl_seconds:
+                    del self._entries[key]
+                    self.evictions += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+
+        # Build outside the lock; a concurrent miss on the same key just
+        # means one of the two clients is thrown away.
+        entry = self._build(access_key, secret_key, region)
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None and existing.fingerprint == fingerprint:
+                return existing
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def get_client(self, access_key: str, secret_key: str, region: str):
+        return self._get_entry(access_key, secret_key, region).client
+
+    def get_resource(self, access_key: str, secret_key: str, region: str):
+        """
+        The EC2 resource is only built when something asks for it, and it
+        reuses the pooled client's session.
+        """
+        entry = self._get_entry(access_key, secret_key, region)
+        if entry.resource is None:
+            entry.resource = entry.session.resource('ec2', config=self.config)
+        return entry.resource
+
+    def invalidate(self, access_key: str, region: Optional[str] = None):
+        """
+        Drops cached clients for an access key (all regions unless given).
+        Call this whenever an account's credentials or status change.
+        """
+        with self._lock:
+            keys = [k for k in self._entries if k[0] == access_key and (region is None or k[1] == region)]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+
+    def set_client_factory(self, factory: Optional[Callable]):
+        """
+        Builds clients with factory(access_key, region) instead of boto3,
+        e.g. an in-process EC2 stand-in for benchmarks. None restores boto3.
+        Drops every pooled client so nothing built the other way survives.
+        """
+        self.client_factory = factory
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+client_pool = AWSClientPool()
@@ -1,35 +1,170 @@
-import boto3
+from .aws_client_pool import client_pool
+from .rate_limiter import AWS_RATE_WAIT_SECONDS, AWS_RETRIES, AWS_THROTTLES, classify_error, rate_limiter, retry_delay
+from ..core.config import settings
+from ..core.metrics import registry
 from botocore.exceptions import ClientError
-from typing import Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import functools
 import time
+import uuid
 import base64
 
-class AWSService:
-    def __init__(self, access_key: str, secret_key: str, region: str):
-        self.client = boto3.client(
-            'ec2',
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-            region_name=region
-        )
-        self.resource = boto3.resource(
-            'ec2',
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-            region_name=region
+# DescribeInstances accepts at most 200 values per filter. Filtering on
+# instance-id (rather than passing InstanceIds) also means one unknown ID
+# doesn't fail the whole call with InvalidInstanceID.NotFound.
+MAX_DESCRIBE_IDS = 200
+# TerminateInstances takes up to 1000 IDs per call
+MAX_TERMINATE_IDS = 1000
+
+SSHD_PASSWORD_LOGIN = """sed -i 's/^PasswordAuthentication no/PasswordAuthentication yes/' /etc/ssh/sshd_config
+sed -i 's/^#PasswordAuthentication no/PasswordAuthentication yes/' /etc/ssh/sshd_config
+sed -i 's/^PermitRootLogin.*/PermitRootLogin yes/' /etc/ssh/sshd_config
+systemctl restart sshd"""
+
+# Every instance we launch carries this tag so inventory sweeps can ask EC2
+# for "our" instances only.
+MANAGED_TAG = {'Key': 'ManagedBy', 'Value': 'rentmachine'}
+TAG_SPECIFICATIONS = [{'ResourceType': 'instance', 'Tags': [MANAGED_TAG]}]
+
+# boto3 is blocking, so every EC2 call runs on this bounded pool instead of
+# the event loop. Per (access key, region) semaphores stop one busy account
+# from taking every worker thread.
+_executor: Optional[ThreadPoolExecutor] = None
+_limits: Dict[Tuple[str, str], asyncio.Semaphore] = {}
+
+AWS_REQUEST_SECONDS = registry.histogram(
+    "aws_request_duration_seconds", "EC2 API call latency, excluding local queueing",
+    ["operation", "region", "account"]
+)
+AWS_REQUEST_ERRORS = registry.counter(
+    "aws_request_errors_total", "Failed EC2 API calls by error code",
+    ["operation", "region", "account", "code"]
+)
+AWS_QUEUE_SECONDS = registry.histogram(
+    "aws_request_queue_seconds", "Time an EC2 call waited for its account/region concurrency slot",
+    ["region", "account"]
+)
+
+# Helpers that wrap an API call report as the call they make
+_OPERATION_NAMES = {"_describe_pages": "describe_instances"}
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.AWS_EXECUTOR_MAX_WORKERS,
+            thread_name_prefix="aws"
         )
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+    _limits.clear()
+
+def _limit_for(access_key: str, region: str) -> asyncio.Semaphore:
+    key = (access_key, region)
+    sem = _limits.get(key)
+    if sem is None:
+        sem = _limits[key] = asyncio.Semaphore(settings.AWS_MAX_CONCURRENCY_PER_ACCOUNT_REGION)
+    return sem
+
+class AWSService:
+    def __init__(self, access_key: str, secret_key: str, region: str, account_id: Optional[str] = None):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        # Only used to label metrics
+        self.account_id = account_id or "unknown"
+        self.client = client_pool.get_client(access_key, secret_key, region)
+        self._resource = None
 
-    def run_instance(self, image_id: str, instance_type: str, user_data: str) -> Optional[str]:
+    @property
+    def resource(self):
+        if self._resource is None:
+            self._resource = client_pool.get_resource(self.access_key, self.secret_key, self.region)
+        return self._resource
+
+    async def _call(self, fn, *args, **kwargs):
+        """
+        Runs a blocking boto3 call on the shared executor, within this
+        account/region's circuit breaker, rate limit and concurrency limit.
+        Throttles and transient errors are retried here with jittered
+        backoff (botocore's own retries are off by default, see
+        AWS_TOTAL_MAX_ATTEMPTS), so the limiter sees every throttle.
+        """
+        operation = _OPERATION_NAMES.get(fn.__name__, fn.__name__)
+        bucket = rate_limiter.bucket(self.account_id, self.region, operation)
+        breaker = rate_limiter.breaker(self.account_id, self.region)
+        category = bucket.labels["category"]
+        attempt = 0
+        # True while this call is the breaker's half-open trial; its retries
+        # skip before_call, which would otherwise reject them
+        trial = False
+        try:
+            while True:
+                if not trial:
+                    trial = breaker.before_call()
+                waiting_since = time.perf_counter()
+                await bucket.acquire()
+                AWS_RATE_WAIT_SECONDS.observe(time.perf_counter() - waiting_since, region=self.region, category=category)
+                try:
+                    result = await self._execute(operation, fn, *args, **kwargs)
+                except Exception as e:
+                    reason = classify_error(e)
+                    if reason is None:
+                        # EC2 answered; the request itself was bad
+                        breaker.record_success()
+                        raise
+                    if reason == "throttle":
+                        bucket.on_throttle()
+                        AWS_THROTTLES.inc(account=self.account_id, region=self.region, category=category)
+                    else:
+                        breaker.record_failure()
+                        # A failed trial has re-opened the circuit
+                        trial = False
+                    if attempt >= settings.AWS_CALL_MAX_RETRIES:
+                        if reason == "throttle":
+                            breaker.record_failure()
+                        raise
+                    attempt += 1
+                    AWS_RETRIES.inc(region=self.region, category=category, reason=reason)
+                    await asyncio.sleep(retry_delay(attempt))
+                    continue
+                bucket.on_success()
+                breaker.record_success()
+                return result
+        finally:
+            if trial:
+                breaker.end_trial()
+
+    async def _execute(self, operation: str, fn, *args, **kwargs):
+        waiting_since = time.perf_counter()
+        async with _limit_for(self.access_key, self.region):
+            AWS_QUEUE_SECONDS.observe(time.perf_counter() - waiting_since, region=self.region, account=self.account_id)
+            with AWS_REQUEST_SECONDS.time(AWS_REQUEST_ERRORS, operation=operation, region=self.region, account=self.account_id):
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(get_executor(), functools.partial(fn, *args, **kwargs))
+
+    async def run_instance(self, image_id: str, instance_type: str, user_data: str) -> Optional[str]:
         """
         Launches an EC2 instance. Returns the Instance ID.
         """
         try:
-            response = self.client.run_instances(
+            response = await self._call(
+                self.client.run_instances,
                 ImageId=image_id,
                 InstanceType=instance_type,
                 MinCount=1,
                 MaxCount=1,
                 UserData=user_data,
+                TagSpecifications=TAG_SPECIFICATIONS,
+                # Same token on every retry, so a retried launch can't start a second machine
+                ClientToken=uuid.uuid4().hex,
                 # NetworkInterfaces=[{
                 #     'DeviceIndex': 0,
                 #     'AssociatePublicIpAddress': True
@@ -43,12 +178,36 @@ class AWSService:
             print(f"Error launching instance: {e}")
             raise e
 
-    def get_instance_info(self, instance_id: str) -> dict:
+    async def run_instances(self, image_id: str, instance_type: str, user_data: str, count: int) -> List[dict]:
+        """
+        Launches up to `count` instances with a single RunInstances call
+        (MinCount=1, so EC2 may start fewer). Returns [{instance_id, launch_index}].
+        """
+        try:
+            response = await self._call(
+                self.client.run_instances,
+                ImageId=image_id,
+                InstanceType=instance_type,
+                MinCount=1,
+                MaxCount=count,
+                UserData=user_data,
+                TagSpecifications=TAG_SPECIFICATIONS,
+                ClientToken=uuid.uuid4().hex,
+            )
+            return [
+                {'instance_id': inst['InstanceId'], 'launch_index': inst.get('AmiLaunchIndex', i)}
+                for i, inst in enumerate(response['Instances'])
+            ]
+        except ClientError as e:
+            print(f"Error launching {count} instances: {e}")
+            raise e
+
+    async def get_instance_info(self, instance_id: str) -> dict:
         """
         Returns instance info including Public IP and State.
         """
         try:
-            response = self.client.describe_instances(InstanceIds=[instance_id])
+            response = await self._call(self.client.describe_instances, InstanceIds=[instance_id])
             reservations = response.get('Reservations', [])
             if not reservations:
                 return {}
@@ -63,13 +222,81 @@ class AWSService:
             print(f"Error describing instance: {e}")
             raise e
 
-    def terminate_instance(self, instance_id: str):
+    async def describe_instances(self, instance_ids: List[str]) -> Dict[str, dict]:
+        """
+        Batched get_instance_info: returns {instance_id: info} for every ID AWS
+        knows about, using one paginated DescribeInstances per 200 IDs.
+        """
+        results = {}
+        try:
+            for start in range(0, len(instance_ids), MAX_DESCRIBE_IDS):
+                chunk = instance_ids[start:start + MAX_DESCRIBE_IDS]
+                results.update(await self._call(
+                    self._describe_pages,
+                    Filters=[{'Name': 'instance-id', 'Values': chunk}]
+                ))
+        except ClientError as e:
+            print(f"Error describing instances: {e}")
+            raise e
+        return results
+
+    async def describe_inventory(self, managed_only: bool = True) -> Dict[str, dict]:
+        """
+        Full instance inventory for this account/region in one paginated
+        DescribeInstances, optionally limited to instances we tagged.
+        """
+        filters = []
+        if managed_only:
+            filters.append({'Name': f"tag:{MANAGED_TAG['Key']}", 'Values': [MANAGED_TAG['Value']]})
+        try:
+            return await self._call(self._describe_pages, Filters=filters)
+        except ClientError as e:
+            print(f"Error describing inventory: {e}")
+            raise e
+
+    def _describe_pages(self, **kwargs) -> Dict[str, dict]:
+        # Runs on the executor: the paginator makes blocking calls as it iterates
+        results = {}
+        paginator = self.client.get_paginator('describe_instances')
+        for page in paginator.paginate(PaginationConfig={'PageSize': 1000}, **kwargs):
+            for reservation in page.get('Reservations', []):
+                for instance in reservation['Instances']:
+                    results[instance['InstanceId']] = {
+                        'state': instance['State']['Name'],
+                        'public_ip': instance.get('PublicIpAddress'),
+                        'launch_time': instance.get('LaunchTime')
+                    }
+        return results
+
+    async def terminate_instance(self, instance_id: str):
         try:
-            self.client.terminate_instances(InstanceIds=[instance_id])
+            await self._call(self.client.terminate_instances, InstanceIds=[instance_id])
         except ClientError as e:
             print(f"Error terminating instance: {e}")
             raise e
 
+    async def terminate_instances(self, instance_ids: List[str]) -> List[str]:
+        """
+        Terminates many instances with one TerminateInstances per 1000 IDs.
+        IDs AWS no longer knows about are treated as already gone. Returns
+        the IDs that are (or were already) terminated.
+        """
+        done = []
+        for start in range(0, len(instance_ids), MAX_TERMINATE_IDS):
+            chunk = instance_ids[start:start + MAX_TERMINATE_IDS]
+            try:
+                await self._call(self.client.terminate_instances, InstanceIds=chunk)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'InvalidInstanceID.NotFound':
+                    print(f"Error terminating instances: {e}")
+                    raise e
+                # One unknown ID fails the whole call; retry with the ones AWS still has
+                known = [i for i in await self.describe_instances(chunk) if i in chunk]
+                if known:
+                    await self._call(self.client.terminate_instances, InstanceIds=known)
+            done.extend(chunk)
+        return done
+
     @staticmethod
     def generate_user_data(password: str) -> str:
         """
@@ -77,9 +304,21 @@ class AWSService:
         """
         script = f"""#!/bin/bash
 echo "root:{password}" | chpasswd
-sed -i 's/^PasswordAuthentication no/PasswordAuthentication yes/' /etc/ssh/sshd_config
-sed -i 's/^#PasswordAuthentication no/PasswordAuthentication yes/' /etc/ssh/sshd_config
-sed -i 's/^PermitRootLogin.*/PermitRootLogin yes/' /etc/ssh/sshd_config
-systemctl restart sshd
+{SSHD_PASSWORD_LOGIN}
+        """
+        return script
+
+    @staticmethod
+    def generate_batch_user_data(passwords: List[str]) -> str:
+        """
+        UserData for a multi-instance launch. Every instance gets the same
+        script, so it picks its own password by ami-launch-index (IMDSv2).
+        """
+        script = f"""#!/bin/bash
+PASSWORDS=({' '.join(passwords)})
+TOKEN=$(curl -s -X PUT "http://169.254.169.254/latest/api/token" -H "X-aws-ec2-metadata-token-ttl-seconds: 60")
+INDEX=$(curl -s -H "X-aws-ec2-metadata-token: $TOKEN" http://169.254.169.254/latest/meta-data/ami-launch-index)
+echo "root:${{PASSWORDS[$INDEX]}}" | chpasswd
+{SSHD_PASSWORD_LOGIN}
         """
         return script
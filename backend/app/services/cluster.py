@@ -0,0 +1,157 @@
+from ..db.crud import crud
+from ..core.config import settings
+from ..core.metrics import registry
+from .log_sink import system_log
+from .pipeline import WORKER_ID
+from typing import List, Optional
+import asyncio
+import functools
+import hashlib
+import os
+import socket
+import time
+
+LEADER_LEASE = "leader"
+
+CLUSTER_MEMBERS = registry.gauge("cluster_members", "Live backend workers as seen by this one")
+CLUSTER_IS_LEADER = registry.gauge("cluster_is_leader", "1 if this worker holds the leader lease")
+CLUSTER_HEARTBEAT_ERRORS = registry.counter("cluster_heartbeat_errors_total", "Failed heartbeat rounds")
+
+def _score(member: str, key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{member}|{key}".encode(), digest_size=8).digest(), "big")
+
+class Cluster:
+    """
+    Lets several backend processes share the scheduled monitor work.
+
+    Every worker heartbeats a document into `workers` and reads back the
+    live set. Work is split by rendezvous hashing of "account:region" over
+    that set, so a worker joining or leaving only moves its own share.
+    Sharded jobs add shard_filter() to their query, so each worker only
+    reads its own share from Mongo. One worker also holds the `leader`
+    lease and runs the jobs that must happen once cluster-wide.
+
+    Views converge within one heartbeat; a crashed worker's share is picked
+    up once its document expires (CLUSTER_WORKER_TTL_SECONDS). Until then a
+    group may be taken twice, or skipped, for a tick. The sharded jobs are
+    idempotent, so the worst case is an extra AWS call.
+    """
+    def __init__(self):
+        self.worker_id = WORKER_ID
+        self.members: List[str] = [WORKER_ID]
+        self.is_leader = False
+        self.last_heartbeat: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def owns(self, account_id: str, region: str) -> bool:
+        """
+        True if this worker is responsible for the account/region.
+        """
+        if not settings.CLUSTER_SHARDING_ENABLED or len(self.members) < 2:
+            return True
+        key = f"{account_id}:{region}"
+        return max(self.members, key=lambda member: _score(member, key)) == self.worker_id
+
+    async def shard_filter(self) -> Optional[dict]:
+        """
+        Extra instances-query conditions that keep only the records this
+        worker owns, or None when it owns everything. The leader also takes
+        records whose pair no account lists (a deleted account, a dropped
+        region), so they still get seen by someone.
+        """
+        if not settings.CLUSTER_SHARDING_ENABLED or len(self.members) < 2:
+            return None
+        pairs = await crud.list_account_regions()
+        clauses = [{"account_id": account_id, "region": region} for account_id, region in pairs
+                   if self.owns(account_id, region)]
+        if self.is_leader:
+            clauses.append({"$nor": [{"account_id": account_id, "region": region} for account_id, region in pairs]})
+        if not clauses:
+            # Matches nothing
+            return {"_id": {"$in": []}}
+        return {"$or": clauses}
+
+    def leader_only(self, fn):
+        """
+        Wraps a scheduler job so it only runs on the current leader.
+        """
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if self.is_leader:
+                return await fn(*args, **kwargs)
+        return wrapper
+
+    async def heartbeat(self):
+        """
+        One round: refresh our worker document, re-read the live set and
+        take or renew the leader lease.
+        """
+        ttl = settings.CLUSTER_WORKER_TTL_SECONDS
+        await crud.heartbeat_worker(self.worker_id, ttl, {"hostname": socket.gethostname(), "pid": os.getpid()})
+        members = await crud.list_live_workers()
+        if self.worker_id not in members:
+            members.append(self.worker_id)
+        members.sort()
+        if members != self.members:
+            system_log.info(f"Cluster membership changed: {len(members)} worker(s)", worker_id=self.worker_id)
+        self.members = members
+        was_leader = self.is_leader
+        self.is_leader = await crud.acquire_lease(LEADER_LEASE, self.worker_id, ttl)
+        if self.is_leader and not was_leader:
+            system_log.info(f"Worker {self.worker_id} is now the leader", worker_id=self.worker_id)
+        self.last_heartbeat = time.monotonic()
+        CLUSTER_MEMBERS.set(len(self.members))
+        CLUSTER_IS_LEADER.set(1 if self.is_leader else 0)
+
+    async def start(self):
+        # First round inline so the scheduler starts with a real view
+        try:
+            await self.heartbeat()
+        except Exception as e:
+            CLUSTER_HEARTBEAT_ERRORS.inc()
+            system_log.error(f"Cluster heartbeat failed: {e}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Leaves the cluster right away instead of waiting out the TTL, so
+        peers pick up our share (and the leader lease) on their next beat.
+        """
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await crud.remove_worker(self.worker_id)
+            if self.is_leader:
+                await crud.release_lease(LEADER_LEASE, self.worker_id)
+        except Exception as e:
+            system_log.error(f"Leaving the cluster failed: {e}")
+        self.is_leader = False
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.CLUSTER_HEARTBEAT_SECONDS)
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                CLUSTER_HEARTBEAT_ERRORS.inc()
+                system_log.error(f"Cluster heartbeat failed: {e}")
+                # Without a renewal the lease is gone after the TTL; stop
+                # acting as leader before a peer can take over
+                if self.last_heartbeat and time.monotonic() - self.last_heartbeat > settings.CLUSTER_WORKER_TTL_SECONDS / 2:
+                    self.is_leader = False
+                    CLUSTER_IS_LEADER.set(0)
+
+    async def stats(self) -> dict:
+        lease = await crud.get_lease(LEADER_LEASE)
+        return {
+            "worker_id": self.worker_id,
+            "members": self.members,
+            "is_leader": self.is_leader,
+            "leader": lease["owner"] if lease else None,
+            "sharding": settings.CLUSTER_SHARDING_ENABLED,
+            "last_heartbeat_age": round(time.monotonic() - self.last_heartbeat, 1) if self.last_heartbeat else None,
+        }
+
+cluster = Cluster()
@@ -0,0 +1,196 @@
+from ..db.crud import crud
+from ..db.models import DeployJob, JobStatus
+from ..core.config import settings
+from ..core.metrics import registry
+from .log_sink import system_log
+from .pipeline import WORKER_ID
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import time
+
+# Priority lanes: lower runs first
+PRIORITY_REPLENISH = 0
+PRIORITY_ORDER = 10
+
+JOB_SECONDS = registry.histogram(
+    "deploy_job_duration_seconds", "Deploy job run time, by kind and outcome", ["kind", "outcome"]
+)
+JOB_WAIT_SECONDS = registry.histogram(
+    "deploy_job_queue_seconds", "Time from enqueue (or retry) to a worker picking the job up", ["kind"]
+)
+
+class DeployQueue:
+    """
+    Durable deploy jobs in Mongo, drained by DEPLOY_WORKERS in-process
+    workers. Claims are atomic with a lease, so several processes can share
+    the queue; a job whose worker dies is requeued once its lease runs out.
+
+    Per-region caps are enforced within this process: a worker never claims
+    a job for a region that already has its limit of jobs running here.
+    """
+    def __init__(self):
+        self.handlers: Dict[str, Callable[[dict], Awaitable[dict]]] = {}
+        self._running: Dict[str, int] = defaultdict(int)
+        self._claim_lock: Optional[asyncio.Lock] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks = []
+        self._stopping = False
+        self.enqueued = 0
+        self.duplicates = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self.requeued = 0
+
+    def register_handler(self, kind: str, handler: Callable[[dict], Awaitable[dict]]):
+        """
+        handler(job) does the work and returns the job's result dict; raising
+        fails (or retries) the job.
+        """
+        self.handlers[kind] = handler
+
+    async def enqueue(self, kind: str, user_id: str, region: str, priority: int = PRIORITY_ORDER,
+                      idempotency_key: Optional[str] = None, payload: Optional[dict] = None,
+                      max_attempts: Optional[int] = None) -> Tuple[dict, bool]:
+        """
+        Returns (job doc, created). created is False when the idempotency key
+        matched an existing job, which is returned unchanged.
+        """
+        job, created = await crud.enqueue_deploy_job(DeployJob(
+            kind=kind,
+            user_id=user_id,
+            region=region,
+            priority=priority,
+            idempotency_key=idempotency_key,
+            payload=payload or {},
+            max_attempts=max_attempts or settings.DEPLOY_JOB_MAX_ATTEMPTS,
+        ))
+        if created:
+            self.enqueued += 1
+            if self._wake:
+                self._wake.set()
+        else:
+            self.duplicates += 1
+        return job, created
+
+    def start(self):
+        self._stopping = False
+        self._claim_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(settings.DEPLOY_WORKERS)]
+        self._tasks.append(asyncio.create_task(self._reaper()))
+
+    async def stop(self):
+        """
+        Stops claiming. Jobs cut off mid-run keep their lease and are picked
+        up again (by any process) once it expires.
+        """
+        # wait_for can swallow a cancel that races the wake event, so idle
+        # workers also check this flag
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _region_limit(self, region: str) -> int:
+        return settings.DEPLOY_REGION_CONCURRENCY_OVERRIDES.get(region, settings.DEPLOY_REGION_CONCURRENCY)
+
+    async def _claim(self) -> Optional[dict]:
+        # Serialized so two workers can't both take the last slot in a region
+        async with self._claim_lock:
+            full = [region for region, n in self._running.items() if n >= self._region_limit(region)]
+            job = await crud.claim_deploy_job(WORKER_ID, settings.DEPLOY_JOB_LEASE_SECONDS, full)
+            if job:
+                self._running[job["region"]] += 1
+            return job
+
+    async def _worker(self):
+        while not self._stopping:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                system_log.error(f"Deploy queue claim failed: {e}")
+                job = None
+            if not job:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), settings.DEPLOY_QUEUE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(job)
+            except Exception as e:
+                # Recording the outcome failed; the lease will requeue the job
+                system_log.error(f"Deploy job {job['_id']} could not be finalized: {e}", job_id=str(job["_id"]))
+            finally:
+                self._running[job["region"]] -= 1
+                # A region slot just opened up
+                self._wake.set()
+
+    async def _run(self, job: dict):
+        kind = job["kind"]
+        JOB_WAIT_SECONDS.observe((job["started_at"] - job["available_at"]).total_seconds(), kind=kind)
+        started = time.perf_counter()
+        try:
+            handler = self.handlers.get(kind)
+            if handler is None:
+                raise ValueError(f"No handler for deploy job kind {kind!r}")
+            result = await handler(job)
+        except Exception as e:
+            outcome = await self._failed(job, e)
+        else:
+            outcome = "succeeded"
+            self.succeeded += 1
+            await crud.finish_deploy_job(job["_id"], WORKER_ID, JobStatus.SUCCEEDED, result=result)
+        JOB_SECONDS.observe(time.perf_counter() - started, kind=kind, outcome=outcome)
+
+    async def _failed(self, job: dict, error: Exception) -> str:
+        kind = job["kind"]
+        if job["attempts"] < job["max_attempts"]:
+            self.retried += 1
+            delay = settings.DEPLOY_JOB_RETRY_SECONDS * 2 ** (job["attempts"] - 1)
+            await crud.retry_deploy_job(job["_id"], WORKER_ID, datetime.utcnow() + timedelta(seconds=delay), str(error))
+            system_log.warning(
+                f"Deploy job {job['_id']} ({kind}) failed on attempt {job['attempts']}, retrying in {delay}s: {error}",
+                job_id=str(job["_id"]), region=job["region"]
+            )
+            return "retried"
+        self.failed += 1
+        await crud.finish_deploy_job(job["_id"], WORKER_ID, JobStatus.FAILED, error=str(error))
+        system_log.error(
+            f"Deploy job {job['_id']} ({kind}) failed after {job['attempts']} attempt(s): {error}",
+            job_id=str(job["_id"]), region=job["region"]
+        )
+        return "failed"
+
+    async def _reaper(self):
+        while True:
+            await asyncio.sleep(max(settings.DEPLOY_JOB_LEASE_SECONDS / 4, 1))
+            try:
+                requeued = await crud.requeue_expired_deploy_jobs()
+            except Exception as e:
+                system_log.error(f"Deploy queue reaper failed: {e}")
+                continue
+            if requeued:
+                self.requeued += requeued
+                system_log.warning(f"Requeued {requeued} deploy job(s) with expired leases")
+                self._wake.set()
+
+    async def stats(self) -> dict:
+        return {
+            "workers": settings.DEPLOY_WORKERS,
+            "queued": await crud.count_deploy_jobs(JobStatus.QUEUED),
+            "running_here": {region: n for region, n in self._running.items() if n},
+            "enqueued": self.enqueued,
+            "duplicates": self.duplicates,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+            "requeued": self.requeued,
+        }
+
+deploy_queue = DeployQueue()
@@ -1,34 +1,67 @@
 from .account_manager import account_manager
 from .aws_service import AWSService
+from .monitor_service import poll_delay
+from .event_bus import event_bus
+from .deploy_queue import deploy_queue
+from .warm_pool import warm_pool
 from ..db.crud import crud
 from ..db.models import Instance, InstanceStatus, LogLevel, SystemLog
 from botocore.exceptions import ClientError
+from datetime import datetime
+import asyncio
+import functools
 import secrets
 import string
 
+# Hardcoded AMI and Type for demo. In production, these should be config/params.
+# AMI for Ubuntu 22.04 in us-east-1 (example)
+DEFAULT_AMI_ID = "ami-0c7217cdde317cfec"
+DEFAULT_INSTANCE_TYPE = "t2.micro"
+
 class DeploymentService:
+    async def run_order_job(self, job: dict) -> dict:
+        """
+        Deploy queue handler for customer orders.
+        """
+        return await self.deploy_instance(job["user_id"], job["region"])
+
     async def deploy_instance(self, user_id: str, region: str = "us-east-1"):
-        # 1. Get Account
-        account = await account_manager.get_available_account(region)
-        if not account:
+        # Warm pool hit: the machine is already up, with an IP and a password
+        # that was only ever in its own UserData (see deploy_batch's isolated)
+        warm = await warm_pool.take(user_id, region, DEFAULT_INSTANCE_TYPE)
+        if warm:
+            return {
+                "db_id": str(warm["_id"]),
+                "instance_id": warm["instance_id"],
+                "account_id": warm["account_id"],
+                "public_ip": warm["public_ip"],
+                "warm": True
+            }
+
+        # 1. Reserve a quota slot on an account (atomic, so parallel deploys can't overshoot)
+        reserved = await account_manager.reserve_account(region)
+        if not reserved:
             raise Exception("No available accounts found")
+        account, _ = reserved
 
         # 2. Prepare AWS Service
-        aws = AWSService(account.access_key, account.secret_key, region)
+        aws = AWSService(account.access_key, account.secret_key, region, str(account.id))
         
         # 3. Generate Password & UserData
         password = self._generate_password()
         user_data = aws.generate_user_data(password)
         
         # 4. Launch Instance
-        # Hardcoded AMI and Type for demo. In production, these should be config/params.
-        # AMI for Ubuntu 22.04 in us-east-1 (example)
-        ami_id = "ami-0c7217cdde317cfec" 
-        instance_type = "t2.micro"
+        ami_id = DEFAULT_AMI_ID
+        instance_type = DEFAULT_INSTANCE_TYPE
 
         try:
-            instance_aws_id = aws.run_instance(ami_id, instance_type, user_data)
-        except ClientError as e:
+            instance_aws_id = await aws.run_instance(ami_id, instance_type, user_data)
+        except Exception as e:
+            # Nothing launched, so give the slot back
+            await account_manager.release_account(str(account.id))
+            if not isinstance(e, ClientError):
+                raise e
             # Handle Auth Failure -> Mark Account Dead
             if e.response['Error']['Code'] == 'AuthFailure':
                 await account_manager.mark_account_dead(str(account.id), str(e))
@@ -43,13 +76,16 @@ class DeploymentService:
             account_id=str(account.id),
             region=region,
             user_id=user_id,
+            instance_type=instance_type,
             initial_password=password,
-            status=InstanceStatus.PENDING
+            status=InstanceStatus.PENDING,
+            next_check_at=datetime.utcnow() + poll_delay(0)
         )
         db_id = await crud.create_instance(instance_model)
-        
-        # 6. Decrement Quota
-        await crud.decrement_account_quota(str(account.id))
+        event_bus.publish_instance(
+            "instance.created", {"_id": db_id, **instance_model.model_dump(include={"instance_id", "user_id", "region"})},
+            status=InstanceStatus.PENDING.value
+        )
 
         return {
             "db_id": db_id,
@@ -57,6 +93,122 @@ class DeploymentService:
             "account_id": str(account.id)
         }
 
+    async def deploy_batch(self, user_id: str, count: int, region: str = "us-east-1",
+                           instance_type: str = DEFAULT_INSTANCE_TYPE, isolated: bool = False):
+        """
+        Launches `count` instances for one customer. The count is split across
+        eligible accounts by remaining quota and every slice is a single
+        RunInstances call, so 50 machines cost a handful of API calls.
+
+        A slice's instances share one UserData script holding all of their
+        passwords, readable from any of them. With `isolated` (for machines
+        that will go to different customers) every instance is launched on
+        its own with only its own password instead.
+        """
+        # 1. Reserve slices: drain the accounts with the most quota left first
+        slices = []
+        unallocated = count
+        while unallocated > 0:
+            reserved = await account_manager.reserve_account(region, unallocated, strategy="most_remaining")
+            if not reserved:
+                break
+            slices.append(reserved)
+            unallocated -= reserved[1]
+
+        # 2. Launch all slices concurrently (one RunInstances each)
+        results = await asyncio.gather(
+            *(self._launch_slice(account, take, region, instance_type, user_id, isolated) for account, take in slices)
+        )
+
+        # 3. Record everything with one insert_many; hand back reserved slots
+        # that RunInstances didn't fill in one more update per short account
+        instances = [inst for _, slice_instances in results for inst in slice_instances]
+        db_ids = await crud.create_instances(instances)
+        for db_id, inst in zip(db_ids, instances):
+            event_bus.publish_instance(
+                "instance.created", {"_id": db_id, **inst.model_dump(include={"instance_id", "user_id", "region"})},
+                status=InstanceStatus.PENDING.value
+            )
+        await crud.adjust_account_quotas({
+            report["account_id"]: report["requested"] - report["launched"] for report, _ in results
+        })
+
+        offset = 0
+        for report, slice_instances in results:
+            report["db_ids"] = db_ids[offset:offset + len(slice_instances)]
+            offset += len(slice_instances)
+
+        launched = len(instances)
+        return {
+            "requested": count,
+            "launched": launched,
+            "unallocated": unallocated,
+            "status": "success" if launched == count else ("partial" if launched else "failed"),
+            "accounts": [report for report, _ in results],
+        }
+
+    async def _launch_slice(self, account, count: int, region: str, instance_type: str, user_id: str,
+                            isolated: bool = False):
+        report = {
+            "account_id": str(account.id),
+            "requested": count,
+            "launched": 0,
+            "instance_ids": [],
+            "error": None,
+        }
+        aws = AWSService(account.access_key, account.secret_key, region, str(account.id))
+
+        try:
+            if isolated:
+                launched = await self._run_isolated(aws, instance_type, count)
+            else:
+                passwords = [self._generate_password() for _ in range(count)]
+                items = await aws.run_instances(
+                    DEFAULT_AMI_ID, instance_type, aws.generate_batch_user_data(passwords), count
+                )
+                launched = [(item["instance_id"], passwords[item["launch_index"]]) for item in items]
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'AuthFailure':
+                await account_manager.mark_account_dead(str(account.id), str(e))
+            report["error"] = str(e)
+            return report, []
+        except Exception as e:
+            report["error"] = str(e)
+            return report, []
+
+        instances = [
+            Instance(
+                instance_id=instance_id,
+                account_id=str(account.id),
+                region=region,
+                user_id=user_id,
+                instance_type=instance_type,
+                initial_password=password,
+                status=InstanceStatus.PENDING,
+                next_check_at=datetime.utcnow() + poll_delay(0)
+            )
+            for instance_id, password in launched
+        ]
+        report["launched"] = len(instances)
+        report["instance_ids"] = [inst.instance_id for inst in instances]
+        return report, instances
+
+    async def _run_isolated(self, aws: AWSService, instance_type: str, count: int):
+        """
+        One RunInstances per instance, each with a UserData script holding
+        only its own password. Returns [(instance_id, password)] for the ones
+        that launched; raises only if none did.
+        """
+        passwords = [self._generate_password() for _ in range(count)]
+        results = await asyncio.gather(
+            *(aws.run_instance(DEFAULT_AMI_ID, instance_type, aws.generate_user_data(p)) for p in passwords),
+            return_exceptions=True
+        )
+        launched = [(r, p) for r, p in zip(results, passwords) if not isinstance(r, BaseException)]
+        if not launched:
+            raise next(r for r in results if isinstance(r, BaseException))
+        return launched
+
     async def check_and_update_status(self, instance_db_id: str):
         # Retrieve from DB to get Account credentials
         # This is a bit complex because we need the account credentials again.
@@ -69,3 +221,6 @@ class DeploymentService:
         return ''.join(secrets.choice(alphabet) for i in range(length))
 
 deployment_service = DeploymentService()
+deploy_queue.register_handler("order", deployment_service.run_order_job)
+# Pool instances go to different customers, so never share a UserData script
+warm_pool.set_launcher(functools.partial(deployment_service.deploy_batch, isolated=True))
@@ -0,0 +1,75 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Set
+import asyncio
+from ..core.config import settings
+
+class Subscription:
+    def __init__(self, user_id: Optional[str], maxsize: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        # Set when the subscriber fell too far behind and was cut off
+        self.dropped = False
+
+class EventBus:
+    """
+    In-process pub/sub for instance state transitions. Publishing never
+    blocks: every subscriber has a bounded queue, and one that is full is
+    dropped (and told so) rather than slowing the monitor down.
+    """
+    def __init__(self):
+        self._subscribers: Dict[Optional[str], Set[Subscription]] = defaultdict(set)
+        self.published = 0
+        self.delivered = 0
+        self.dropped_subscribers = 0
+
+    def subscribe(self, user_id: Optional[str] = None) -> Subscription:
+        """
+        Subscribe to one user's events, or to everything with user_id=None.
+        """
+        sub = Subscription(user_id, settings.EVENT_STREAM_QUEUE_SIZE)
+        self._subscribers[user_id].add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        subs = self._subscribers.get(sub.user_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._subscribers[sub.user_id]
+
+    def publish(self, event: dict):
+        self.published += 1
+        targets = list(self._subscribers.get(event.get("user_id"), ())) + list(self._subscribers.get(None, ()))
+        for sub in targets:
+            try:
+                sub.queue.put_nowait(event)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                sub.dropped = True
+                self.dropped_subscribers += 1
+                self.unsubscribe(sub)
+
+    def publish_instance(self, event_type: str, doc: dict, **extra):
+        """
+        Publishes a transition for an instance document (or projection of one).
+        """
+        self.publish({
+            "type": event_type,
+            "db_id": str(doc.get("_id", "")),
+            "instance_id": doc.get("instance_id"),
+            "user_id": doc.get("user_id"),
+            "region": doc.get("region"),
+            "timestamp": datetime.utcnow(),
+            **extra,
+        })
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": sum(len(subs) for subs in self._subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped_subscribers": self.dropped_subscribers,
+        }
+
+event_bus = EventBus()
@@ -0,0 +1,99 @@
+from ..db.crud import crud
+from ..db.models import InstanceStatus, LIVE_STATUSES
+from ..db.mongodb import db
+from ..core.config import settings
+from .aws_service import AWSService, MAX_TERMINATE_IDS
+from .cluster import cluster
+from .event_bus import event_bus
+from .log_sink import system_log
+from .pipeline import group_by_account_region, guarded_job, run_pipeline
+from datetime import datetime, timedelta
+
+class ExpiryService:
+    """
+    Phase 5.3: terminates instances once expire_at has passed and gives the
+    quota back. Runs every few seconds off the (status, expire_at) index, so
+    even thousands of expiries in the same minute are handled in a few
+    TerminateInstances calls. Each worker expires only the account/regions
+    it owns. Records that can't be terminated (missing or dead account,
+    EC2 errors) are retried with a per-record backoff instead of every tick.
+    """
+    def __init__(self):
+        self.job_stats = {}
+        self._accounts = {}
+
+    @guarded_job("expire_instances")
+    async def expire_instances(self):
+        stats = self.job_stats["expire_instances"]
+        stats.details = {"terminated": 0, "quota_released": 0}
+        stats.last_processed = 0
+
+        now = datetime.utcnow()
+        due = {
+            "status": {"$in": LIVE_STATUSES},
+            "expire_at": {"$lte": now},
+            # $not/$gt also matches missing or null fields
+            "metadata.expiry_retry_at": {"$not": {"$gt": now}},
+        }
+        due.update(await cluster.shard_filter() or {})
+        stats.last_backlog = await db.db.instances.count_documents(due)
+        if not stats.last_backlog:
+            return
+        self._accounts = await crud.get_accounts_for_instances(due)
+
+        cursor = db.db.instances.find(
+            due, {"_id": 1, "instance_id": 1, "account_id": 1, "region": 1, "user_id": 1, "metadata.expiry_attempts": 1}
+        ).sort("expire_at", 1)
+        result = await run_pipeline(
+            group_by_account_region(cursor, MAX_TERMINATE_IDS),
+            self._expire_group,
+            concurrency=settings.EXPIRY_CONCURRENCY
+        )
+        stats.last_processed = result["processed"]
+
+    async def _expire_group(self, group):
+        """
+        One TerminateInstances for the group, then one bulk_write for the
+        records and one quota update for the account.
+        """
+        (account_id, region), docs = group
+        if account_id not in self._accounts:
+            # Expired after the tick's prefetch
+            self._accounts[account_id] = (await crud.get_accounts_by_ids([account_id])).get(account_id)
+        account = self._accounts[account_id]
+        if not account:
+            system_log.warning(f"Account {account_id} not found for {len(docs)} expired instance(s)", account_id=account_id)
+            await crud.bulk_update_instances([self._defer(d) for d in docs])
+            return
+
+        aws = AWSService(account.access_key, account.secret_key, region, str(account.id))
+        try:
+            terminated = set(await aws.terminate_instances([d["instance_id"] for d in docs]))
+        except Exception:
+            # Back off these too, or a dead account fails on every tick
+            await crud.bulk_update_instances([self._defer(d) for d in docs])
+            raise
+
+        expired_docs = [d for d in docs if d["instance_id"] in terminated]
+        expired = await crud.mark_instances_expired([d["_id"] for d in expired_docs])
+        await crud.adjust_account_quotas({account_id: expired})
+        for doc in expired_docs:
+            event_bus.publish_instance("instance.expired", doc, status=InstanceStatus.TERMINATED.value)
+
+        details = self.job_stats["expire_instances"].details
+        details["terminated"] += len(terminated)
+        details["quota_released"] += expired
+        system_log.info(f"Expired {expired} instance(s) on account {account_id} in {region}", account_id=account_id, region=region)
+
+    def _defer(self, doc) -> tuple:
+        attempts = (doc.get("metadata") or {}).get("expiry_attempts", 0) + 1
+        delay = min(settings.EXPIRY_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.EXPIRY_RETRY_MAX_SECONDS)
+        return (doc["_id"], {
+            "$set": {"metadata.expiry_retry_at": datetime.utcnow() + timedelta(seconds=delay)},
+            "$inc": {"metadata.expiry_attempts": 1}
+        })
+
+    def stats(self) -> dict:
+        return {name: s.to_dict() for name, s in self.job_stats.items()}
+
+expiry_service = ExpiryService()
@@ -0,0 +1,96 @@
+from collections import deque
+from typing import Optional
+import asyncio
+from ..core.config import settings
+from ..db.crud import crud
+from ..db.models import LogLevel, SystemLog
+
+class LogSink:
+    """
+    Buffered writer for the logs collection. Emitting never awaits Mongo:
+    records go into a bounded in-memory buffer that a background task
+    flushes with insert_many once LOG_BATCH_SIZE records are waiting or
+    every LOG_FLUSH_INTERVAL_SECONDS. When the buffer is full new records
+    are dropped and counted, so a slow database can't back up callers.
+    """
+    def __init__(self):
+        self._buffer: deque = deque()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.emitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.flush_errors = 0
+
+    def log(self, level: LogLevel, message: str, **metadata):
+        # Still goes to stdout, like every other message in the backend
+        print(message)
+        if len(self._buffer) >= settings.LOG_QUEUE_SIZE:
+            self.dropped += 1
+            return
+        self._buffer.append(SystemLog(level=level, message=message, metadata=metadata or None))
+        self.emitted += 1
+        if self._wake and len(self._buffer) >= settings.LOG_BATCH_SIZE:
+            self._wake.set()
+
+    def info(self, message: str, **metadata):
+        self.log(LogLevel.INFO, message, **metadata)
+
+    def warning(self, message: str, **metadata):
+        self.log(LogLevel.WARNING, message, **metadata)
+
+    def error(self, message: str, **metadata):
+        self.log(LogLevel.ERROR, message, **metadata)
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the flusher and writes whatever is still buffered.
+        """
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), settings.LOG_FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(len(self._buffer), settings.LOG_BATCH_SIZE))]
+            try:
+                await crud.insert_logs(batch)
+                self.written += len(batch)
+                self.batches += 1
+            except Exception as e:
+                # Don't retry: a broken database would otherwise pin the buffer full
+                self.flush_errors += 1
+                self.dropped += len(batch)
+                print(f"Failed to write {len(batch)} log record(s): {e}")
+                return
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "emitted": self.emitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "flush_errors": self.flush_errors,
+        }
+
+system_log = LogSink()
@@ -1,85 +1,333 @@
 from ..db.crud import crud
-from ..db.models import InstanceStatus
-from .aws_service import AWSService
+from ..db.models import AccountStatus, InstanceStatus, EC2_STATE_MAP, LIVE_STATUSES
+from ..core.config import settings
+from .aws_service import AWSService, MAX_DESCRIBE_IDS
 from .account_manager import account_manager
+from .event_bus import event_bus
+from .log_sink import system_log
+from .deploy_queue import deploy_queue, PRIORITY_REPLENISH
+from .cluster import cluster
+from .pipeline import WORKER_ID, group_by_account_region, guarded_job, run_pipeline
 from ..db.mongodb import db
 import asyncio
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta
+
+PENDING_PROJECTION = {"_id": 1, "instance_id": 1, "account_id": 1, "region": 1, "user_id": 1, "check_attempts": 1}
+
+def poll_delay(attempts: int) -> timedelta:
+    """
+    How long to wait before checking a PENDING instance again after
+    `attempts` checks: the fixed schedule first, then doubling up to the cap.
+    """
+    schedule = settings.POLL_SCHEDULE_SECONDS
+    if attempts < len(schedule):
+        seconds = schedule[attempts]
+    else:
+        seconds = schedule[-1] * 2 ** (attempts - len(schedule) + 1)
+    return timedelta(seconds=min(seconds, settings.POLL_MAX_INTERVAL_SECONDS))
 
 class MonitorService:
+    def __init__(self):
+        self.job_stats = {}
+        self.replace_times = {}
+        self._accounts = {}
+
+    @guarded_job("check_pending_instances")
     async def check_pending_instances(self):
         """
         Polls PENDING instances and updates their status if IP is assigned.
+        Only instances whose next_check_at is due are read, most overdue first.
+        They stream off the cursor in (account, region) groups; each group
+        costs one batched DescribeInstances and one bulk_write. With several
+        workers, each only checks the groups it owns.
+        """
+        stats = self.job_stats["check_pending_instances"]
+        due = {"status": InstanceStatus.PENDING, "next_check_at": {"$lte": datetime.utcnow()}}
+        due.update(await cluster.shard_filter() or {})
+        stats.last_backlog = await db.db.instances.count_documents(due)
+        # Every account the tick will need, in one $in query
+        self._accounts = await crud.get_accounts_for_instances(due)
+
+        cursor = db.db.instances.find(due, PENDING_PROJECTION).sort("next_check_at", 1)
+        result = await run_pipeline(
+            group_by_account_region(cursor, MAX_DESCRIBE_IDS),
+            self._check_group,
+            concurrency=settings.MONITOR_CONCURRENCY,
+            budget_seconds=settings.MONITOR_TICK_BUDGET_SECONDS
+        )
+        stats.last_processed = result["processed"]
+        if result["budget_exhausted"]:
+            stats.budget_exhausted += 1
+
+    async def _get_account(self, account_id: str):
+        # Prefetched at the start of the tick; only a record that came due
+        # after that needs its own lookup
+        if account_id not in self._accounts:
+            accounts = await crud.get_accounts_by_ids([account_id])
+            self._accounts[account_id] = accounts.get(account_id)
+        return self._accounts[account_id]
+
+    async def _check_group(self, group):
+        (account_id, region), docs = group
+        account = await self._get_account(account_id)
+        if not account:
+            system_log.warning(f"Account {account_id} not found for {len(docs)} pending instance(s)", account_id=account_id)
+            # Back these off like a failing account, or they are due (and
+            # logged) again on every tick
+            await crud.bulk_update_instances([self._reschedule(d) for d in docs])
+            return
+
+        aws = AWSService(account.access_key, account.secret_key, region, str(account.id))
+        try:
+            infos = await aws.describe_instances([d["instance_id"] for d in docs])
+        except Exception:
+            # Back off these too, or a failing account gets hit every tick
+            await crud.bulk_update_instances([self._reschedule(d) for d in docs])
+            raise
+
+        updates = []
+        transitions = []
+        for inst_doc in docs:
+            info = infos.get(inst_doc["instance_id"], {})
+            state = info.get("state")
+            public_ip = info.get("public_ip")
+
+            if state == "running" and public_ip:
+                system_log.info(
+                    f"Instance {inst_doc['instance_id']} is running with IP {public_ip}",
+                    account_id=account_id, instance_id=inst_doc["instance_id"]
+                )
+                updates.append((inst_doc["_id"], {"$set": {"public_ip": public_ip, "status": InstanceStatus.RUNNING}}))
+                transitions.append((inst_doc, InstanceStatus.RUNNING, public_ip))
+            elif state == "terminated":
+                updates.append((inst_doc["_id"], {"$set": {
+                    "public_ip": None,
+                    "status": InstanceStatus.TERMINATED,
+                    "terminated_at": datetime.utcnow()
+                }}))
+                transitions.append((inst_doc, InstanceStatus.TERMINATED, None))
+            else:
+                updates.append(self._reschedule(inst_doc))
+
+        await crud.bulk_update_instances(updates)
+        self._publish_transitions(transitions)
+
+    def _publish_transitions(self, transitions):
+        for inst_doc, status, public_ip in transitions:
+            event_bus.publish_instance(f"instance.{status.value}", inst_doc, status=status.value, public_ip=public_ip)
+
+    def _reschedule(self, inst_doc) -> tuple:
+        attempts = inst_doc.get("check_attempts", 0) + 1
+        return (inst_doc["_id"], {
+            "$set": {"next_check_at": datetime.utcnow() + poll_delay(attempts)},
+            "$inc": {"check_attempts": 1}
+        })
+
+    async def backfill_poll_schedule(self):
+        """
+        PENDING records written before adaptive polling have no next_check_at
+        and would never come due; make them due now.
+        """
+        await db.db.instances.update_many(
+            {"status": InstanceStatus.PENDING, "next_check_at": None},
+            {"$set": {"next_check_at": datetime.utcnow(), "check_attempts": 0}}
+        )
+
+    @guarded_job("reconcile")
+    async def reconcile(self):
+        """
+        Phase 3.1: compare what the DB expects with what AWS actually runs.
+        Catches RUNNING instances that AWS killed (the pending poller never
+        looks at them again) as well as state and IP drift. Sharded across
+        workers like the pending checks.
+        """
+        stats = self.job_stats["reconcile"]
+        stats.details = {"corrected": 0, "missing": 0, "untracked": 0}
+
+        result = await run_pipeline(
+            self._account_regions(),
+            self._reconcile_account_region,
+            concurrency=settings.RECONCILE_CONCURRENCY
+        )
+        stats.last_processed = result["processed"]
+        stats.last_backlog = result["processed"] + result["failed"]
+
+    async def _account_regions(self):
+        cursor = db.db.accounts.find({"status": AccountStatus.ACTIVE})
+        async for acc_doc in cursor:
+            for region in acc_doc.get("regions", []):
+                if cluster.owns(str(acc_doc["_id"]), region):
+                    yield acc_doc, region
+
+    async def _reconcile_account_region(self, pair):
+        """
+        One paginated DescribeInstances for the whole account/region, diffed
+        in memory against the DB's live records, with every correction sent
+        in one bulk_write.
         """
-        cursor = db.db.instances.find({"status": InstanceStatus.PENDING})
-        pending_instances = await cursor.to_list(length=100)
-
-        for inst_doc in pending_instances:
-            inst_id = inst_doc["_id"]
-            aws_inst_id = inst_doc["instance_id"]
-            account_id = inst_doc["account_id"]
-            region = inst_doc["region"]
-
-            account = await crud.get_account_by_id(account_id)
-            if not account:
-                print(f"Account {account_id} not found for instance {aws_inst_id}")
+        acc_doc, region = pair
+        details = self.job_stats["reconcile"].details
+        aws = AWSService(acc_doc["access_key"], acc_doc["secret_key"], region, str(acc_doc["_id"]))
+        inventory = await aws.describe_inventory(managed_only=settings.RECONCILE_TAGGED_ONLY)
+
+        cursor = db.db.instances.find(
+            {"account_id": str(acc_doc["_id"]), "region": region, "status": {"$in": LIVE_STATUSES}},
+            {"_id": 1, "instance_id": 1, "user_id": 1, "region": 1, "status": 1, "public_ip": 1, "launch_time": 1}
+        )
+        live = {doc["instance_id"]: doc async for doc in cursor}
+
+        updates = []
+        transitions = []
+        for instance_id in live.keys() & inventory.keys():
+            doc, info = live[instance_id], inventory[instance_id]
+            status = EC2_STATE_MAP.get(info["state"])
+            public_ip = info.get("public_ip")
+            if status is None or (status == InstanceStatus.RUNNING and not public_ip):
+                # No IP yet: the pending poller owns this one
                 continue
+            if status == InstanceStatus.TERMINATED:
+                public_ip = None
+            if status != doc["status"] or public_ip != doc.get("public_ip"):
+                changes = {"status": status, "public_ip": public_ip}
+                if status == InstanceStatus.TERMINATED:
+                    changes["terminated_at"] = datetime.utcnow()
+                updates.append((doc["_id"], {"$set": changes}))
+                transitions.append((doc, status, public_ip))
+
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.RECONCILE_GRACE_SECONDS)
+        missing = [
+            live[instance_id] for instance_id in live.keys() - inventory.keys()
+            if live[instance_id]["launch_time"] < cutoff
+        ]
+        for doc in missing:
+            system_log.warning(
+                f"Instance {doc['instance_id']} is gone from AWS, marking TERMINATED",
+                account_id=str(acc_doc["_id"]), instance_id=doc["instance_id"]
+            )
+            updates.append((doc["_id"], {"$set": {
+                "status": InstanceStatus.TERMINATED,
+                "public_ip": None,
+                "terminated_at": datetime.utcnow(),
+                "metadata.missing_in_aws": True
+            }}))
+            transitions.append((doc, InstanceStatus.TERMINATED, None))
 
-            try:
-                aws = AWSService(account.access_key, account.secret_key, region)
-                info = aws.get_instance_info(aws_inst_id)
-                
-                state = info.get("state")
-                public_ip = info.get("public_ip")
-                
-                if state == "running" and public_ip:
-                    print(f"Instance {aws_inst_id} is running with IP {public_ip}")
-                    await crud.update_instance_info(inst_id, public_ip, InstanceStatus.RUNNING)
-                elif state == "terminated":
-                     await crud.update_instance_info(inst_id, None, InstanceStatus.TERMINATED)
-            except Exception as e:
-                print(f"Error checking instance {aws_inst_id}: {e}")
+        await crud.bulk_update_instances(updates)
+        self._publish_transitions(transitions)
+        details["corrected"] += len(updates) - len(missing)
+        details["missing"] += len(missing)
+        details["untracked"] += len(inventory.keys() - live.keys())
 
+    @guarded_job("auto_replenish")
     async def auto_replenish(self):
         """
         Phase 3.1: Check for instances that should be running but are terminated.
+        Each candidate is claimed atomically (with a lease) and handed to the
+        deploy queue in the replenishment lane, ahead of new orders. The claim
+        attempt is part of the idempotency key, so a tick that overlaps a
+        still-queued replacement can't enqueue it twice.
         """
-        from .deployment_service import deployment_service
-        
-        # Find instances that are TERMINATED but have future expire_at (valid subscription)
-        # and haven't been replenished yet.
-        cursor = db.db.instances.find({
+        stats = self.job_stats["auto_replenish"]
+
+        # TERMINATED but with future expire_at (valid subscription) and not replenished yet
+        stats.last_backlog = await db.db.instances.count_documents({
             "status": InstanceStatus.TERMINATED,
             "expire_at": {"$gt": datetime.utcnow()},
             "metadata.replenished": {"$ne": True}
         })
-        dead_instances = await cursor.to_list(length=100)
-
-        for inst in dead_instances:
-            print(f"Replenishing instance {inst['instance_id']}")
-            try:
-                user_id = inst['user_id']
-                region = inst['region']
-                original_expire_at = inst['expire_at']
-                
-                # Deploy new instance
-                result = await deployment_service.deploy_instance(user_id, region)
-                new_db_id = result['db_id']
-                
-                # Update new instance with original expiration
-                await db.db.instances.update_one(
-                    {"_id": ObjectId(new_db_id)},
-                    {"$set": {"expire_at": original_expire_at}}
-                )
-                
-                # Mark old instance as replenished
-                await db.db.instances.update_one(
-                    {"_id": inst["_id"]},
-                    {"$set": {"metadata.replenished": True, "metadata.replaced_by": new_db_id}}
-                )
-                
-            except Exception as e:
-                print(f"Failed to replenish {inst['instance_id']}: {e}")
+
+        result = await run_pipeline(
+            self._claim_replenish_candidates(),
+            self._enqueue_replenish,
+            concurrency=settings.REPLENISH_CONCURRENCY,
+            budget_seconds=settings.REPLENISH_TICK_BUDGET_SECONDS
+        )
+        stats.last_processed = result["processed"]
+        if result["budget_exhausted"]:
+            stats.budget_exhausted += 1
+
+    async def _claim_replenish_candidates(self):
+        # Claims are taken lazily: the bounded pipeline queue means we never
+        # hold many more leases than we have enqueues in flight.
+        while True:
+            inst = await crud.claim_replenish_candidate(WORKER_ID, settings.REPLENISH_LEASE_SECONDS)
+            if not inst:
+                return
+            yield inst
+
+    async def _enqueue_replenish(self, inst):
+        attempt = inst["metadata"]["replenish_attempts"]
+        await deploy_queue.enqueue(
+            "replenish", inst["user_id"], inst["region"],
+            priority=PRIORITY_REPLENISH,
+            idempotency_key=f"replenish:{inst['_id']}:{attempt}",
+            payload={"old_id": str(inst["_id"]), "attempt": attempt},
+            # Retries go through the claim backoff below, not the queue's
+            max_attempts=1
+        )
+
+    async def run_replenish_job(self, job: dict) -> dict:
+        """
+        Deploy queue handler: replaces one claimed instance.
+        """
+        from .deployment_service import deployment_service
+
+        old_id, attempt = job["payload"]["old_id"], job["payload"]["attempt"]
+        inst = await db.db.instances.find_one({"_id": ObjectId(old_id)})
+        metadata = (inst or {}).get("metadata") or {}
+        if not inst or metadata.get("replenished") or metadata.get("replenish_attempts") != attempt:
+            # Already replaced, or re-claimed after our lease ran out
+            return {"skipped": True, "replaces": old_id}
+
+        system_log.info(f"Replenishing instance {inst['instance_id']}", account_id=inst["account_id"], instance_id=inst["instance_id"])
+        try:
+            # Deploy new instance
+            result = await deployment_service.deploy_instance(inst['user_id'], inst['region'])
+            await crud.complete_replenish(inst["_id"], result['db_id'], inst['expire_at'])
+            event_bus.publish_instance(
+                "instance.replaced", inst,
+                replaced_by=result['db_id'], new_instance_id=result['instance_id']
+            )
+        except Exception as e:
+            backoff = min(
+                settings.REPLENISH_RETRY_BASE_SECONDS * 2 ** (attempt - 1),
+                settings.REPLENISH_RETRY_MAX_SECONDS
+            )
+            system_log.warning(
+                f"Failed to replenish {inst['instance_id']} (attempt {attempt}), retrying in {backoff}s: {e}",
+                account_id=inst["account_id"], instance_id=inst["instance_id"]
+            )
+            await crud.release_replenish_claim(inst["_id"], datetime.utcnow() + timedelta(seconds=backoff), str(e))
+            raise e
+
+        self._record_time_to_replace(inst)
+        return {**result, "replaces": old_id}
+
+    def _record_time_to_replace(self, inst):
+        # Measured from when we noticed the termination (launch time for old records)
+        started = inst.get("terminated_at") or inst.get("launch_time")
+        if not started:
+            return
+        seconds = (datetime.utcnow() - started).total_seconds()
+        region = self.replace_times.setdefault(inst["region"], {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0})
+        region["count"] += 1
+        region["total"] += seconds
+        region["max"] = max(region["max"], seconds)
+        region["last"] = seconds
+
+    def stats(self) -> dict:
+        stats = {name: s.to_dict() for name, s in self.job_stats.items()}
+        stats["time_to_replace"] = {
+            region: {
+                "count": r["count"],
+                "avg_seconds": round(r["total"] / r["count"], 1),
+                "max_seconds": round(r["max"], 1),
+                "last_seconds": round(r["last"], 1),
+            }
+            for region, r in self.replace_times.items()
+        }
+        return stats
 
 monitor_service = MonitorService()
+deploy_queue.register_handler("replenish", monitor_service.run_replenish_job)
@@ -0,0 +1,163 @@
+import asyncio
+from collections import defaultdict
+import functools
+import os
+import socket
+import time
+import uuid
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+from .log_sink import system_log
+from ..core.metrics import registry
+
+# Identifies this process as the owner of claims and leases
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+JOB_SECONDS = registry.histogram(
+    "scheduler_job_duration_seconds", "Scheduler tick duration", ["job"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+)
+JOB_OVERLAPS = registry.counter(
+    "scheduler_job_overlaps_total", "Ticks skipped because the previous run was still going", ["job"]
+)
+JOB_ERRORS = registry.counter("scheduler_job_errors_total", "Ticks that raised", ["job"])
+JOB_BACKLOG = registry.gauge("scheduler_job_backlog", "Work waiting at the start of the last tick", ["job"])
+JOB_RUNNING = registry.gauge("scheduler_job_running", "1 while a tick is in progress", ["job"])
+
+class JobStats:
+    """
+    Per-job counters for the scheduler: how long ticks take, how much work
+    was waiting, and how often a tick was skipped because the last one was
+    still running.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.running = False
+        self.runs = 0
+        self.skipped = 0
+        self.errors = 0
+        self.budget_exhausted = 0
+        self.last_started_at: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.max_duration = 0.0
+        self.last_backlog: Optional[int] = None
+        self.last_processed = 0
+        # Job-specific counters for the last run
+        self.details: Dict[str, object] = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "running": self.running,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "budget_exhausted": self.budget_exhausted,
+            "last_duration": round(self.last_duration, 3) if self.last_duration is not None else None,
+            "max_duration": round(self.max_duration, 3),
+            "backlog": self.last_backlog,
+            "last_processed": self.last_processed,
+            **self.details,
+        }
+
+def guarded_job(name: str):
+    """
+    Decorator for scheduler coroutines on a service that has a `job_stats`
+    dict. A tick that fires while the previous one is still running is
+    skipped (and counted) instead of overlapping it.
+    """
+    def decorator(fn: Callable[..., Awaitable]):
+        @functools.wraps(fn)
+        async def wrapper(self, *args, **kwargs):
+            stats = self.job_stats.setdefault(name, JobStats(name))
+            if stats.running:
+                stats.skipped += 1
+                JOB_OVERLAPS.inc(job=name)
+                system_log.warning(f"Skipping {name}: previous run still in progress", job=name)
+                return
+            stats.running = True
+            JOB_RUNNING.set(1, job=name)
+            stats.last_started_at = time.monotonic()
+            try:
+                return await fn(self, *args, **kwargs)
+            except Exception as e:
+                stats.errors += 1
+                JOB_ERRORS.inc(job=name)
+                system_log.error(f"Job {name} failed: {e}", job=name)
+            finally:
+                stats.running = False
+                stats.runs += 1
+                stats.last_duration = time.monotonic() - stats.last_started_at
+                stats.max_duration = max(stats.max_duration, stats.last_duration)
+                JOB_RUNNING.set(0, job=name)
+                JOB_SECONDS.observe(stats.last_duration, job=name)
+                if stats.last_backlog is not None:
+                    JOB_BACKLOG.set(stats.last_backlog, job=name)
+        return wrapper
+    return decorator
+
+async def run_pipeline(source: AsyncIterator, worker: Callable[[object], Awaitable],
+                       concurrency: int, budget_seconds: Optional[float] = None) -> Dict[str, object]:
+    """
+    Streams items from `source` into at most `concurrency` concurrent workers.
+
+    The hand-off queue is bounded, so a slow AWS call stalls the producer
+    (and therefore the Mongo cursor) instead of buffering the whole backlog.
+    Once the time budget is spent no new items are pulled; in-flight work
+    still finishes, and whatever is left waits for the next tick. The budget
+    is checked before each pull, never after, because pulling can claim the
+    item (auto_replenish leases it) and a pulled item must not be dropped.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+    deadline = time.monotonic() + budget_seconds if budget_seconds else None
+    result = {"processed": 0, "failed": 0, "budget_exhausted": False}
+
+    async def consume():
+        while True:
+            item = await queue.get()
+            try:
+                if item is _DONE:
+                    return
+                await worker(item)
+                result["processed"] += 1
+            except Exception as e:
+                result["failed"] += 1
+                system_log.error(f"Pipeline worker error: {e}")
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(consume()) for _ in range(concurrency)]
+    items = source.__aiter__()
+    try:
+        while True:
+            if deadline and time.monotonic() > deadline:
+                result["budget_exhausted"] = True
+                break
+            try:
+                item = await items.__anext__()
+            except StopAsyncIteration:
+                break
+            await queue.put(item)
+    finally:
+        for _ in workers:
+            await queue.put(_DONE)
+        await asyncio.gather(*workers)
+        aclose = getattr(source, "aclose", None)
+        if aclose:
+            await aclose()
+    return result
+
+_DONE = object()
+
+async def group_by_account_region(cursor, max_size: int):
+    """
+    Yields ((account_id, region), docs) batches of up to max_size as the
+    cursor is read, so a full group goes out without waiting for the rest
+    of the backlog.
+    """
+    groups = defaultdict(list)
+    async for doc in cursor:
+        key = (doc["account_id"], doc["region"])
+        groups[key].append(doc)
+        if len(groups[key]) >= max_size:
+            yield key, groups.pop(key)
+    for key, docs in groups.items():
+        yield key, docs
@@ -0,0 +1,226 @@
+from ..core.config import settings
+from ..core.metrics import error_code, registry
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import random
+import time
+
+# Error codes EC2 uses when it sheds load
+THROTTLE_CODES = {"RequestLimitExceeded", "Throttling", "ThrottlingException", "RequestThrottled"}
+# Server-side failures worth another try
+TRANSIENT_CODES = {"InternalError", "InternalFailure", "ServiceUnavailable", "Unavailable"}
+
+# EC2 throttles mutating calls separately from (and much harder than) reads
+OPERATION_CATEGORIES = {"run_instances": "mutating", "terminate_instances": "mutating"}
+DEFAULT_CATEGORY = "describe"
+
+# Circuit states, as exported in aws_circuit_state
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+STATE_NAMES = {CLOSED: "closed", HALF_OPEN: "half_open", OPEN: "open"}
+
+AWS_RATE = registry.gauge(
+    "aws_rate_limit_per_second", "Current (adaptive) request rate allowed per account/region/category",
+    ["account", "region", "category"]
+)
+AWS_RATE_WAIT_SECONDS = registry.histogram(
+    "aws_rate_limit_wait_seconds", "Time a call waited for a rate limiter token", ["region", "category"]
+)
+AWS_THROTTLES = registry.counter(
+    "aws_throttles_total", "Throttling responses from EC2", ["account", "region", "category"]
+)
+AWS_RETRIES = registry.counter(
+    "aws_retries_total", "EC2 calls retried after a throttle or transient error", ["region", "category", "reason"]
+)
+AWS_CIRCUIT_STATE = registry.gauge(
+    "aws_circuit_state", "Circuit breaker per account/region: 0 closed, 1 half-open, 2 open", ["account", "region"]
+)
+AWS_CIRCUIT_REJECTED = registry.counter(
+    "aws_circuit_rejected_total", "Calls failed fast because the circuit was open", ["account", "region"]
+)
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling EC2 while an account/region's circuit is open.
+    """
+
+def classify_error(exc: BaseException) -> Optional[str]:
+    """
+    "throttle", "transient" or None (the call reached EC2 and failed for
+    a reason retrying won't fix).
+    """
+    if isinstance(exc, ClientError):
+        code = error_code(exc)
+        if code in THROTTLE_CODES:
+            return "throttle"
+        if code in TRANSIENT_CODES:
+            return "transient"
+        return None
+    if isinstance(exc, (BotoConnectionError, HTTPClientError)):
+        return "transient"
+    return None
+
+def retry_delay(attempt: int) -> float:
+    # Full jitter: spreads retries from many callers over the whole window
+    return random.uniform(0, min(settings.AWS_RETRY_MAX_SECONDS, settings.AWS_RETRY_BASE_SECONDS * 2 ** attempt))
+
+class TokenBucket:
+    """
+    Token bucket whose refill rate adapts AIMD-style: it drops by
+    AWS_RATE_DECREASE_FACTOR on a throttle (at most once a second, so one
+    burst of rejections counts once) and climbs back by
+    AWS_RATE_INCREASE_PER_SUCCESS per successful call, up to the configured rate.
+    """
+    def __init__(self, rate: float, burst: float, labels: dict):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.labels = labels
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        AWS_RATE.set(self.rate, **labels)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_success(self):
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + settings.AWS_RATE_INCREASE_PER_SUCCESS)
+            AWS_RATE.set(self.rate, **self.labels)
+
+    def on_throttle(self):
+        now = time.monotonic()
+        if now - self._last_decrease < 1:
+            return
+        self._refill()
+        self._last_decrease = now
+        self.rate = max(settings.AWS_RATE_MIN, self.rate * settings.AWS_RATE_DECREASE_FACTOR)
+        # Drop any saved-up burst too; EC2 just told us it's too much
+        self.tokens = min(self.tokens, 0)
+        AWS_RATE.set(self.rate, **self.labels)
+
+class CircuitBreaker:
+    """
+    Opens after AWS_BREAKER_FAILURE_THRESHOLD consecutive transient
+    failures and rejects calls for AWS_BREAKER_OPEN_SECONDS. Then one
+    trial call goes through: success closes it, failure opens it again.
+    The trial's own retries don't go through before_call, and the caller
+    must end_trial() however the call ends, so a throttled or cancelled
+    trial can't leave the breaker waiting on it for good.
+    """
+    def __init__(self, labels: dict):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.labels = labels
+
+    def _set(self, state: int):
+        self.state = state
+        AWS_CIRCUIT_STATE.set(state, **self.labels)
+
+    def blocked(self) -> bool:
+        """
+        True while calls should be kept away, without changing state.
+        """
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at < settings.AWS_BREAKER_OPEN_SECONDS
+        return self.state == HALF_OPEN and self.trial_in_flight
+
+    def before_call(self) -> bool:
+        """
+        Raises CircuitOpenError while blocked. Returns True if this call is
+        the half-open trial.
+        """
+        if self.blocked():
+            AWS_CIRCUIT_REJECTED.inc(**self.labels)
+            raise CircuitOpenError(
+                f"Circuit open for account {self.labels['account']} in {self.labels['region']}"
+            )
+        if self.state == OPEN:
+            self._set(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def end_trial(self):
+        # Still half-open if the trial never settled: the next call is a new trial
+        self.trial_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.trial_in_flight = False
+        if self.state != CLOSED:
+            self._set(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= settings.AWS_BREAKER_FAILURE_THRESHOLD:
+            self.opened_at = time.monotonic()
+            self._set(OPEN)
+
+class RateLimiter:
+    """
+    Buckets per (account, region, category) and breakers per (account,
+    region), created on first use. Everything runs on the event loop, so
+    no locking is needed.
+    """
+    def __init__(self):
+        self.buckets: Dict[Tuple[str, str, str], TokenBucket] = {}
+        self.breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+
+    def bucket(self, account: str, region: str, operation: str) -> TokenBucket:
+        category = OPERATION_CATEGORIES.get(operation, DEFAULT_CATEGORY)
+        key = (account, region, category)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            limits = settings.AWS_RATE_LIMITS.get(category, settings.AWS_RATE_LIMITS[DEFAULT_CATEGORY])
+            bucket = self.buckets[key] = TokenBucket(
+                limits["rate"], limits["burst"], {"account": account, "region": region, "category": category}
+            )
+        return bucket
+
+    def breaker(self, account: str, region: str) -> CircuitBreaker:
+        key = (account, region)
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = self.breakers[key] = CircuitBreaker({"account": account, "region": region})
+        return breaker
+
+    def open_accounts(self, region: str) -> List[str]:
+        """
+        Accounts to leave out of quota reservation in this region for now.
+        """
+        return [account for (account, r), breaker in self.breakers.items() if r == region and breaker.blocked()]
+
+    def clear(self):
+        self.buckets.clear()
+        self.breakers.clear()
+
+    def stats(self) -> dict:
+        return {
+            "buckets": [
+                {"account": a, "region": r, "category": c, "rate": round(b.rate, 2), "max_rate": b.max_rate}
+                for (a, r, c), b in self.buckets.items() if b.rate < b.max_rate
+            ],
+            "circuits": [
+                {"account": a, "region": r, "state": STATE_NAMES[b.state], "failures": b.failures}
+                for (a, r), b in self.breakers.items() if b.state != CLOSED or b.failures
+            ],
+            "tracked_buckets": len(self.buckets),
+        }
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,166 @@
+from ..db.crud import crud
+from ..db.models import InstanceStatus
+from ..core.config import settings
+from ..core.metrics import registry
+from .cluster import cluster
+from .event_bus import event_bus
+from .log_sink import system_log
+from collections import defaultdict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+
+WARM_POOL_REQUESTS = registry.counter(
+    "warm_pool_requests_total", "Deploys that asked the warm pool, by outcome (hit/miss)",
+    ["region", "instance_type", "outcome"]
+)
+WARM_POOL_DEPTH = registry.gauge(
+    "warm_pool_instances", "Pool instances by state (ready/warming), as of the last refill or stats call",
+    ["region", "instance_type", "state"]
+)
+WARM_POOL_IDLE_COST = registry.gauge(
+    "warm_pool_idle_cost_dollars", "Estimated on-demand cost of pool instances while they sat unassigned"
+)
+
+class WarmPool:
+    """
+    Optional pool of pre-launched instances, owned by WARM_POOL_USER_ID until
+    a deploy takes one. Handoff is a single find_one_and_update on the pool
+    record, so two deploys can never get the same machine.
+
+    The refiller launches through DeploymentService.deploy_batch, so pool
+    instances take quota and go through the usual pending checks like any
+    other instance. It launches them isolated, one per RunInstances, so no
+    instance's UserData holds the password of a sibling that will go to
+    another customer.
+    """
+    def __init__(self):
+        self.launcher: Optional[Callable[..., Awaitable[dict]]] = None
+        self.hits: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.misses: Dict[Tuple[str, str], int] = defaultdict(int)
+        # Idle time of instances already handed out, in instance-hours x price
+        self.handed_idle_cost = 0.0
+        self._refill_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        # The loop only keeps weak references to tasks
+        self._refill_tasks = set()
+
+    def set_launcher(self, launcher: Callable[..., Awaitable[dict]]):
+        """
+        launcher(user_id, count, region, instance_type) -> deploy_batch report.
+        It must give each instance its own UserData.
+        """
+        self.launcher = launcher
+
+    @property
+    def user_id(self) -> str:
+        return settings.WARM_POOL_USER_ID
+
+    def target(self, region: str, instance_type: str) -> int:
+        if not settings.WARM_POOL_ENABLED:
+            return 0
+        return settings.WARM_POOL_TARGETS.get(region, {}).get(instance_type, 0)
+
+    def _hourly_price(self, instance_type: Optional[str]) -> float:
+        return settings.WARM_POOL_HOURLY_PRICES.get(instance_type, 0.0)
+
+    async def take(self, user_id: str, region: str, instance_type: str) -> Optional[dict]:
+        """
+        Hands a ready pool instance to user_id and returns its record, or
+        None if the pool is off or empty for this region and type.
+        """
+        if not self.target(region, instance_type):
+            return None
+        doc = await crud.claim_warm_instance(self.user_id, user_id, region, instance_type)
+        key = (region, instance_type)
+        if not doc:
+            self.misses[key] += 1
+            WARM_POOL_REQUESTS.inc(region=region, instance_type=instance_type, outcome="miss")
+            return None
+        self.hits[key] += 1
+        WARM_POOL_REQUESTS.inc(region=region, instance_type=instance_type, outcome="hit")
+        idle_hours = (datetime.utcnow() - doc["launch_time"]).total_seconds() / 3600
+        self.handed_idle_cost += idle_hours * self._hourly_price(instance_type)
+        event_bus.publish_instance("instance.created", doc, status=InstanceStatus(doc["status"]).value)
+        # Top the pool back up without waiting for the next scheduled refill.
+        # Only the leader refills, so replicas don't overshoot the target.
+        if cluster.is_leader:
+            task = asyncio.create_task(self.refill_pool(region, instance_type))
+            self._refill_tasks.add(task)
+            task.add_done_callback(self._refill_tasks.discard)
+        return doc
+
+    async def refill(self):
+        """
+        Scheduler job: launches enough instances to bring every configured
+        pool back to its target. Pools are never shrunk here; lowering a
+        target lets the surplus drain through deploys.
+        """
+        if not settings.WARM_POOL_ENABLED:
+            return
+        for region, types in settings.WARM_POOL_TARGETS.items():
+            for instance_type in types:
+                await self.refill_pool(region, instance_type)
+        # Refreshes the depth and idle cost gauges
+        await self.stats()
+
+    async def refill_pool(self, region: str, instance_type: str):
+        target = self.target(region, instance_type)
+        if not target or self.launcher is None:
+            return
+        lock = self._refill_locks.setdefault((region, instance_type), asyncio.Lock())
+        if lock.locked():
+            # A refill for this pool is already in flight
+            return
+        async with lock:
+            try:
+                live = await crud.count_warm_instances(self.user_id, region, instance_type)
+                deficit = target - live
+                if deficit <= 0:
+                    return
+                report = await self.launcher(self.user_id, deficit, region, instance_type)
+            except Exception as e:
+                system_log.error(f"Warm pool refill for {region}/{instance_type} failed: {e}", region=region)
+                return
+            if report["launched"] < deficit:
+                system_log.warning(
+                    f"Warm pool {region}/{instance_type}: launched {report['launched']} of {deficit} "
+                    f"({report['unallocated']} without quota)",
+                    region=region
+                )
+
+    async def stats(self) -> dict:
+        now = datetime.utcnow()
+        pools: Dict[Tuple[str, str], dict] = {}
+        idle_cost = self.handed_idle_cost
+        for doc in await crud.list_warm_instances(self.user_id):
+            key = (doc["region"], doc.get("instance_type"))
+            pool = pools.setdefault(key, {"ready": 0, "warming": 0})
+            ready = doc["status"] == InstanceStatus.RUNNING and doc.get("public_ip")
+            pool["ready" if ready else "warming"] += 1
+            idle_cost += (now - doc["launch_time"]).total_seconds() / 3600 * self._hourly_price(key[1])
+
+        configured = [(r, t) for r, types in settings.WARM_POOL_TARGETS.items() for t in types]
+        report: List[dict] = []
+        for region, instance_type in sorted(set(configured) | set(pools) | set(self.hits) | set(self.misses)):
+            key = (region, instance_type)
+            depth = pools.get(key, {"ready": 0, "warming": 0})
+            hits, misses = self.hits[key], self.misses[key]
+            for state, n in depth.items():
+                WARM_POOL_DEPTH.set(n, region=region, instance_type=instance_type, state=state)
+            report.append({
+                "region": region,
+                "instance_type": instance_type,
+                "target": self.target(region, instance_type),
+                **depth,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            })
+        WARM_POOL_IDLE_COST.set(idle_cost)
+        return {
+            "enabled": settings.WARM_POOL_ENABLED,
+            "pools": report,
+            "idle_cost_dollars": round(idle_cost, 4),
+        }
+
+warm_pool = WarmPool()
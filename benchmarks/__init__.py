@@ -0,0 +1,4 @@
+import os
+
+# Settings insist on a Mongo URL; the benchmarks never connect through it
+os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
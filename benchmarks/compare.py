@@ -0,0 +1,62 @@
+"""
+Flags regressions between two benchmark reports.
+
+    python -m benchmarks.compare baseline.json results.json [--threshold 1.2]
+
+Latencies (*_ms) and durations (*_seconds) regress when they grow by more
+than the threshold factor, throughput (*_rps) when it shrinks by it.
+Exits 1 if anything regressed.
+"""
+import argparse
+import json
+import sys
+
+def _walk(node, path=()):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from _walk(value, path + (str(key),))
+    elif isinstance(node, list):
+        for i, value in enumerate(node):
+            # Size sweeps are lists; key them by size so reordering is harmless
+            label = value.get("size", value.get("fleet_size", i)) if isinstance(value, dict) else i
+            yield from _walk(value, path + (f"[{label}]",))
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield path, node
+
+def compare(baseline: dict, current: dict, threshold: float):
+    old = dict(_walk(baseline["results"]))
+    rows = []
+    for path, new_value in _walk(current["results"]):
+        name = path[-1]
+        if path not in old or not (name.endswith("_ms") or name.endswith("_seconds") or name.endswith("_rps")):
+            continue
+        old_value = old[path]
+        if not old_value:
+            continue
+        ratio = new_value / old_value
+        worse = ratio < 1 / threshold if name.endswith("_rps") else ratio > threshold
+        rows.append((".".join(path), old_value, new_value, ratio, worse))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    regressions = 0
+    for metric, old_value, new_value, ratio, worse in compare(baseline, current, args.threshold):
+        regressions += worse
+        flag = "REGRESSION" if worse else ""
+        print(f"{metric:70} {old_value:>12} -> {new_value:>12}  x{ratio:.2f} {flag}")
+    print(f"\n{regressions} regression(s) at threshold x{args.threshold}")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+from botocore.exceptions import ClientError
+from typing import Dict, List, Optional
+import itertools
+import random
+import threading
+import time
+
+class FakeEC2:
+    """
+    In-process stand-in for an EC2 client, shared by every (account, region).
+
+    Calls block for `latency` seconds (plus up to `jitter`) on the calling
+    thread, like a real HTTPS round trip on the AWS executor, and fail with
+    RequestLimitExceeded at `throttle_rate`. Instances report running with a
+    public IP once `boot_seconds` have passed since launch.
+    """
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, throttle_rate: float = 0.0,
+                 boot_seconds: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.boot_seconds = boot_seconds
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.instances: Dict[str, dict] = {}
+        self.calls: Dict[str, int] = {}
+        self.throttled = 0
+
+    def _api_call(self, operation: str):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            throttled = self._random.random() < self.throttle_rate
+            if throttled:
+                self.throttled += 1
+        time.sleep(delay)
+        if throttled:
+            raise ClientError(
+                {"Error": {"Code": "RequestLimitExceeded", "Message": "Request limit exceeded."}},
+                operation
+            )
+
+    def add_instance(self, state: str = "pending", public_ip: Optional[str] = None) -> str:
+        """
+        Registers an instance without an API call (for seeding fleets).
+        """
+        with self._lock:
+            instance_id = f"i-{next(self._ids):017x}"
+            self.instances[instance_id] = {
+                "InstanceId": instance_id,
+                "State": {"Name": state},
+                "PublicIpAddress": public_ip,
+                "AmiLaunchIndex": 0,
+                "launched_at": time.monotonic() - self.boot_seconds if state == "running" else time.monotonic(),
+            }
+        return instance_id
+
+    def _view(self, instance: dict) -> dict:
+        view = {k: v for k, v in instance.items() if k != "launched_at" and v is not None}
+        if view["State"]["Name"] == "pending" and time.monotonic() - instance["launched_at"] >= self.boot_seconds:
+            n = int(instance["InstanceId"][2:], 16)
+            view["State"] = {"Name": "running"}
+            view["PublicIpAddress"] = f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}"
+        return view
+
+    # EC2 client surface used by AWSService
+
+    def run_instances(self, MaxCount: int = 1, **kwargs) -> dict:
+        self._api_call("RunInstances")
+        launched = []
+        for index in range(MaxCount):
+            instance_id = self.add_instance()
+            self.instances[instance_id]["AmiLaunchIndex"] = index
+            launched.append(self._view(self.instances[instance_id]))
+        return {"Instances": launched}
+
+    def describe_instances(self, InstanceIds: Optional[List[str]] = None, Filters: Optional[list] = None, **kwargs) -> dict:
+        self._api_call("DescribeInstances")
+        ids = InstanceIds
+        for f in Filters or []:
+            if f["Name"] == "instance-id":
+                ids = f["Values"]
+        with self._lock:
+            found = [self.instances[i] for i in (ids if ids is not None else list(self.instances)) if i in self.instances]
+        return {"Reservations": [{"Instances": [self._view(i) for i in found]}] if found else []}
+
+    def terminate_instances(self, InstanceIds: List[str], **kwargs) -> dict:
+        self._api_call("TerminateInstances")
+        with self._lock:
+            missing = [i for i in InstanceIds if i not in self.instances]
+            if missing:
+                raise ClientError(
+                    {"Error": {"Code": "InvalidInstanceID.NotFound", "Message": f"{missing[0]} not found"}},
+                    "TerminateInstances"
+                )
+            for instance_id in InstanceIds:
+                self.instances[instance_id]["State"] = {"Name": "terminated"}
+                self.instances[instance_id]["PublicIpAddress"] = None
+        return {"TerminatingInstances": [{"InstanceId": i} for i in InstanceIds]}
+
+    def get_paginator(self, operation: str):
+        return _Paginator(self, operation)
+
+class _Paginator:
+    def __init__(self, ec2: FakeEC2, operation: str):
+        self.ec2 = ec2
+        self.operation = operation
+
+    def paginate(self, PaginationConfig: Optional[dict] = None, **kwargs):
+        # One page: the fake has no server-side page limit
+        yield getattr(self.ec2, self.operation)(**kwargs)
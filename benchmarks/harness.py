@@ -0,0 +1,172 @@
+from backend.app.core.config import settings
+from backend.app.db.cache import status_cache
+from backend.app.db.capacity import capacity_index
+from backend.app.db.crud import crud
+from backend.app.db.indexes import ensure_indexes
+from backend.app.db.models import Account, Instance, InstanceStatus, JobStatus
+from backend.app.db.mongodb import client_options, db
+from backend.app.services.aws_client_pool import client_pool
+from backend.app.services.deploy_queue import deploy_queue
+from backend.app.services.rate_limiter import rate_limiter
+from datetime import datetime, timedelta
+from typing import List, Optional
+from .fake_ec2 import FakeEC2
+import asyncio
+import itertools
+import math
+
+COLLECTIONS = ["accounts", "instances", "deploy_jobs", "logs"]
+
+def percentile(samples: List[float], pct: float) -> Optional[float]:
+    # Nearest-rank percentile
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+def summarize(samples: List[float]) -> dict:
+    """
+    Latency summary in milliseconds.
+    """
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p90_ms": round(percentile(samples, 90) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+    }
+
+class BenchEnvironment:
+    """
+    Points the backend at a throwaway database and the fake EC2. With no
+    mongo_url everything runs in memory on mongomock-motor; pass a URL to
+    measure against a real mongod (the database is dropped between runs).
+    """
+    def __init__(self, ec2: FakeEC2, mongo_url: Optional[str] = None, database: str = "rentmachine_bench"):
+        self.ec2 = ec2
+        self.mongo_url = mongo_url
+        self.database = database
+        self._untracked_ids = itertools.count(1)
+
+    @property
+    def backend(self) -> str:
+        return "mongod" if self.mongo_url else "mongomock"
+
+    async def start(self):
+        if self.mongo_url:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            db.client = AsyncIOMotorClient(self.mongo_url, **client_options())
+        else:
+            from mongomock_motor import AsyncMongoMockClient
+            _patch_mongomock_bulk()
+            _patch_mongomock_options()
+            db.client = AsyncMongoMockClient()
+        db.db = db.client[self.database]
+        client_pool.set_client_factory(lambda access_key, region: self.ec2)
+        await self.reset()
+        deploy_queue.start()
+
+    async def stop(self):
+        await deploy_queue.stop()
+        await db.client.drop_database(self.database)
+        client_pool.set_client_factory(None)
+        db.client.close()
+
+    async def reset(self):
+        for name in COLLECTIONS:
+            await db.db.drop_collection(name)
+        # mongomock ignores most index options, but does enforce unique ones
+        await ensure_indexes(db.db)
+        status_cache.clear()
+        capacity_index.clear()
+        rate_limiter.clear()
+
+    async def seed_accounts(self, count: int, quota: int, regions: List[str] = None) -> List[str]:
+        docs = [
+            Account(
+                access_key=f"AKIABENCH{i:08d}", secret_key="bench-secret",
+                regions=regions or ["us-east-1"], remaining_quota=quota, total_quota=quota
+            ).model_dump(by_alias=True, exclude=["id"])
+            for i in range(count)
+        ]
+        result = await db.db.accounts.insert_many(docs)
+        await crud.rebuild_capacity_index()
+        return [str(_id) for _id in result.inserted_ids]
+
+    async def seed_instances(self, count: int, account_ids: List[str], user_id: str = "bench_user",
+                             status: InstanceStatus = InstanceStatus.RUNNING, ec2_state: Optional[str] = "running",
+                             region: str = "us-east-1", **fields) -> int:
+        """
+        Inserts `count` instance records spread round-robin over the accounts.
+        With an ec2_state the fake EC2 knows about each instance too.
+        """
+        now = datetime.utcnow()
+        batch = []
+        for i in range(count):
+            instance_id = self.ec2.add_instance(ec2_state, "10.0.0.1" if ec2_state == "running" else None) \
+                if ec2_state else f"i-untracked{next(self._untracked_ids):08x}"
+            values = {
+                "instance_id": instance_id,
+                "account_id": account_ids[i % len(account_ids)],
+                "region": region,
+                "user_id": user_id,
+                "status": status,
+                "launch_time": now - timedelta(hours=1),
+                "expire_at": now + timedelta(days=1),
+                **fields
+            }
+            batch.append(Instance(**values).model_dump(by_alias=True, exclude=["id"]))
+            if len(batch) == 1000:
+                await db.db.instances.insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            await db.db.instances.insert_many(batch, ordered=False)
+        return count
+
+async def wait_for_jobs(timeout: float = 600, poll: float = 0.05):
+    """
+    Waits until the deploy queue has nothing queued or running.
+    """
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        busy = await db.db.deploy_jobs.count_documents({"status": {"$in": [JobStatus.QUEUED, JobStatus.RUNNING]}})
+        if not busy:
+            return
+        await asyncio.sleep(poll)
+    raise TimeoutError("Deploy queue did not drain")
+
+def _patch_mongomock_bulk():
+    # Newer pymongo passes sort= to bulk update builders, which mongomock
+    # doesn't accept yet. Only affects the in-memory backend.
+    import mongomock.collection as collection
+    builder = collection.BulkOperationBuilder
+    if getattr(builder, "_bench_patched", False):
+        return
+    for name in ("add_update", "add_replace", "add_delete"):
+        original = getattr(builder, name, None)
+        if original:
+            def patched(self, *args, _original=original, **kwargs):
+                kwargs.pop("sort", None)
+                return _original(self, *args, **kwargs)
+            setattr(builder, name, patched)
+    builder._bench_patched = True
+
+def _patch_mongomock_options():
+    # mongomock's with_options hands back its synchronous collection. There
+    # are no replicas or write concerns to honour in memory, so keep the
+    # async wrapper as is.
+    from mongomock_motor import AsyncMongoMockCollection
+    AsyncMongoMockCollection.with_options = lambda self, **options: self
+
+def apply_settings(**overrides) -> dict:
+    """
+    Overrides settings in place and returns the previous values, so a
+    scenario can put them back with apply_settings(**previous).
+    """
+    previous = {key: getattr(settings, key) for key in overrides}
+    for key, value in overrides.items():
+        setattr(settings, key, value)
+    return previous
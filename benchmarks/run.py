@@ -0,0 +1,109 @@
+"""
+Offline benchmarks: fake EC2, in-memory (or local) Mongo, JSON out.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.compare baseline.json results.json
+"""
+from contextlib import redirect_stdout
+from datetime import datetime
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+
+from backend.app.main import app
+from . import scenarios
+from .fake_ec2 import FakeEC2
+from .harness import BenchEnvironment
+
+SCENARIOS = ["deploy", "check_pending", "auto_replenish", "list_instances", "list_during_deploys", "mongo_profiles"]
+
+def _sizes(value: str):
+    return [int(v) for v in value.split(",") if v]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--mongo-url", help="Benchmark against this mongod instead of mongomock-motor")
+    parser.add_argument("--ec2-latency", type=float, default=0.05, help="Seconds per fake EC2 call")
+    parser.add_argument("--ec2-jitter", type=float, default=0.02, help="Extra random seconds per call")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of EC2 calls that are throttled")
+    parser.add_argument("--deploy-requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--pending-sizes", type=_sizes, default=[10, 100, 1000, 10000])
+    parser.add_argument("--replenish-sizes", type=_sizes, default=[10, 100, 1000])
+    parser.add_argument("--fleet-sizes", type=_sizes, default=[100, 1000, 10000])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--quick", action="store_true", help="Small sizes for a smoke run")
+    parser.add_argument("--output", help="Write JSON here (default: stdout)")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.deploy_requests = 50
+        args.pending_sizes = [10, 100]
+        args.replenish_sizes = [10, 100]
+        args.fleet_sizes = [100, 1000]
+    return args
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(args) -> dict:
+    import httpx
+
+    ec2 = FakeEC2(latency=args.ec2_latency, jitter=args.ec2_jitter, throttle_rate=args.throttle_rate, seed=args.seed)
+    env = BenchEnvironment(ec2, mongo_url=args.mongo_url)
+    selected = [name for name in args.scenarios.split(",") if name]
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    results = {}
+    await env.start()
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            if "deploy" in selected:
+                results["deploy"] = await scenarios.deploy_throughput(env, client, args.deploy_requests, args.concurrency)
+            if "check_pending" in selected:
+                results["check_pending"] = await scenarios.check_pending_ticks(env, args.pending_sizes)
+            if "auto_replenish" in selected:
+                results["auto_replenish"] = await scenarios.auto_replenish_ticks(env, args.replenish_sizes)
+            if "list_instances" in selected:
+                results["list_instances"] = await scenarios.list_instances_latency(env, client, args.fleet_sizes)
+            if "list_during_deploys" in selected:
+                results["list_during_deploys"] = await scenarios.list_during_deploys(env, client)
+            if "mongo_profiles" in selected:
+                results["mongo_profiles"] = await scenarios.mongo_profiles(env, client)
+    finally:
+        await env.stop()
+
+    return {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "mongo_backend": env.backend,
+            "params": {k: v for k, v in vars(args).items() if k != "output"},
+        },
+        "results": results,
+    }
+
+def main(argv=None):
+    args = parse_args(argv)
+    # The backend logs with print(); keep that off stdout so the JSON stays parseable
+    with redirect_stdout(sys.stderr):
+        report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+from backend.app.core.config import settings
+from backend.app.db.crud import crud
+from backend.app.db.models import InstanceStatus, LogLevel, SystemLog
+from backend.app.db.mongodb import db
+from backend.app.services.monitor_service import monitor_service
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List
+from .harness import BenchEnvironment, apply_settings, summarize, wait_for_jobs
+import asyncio
+import time
+
+API = settings.API_V1_STR
+
+async def deploy_throughput(env: BenchEnvironment, client, requests: int = 200, concurrency: int = 20,
+                            accounts: int = 10) -> dict:
+    """
+    POST /deploy `requests` times with at most `concurrency` clients, each
+    polling its job to completion. Reports how fast orders are accepted
+    and how long they take end to end through the deploy queue.
+    """
+    await env.reset()
+    await env.seed_accounts(accounts, quota=requests)
+    calls_before = dict(env.ec2.calls)
+    accepted: List[float] = []
+    completed: List[float] = []
+    outcomes = Counter()
+    limit = asyncio.Semaphore(concurrency)
+
+    async def deploy(i: int):
+        async with limit:
+            started = time.perf_counter()
+            res = await client.post(f"{API}/deploy", json={"user_id": f"user_{i % 50}", "region": "us-east-1"})
+            accepted.append(time.perf_counter() - started)
+            if res.status_code != 202:
+                outcomes[f"http_{res.status_code}"] += 1
+                return
+            job = await _wait_for_job(client, res.json()["job_id"])
+            completed.append(time.perf_counter() - started)
+            outcomes[job["status"]] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(deploy(i) for i in range(requests)))
+    wall = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "accounts": accounts,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(outcomes["succeeded"] / wall, 2),
+        "outcomes": dict(outcomes),
+        "accept_latency": summarize(accepted),
+        "completion_latency": summarize(completed),
+        "ec2_calls": _calls_since(env, calls_before),
+    }
+
+async def _wait_for_job(client, job_id: str, poll: float = 0.02) -> dict:
+    while True:
+        res = await client.get(f"{API}/deploy/jobs/{job_id}")
+        res.raise_for_status()
+        job = res.json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        await asyncio.sleep(poll)
+
+async def check_pending_ticks(env: BenchEnvironment, sizes: List[int], accounts: int = 10,
+                              ready_ratio: float = 0.5) -> List[dict]:
+    """
+    One check_pending_instances tick over `size` due PENDING records, of
+    which `ready_ratio` have come up in EC2 and the rest are still booting.
+    """
+    results = []
+    boot_seconds, env.ec2.boot_seconds = env.ec2.boot_seconds, 3600
+    try:
+        for size in sizes:
+            await env.reset()
+            account_ids = await env.seed_accounts(accounts, quota=size)
+            ready = int(size * ready_ratio)
+            due = {"status": InstanceStatus.PENDING, "next_check_at": datetime.utcnow() - timedelta(seconds=1)}
+            await env.seed_instances(ready, account_ids, ec2_state="running", **due)
+            await env.seed_instances(size - ready, account_ids, ec2_state="pending", **due)
+            results.append(await _timed_tick(env, "check_pending_instances", monitor_service.check_pending_instances, size))
+    finally:
+        env.ec2.boot_seconds = boot_seconds
+    return results
+
+async def auto_replenish_ticks(env: BenchEnvironment, sizes: List[int], accounts: int = 10) -> List[dict]:
+    """
+    One auto_replenish tick with `size` terminated-but-paid-for records.
+    """
+    results = []
+    for size in sizes:
+        await env.reset()
+        account_ids = await env.seed_accounts(accounts, quota=size)
+        await env.seed_instances(
+            size, account_ids, ec2_state="terminated",
+            status=InstanceStatus.TERMINATED, terminated_at=datetime.utcnow()
+        )
+        # The tick only enqueues; time it together with the queue draining
+        async def tick_and_drain():
+            await monitor_service.auto_replenish()
+            await wait_for_jobs()
+        result = await _timed_tick(env, "auto_replenish", tick_and_drain, size)
+        result["replaced"] = await db.db.instances.count_documents({"metadata.replenished": True})
+        results.append(result)
+    return results
+
+async def _timed_tick(env: BenchEnvironment, job: str, tick, size: int) -> dict:
+    calls_before = dict(env.ec2.calls)
+    stats = monitor_service.job_stats.get(job)
+    budget_before, errors_before = (stats.budget_exhausted, stats.errors) if stats else (0, 0)
+    started = time.perf_counter()
+    await tick()
+    seconds = time.perf_counter() - started
+    stats = monitor_service.job_stats[job]
+    return {
+        "size": size,
+        "tick_seconds": round(seconds, 3),
+        "per_item_ms": round(seconds / size * 1000, 3),
+        # Pipeline items: (account, region) groups for check_pending, instances for auto_replenish
+        "processed": stats.last_processed,
+        "budget_exhausted": stats.budget_exhausted > budget_before,
+        "failed": stats.errors > errors_before,
+        "ec2_calls": _calls_since(env, calls_before),
+    }
+
+async def list_instances_latency(env: BenchEnvironment, client, fleet_sizes: List[int],
+                                 samples: int = 50) -> List[dict]:
+    """
+    GET /instances for one user as their fleet grows. Another user owns as
+    many records again, so an unindexed query would have to skip them.
+    """
+    results = []
+    for size in fleet_sizes:
+        await env.reset()
+        account_ids = await env.seed_accounts(1, quota=size)
+        await env.seed_instances(size, account_ids, user_id="bench_user", ec2_state=None)
+        await env.seed_instances(size, account_ids, user_id="other_user", ec2_state=None)
+
+        first_page = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            res = await client.get(f"{API}/instances", params={"user_id": "bench_user", "limit": 100})
+            res.raise_for_status()
+            first_page.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        fetched = await _read_all_instances(client, "bench_user")
+        full = time.perf_counter() - started
+        results.append({
+            "fleet_size": size,
+            "first_page": summarize(first_page),
+            "full_listing_seconds": round(full, 3),
+            "full_listing_items": fetched,
+        })
+    return results
+
+async def list_during_deploys(env: BenchEnvironment, client, fleet_size: int = 1000, deploys: int = 100,
+                              concurrency: int = 10, samples: int = 100) -> dict:
+    """
+    /instances latency idle vs. while deploys are in flight: a blocked event
+    loop or a starved executor shows up as a p99 gap between the two.
+    """
+    await env.reset()
+    account_ids = await env.seed_accounts(10, quota=fleet_size + deploys)
+    await env.seed_instances(fleet_size, account_ids, user_id="bench_user", ec2_state=None)
+
+    async def sample_listing() -> List[float]:
+        latencies = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            res = await client.get(f"{API}/instances", params={"user_id": "bench_user", "limit": 100})
+            res.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    idle = await sample_listing()
+    limit = asyncio.Semaphore(concurrency)
+
+    async def deploy(i: int):
+        async with limit:
+            await client.post(f"{API}/deploy", json={"user_id": f"user_{i}", "region": "us-east-1"})
+
+    await asyncio.gather(*(deploy(i) for i in range(deploys)))
+    # The orders are now queued; sample while the workers launch them
+    busy = await sample_listing()
+    await wait_for_jobs()
+    return {
+        "fleet_size": fleet_size,
+        "deploys": deploys,
+        "deploy_concurrency": concurrency,
+        "idle": summarize(idle),
+        "during_deploys": summarize(busy),
+    }
+
+# Mongo profiles compared by mongo_profiles: everything on the primary with
+# majority writes, against the per-operation defaults from Settings
+UNIFORM_PROFILES = {
+    "MONGO_LISTING_READ_PREFERENCE": "primary",
+    "MONGO_CRITICAL_WRITE_CONCERN": "majority",
+    "MONGO_LOG_WRITE_CONCERN": "majority",
+}
+
+async def mongo_profiles(env: BenchEnvironment, client, fleet_size: int = 1000, deploys: int = 100,
+                         concurrency: int = 10, samples: int = 100, log_batches: int = 100,
+                         log_batch_size: int = 50) -> dict:
+    """
+    Listing, log insert and deploy latency under mixed load, once with
+    UNIFORM_PROFILES and once with the configured per-operation profiles.
+    Only meaningful against a replica set (--mongo-url); on mongomock and a
+    standalone mongod both runs are the same.
+    """
+    results = {}
+    for name, overrides in (("uniform", UNIFORM_PROFILES), ("per_operation", {})):
+        previous = apply_settings(**overrides)
+        try:
+            results[name] = await _mixed_load(env, client, fleet_size, deploys, concurrency, samples,
+                                              log_batches, log_batch_size)
+        finally:
+            apply_settings(**previous)
+    results["profiles"] = {
+        key: {"uniform": UNIFORM_PROFILES[key], "per_operation": getattr(settings, key)} for key in UNIFORM_PROFILES
+    }
+    return results
+
+async def _mixed_load(env: BenchEnvironment, client, fleet_size: int, deploys: int, concurrency: int,
+                      samples: int, log_batches: int, log_batch_size: int) -> dict:
+    await env.reset()
+    account_ids = await env.seed_accounts(10, quota=fleet_size + deploys)
+    await env.seed_instances(fleet_size, account_ids, user_id="bench_user", ec2_state=None)
+    listing: List[float] = []
+    log_writes: List[float] = []
+    completed: List[float] = []
+    outcomes = Counter()
+    limit = asyncio.Semaphore(concurrency)
+
+    async def list_instances():
+        for _ in range(samples):
+            started = time.perf_counter()
+            res = await client.get(f"{API}/instances", params={"user_id": "bench_user", "limit": 100})
+            res.raise_for_status()
+            listing.append(time.perf_counter() - started)
+
+    async def write_logs():
+        for i in range(log_batches):
+            batch = [SystemLog(level=LogLevel.INFO, message=f"bench log {i}.{j}") for j in range(log_batch_size)]
+            started = time.perf_counter()
+            await crud.insert_logs(batch)
+            log_writes.append(time.perf_counter() - started)
+
+    async def deploy(i: int):
+        async with limit:
+            started = time.perf_counter()
+            res = await client.post(f"{API}/deploy", json={"user_id": f"user_{i}", "region": "us-east-1"})
+            if res.status_code != 202:
+                outcomes[f"http_{res.status_code}"] += 1
+                return
+            job = await _wait_for_job(client, res.json()["job_id"])
+            completed.append(time.perf_counter() - started)
+            outcomes[job["status"]] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(list_instances(), write_logs(), *(deploy(i) for i in range(deploys)))
+    wall = time.perf_counter() - started
+    await wait_for_jobs()
+    return {
+        "wall_seconds": round(wall, 3),
+        "deploy_outcomes": dict(outcomes),
+        "listing": summarize(listing),
+        "log_insert": summarize(log_writes),
+        "deploy_completion": summarize(completed),
+    }
+
+async def _read_all_instances(client, user_id: str) -> int:
+    params = {"user_id": user_id, "limit": 1000}
+    count = 0
+    while True:
+        res = await client.get(f"{API}/instances", params=params)
+        res.raise_for_status()
+        page = res.json()
+        count += len(page["items"])
+        if not page["next_cursor"]:
+            return count
+        params["cursor"] = page["next_cursor"]
+
+def _calls_since(env: BenchEnvironment, before: dict) -> dict:
+    return {op: n - before.get(op, 0) for op, n in env.ec2.calls.items() if n - before.get(op, 0)}
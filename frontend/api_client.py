@@ -0,0 +1,169 @@
+import os
+import time
+import pandas as pd
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Since we are running in the same container/network, we use localhost
+API_URL = os.getenv("API_URL", "http://127.0.0.1:8000/api/v1")
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (3.05, 15)
+
+# How long the Deploy page follows a queued job before giving up
+DEPLOY_WAIT_SECONDS = 120
+
+# Columns the instance table shows; also pushed down to the API as fields=
+INSTANCE_FIELDS = ["instance_id", "region", "public_ip", "initial_password", "status", "launch_time"]
+
+STATUS_ICONS = {"running": "🟢", "pending": "🟡", "terminated": "🔴"}
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """
+    One pooled keep-alive session per Streamlit server process, instead of a
+    new TCP connection on every rerun.
+    """
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504], allowed_methods=["GET"])
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def get(path: str, **params) -> requests.Response:
+    return get_session().get(f"{API_URL}{path}", params=params, timeout=TIMEOUT)
+
+def post(path: str, payload: dict, headers: dict = None) -> requests.Response:
+    return get_session().post(f"{API_URL}{path}", json=payload, headers=headers, timeout=TIMEOUT)
+
+def wait_for_job(job_id: str, on_poll=None, max_wait: float = DEPLOY_WAIT_SECONDS, interval: float = 1) -> dict:
+    """
+    Polls a deploy job until it succeeds or fails. Returns the last job seen,
+    which is still queued/running if max_wait ran out first.
+    """
+    deadline = time.monotonic() + max_wait
+    while True:
+        res = get(f"/deploy/jobs/{job_id}")
+        res.raise_for_status()
+        job = res.json()
+        if job["status"] in ("succeeded", "failed") or time.monotonic() >= deadline:
+            return job
+        if on_poll:
+            on_poll(job)
+        time.sleep(interval)
+
+@st.cache_data(ttl=10, show_spinner=False)
+def fetch_capacity() -> dict:
+    """
+    Free slots per region; empty if the backend can't be reached.
+    """
+    try:
+        res = get("/capacity")
+        res.raise_for_status()
+    except requests.RequestException:
+        return {}
+    return {region: info["available"] for region, info in res.json()["regions"].items()}
+
+@st.cache_data(ttl=10, show_spinner=False)
+def fetch_instances(user_id: str, status: str = None, region: str = None) -> list:
+    """
+    All of a user's instances (table columns only), following next_cursor.
+    Cached briefly per user and filter so widget reruns don't refetch.
+    """
+    params = {"user_id": user_id, "limit": 1000, "fields": ",".join(INSTANCE_FIELDS)}
+    if status:
+        params["status"] = status
+    if region:
+        params["region"] = region
+    instances = []
+    while True:
+        res = get("/instances", **params)
+        res.raise_for_status()
+        page = res.json()
+        instances.extend(page["items"])
+        if not page["next_cursor"]:
+            return instances
+        params["cursor"] = page["next_cursor"]
+
+def instances_dataframe(instances: list) -> pd.DataFrame:
+    """
+    Builds the display table column-wise instead of row by row.
+    """
+    df = pd.DataFrame.from_records(instances, columns=INSTANCE_FIELDS)
+    status = df["status"].fillna("unknown")
+    return pd.DataFrame({
+        "ID": df["instance_id"].fillna("N/A"),
+        "Region": df["region"].fillna("N/A"),
+        "Public IP": df["public_ip"].fillna("Pending..."),
+        "Password": df["initial_password"].fillna("******"),
+        "Status": status.map(STATUS_ICONS).fillna("⚪") + " " + status.str.upper(),
+        "Launch Time": df["launch_time"].fillna("").astype(str).str.split("T").str[0],
+    })
+
+class InstanceSync:
+    """
+    Keeps a user's instances in session state and refreshes them through
+    /instances/changes, so an auto-refresh only transfers rows that changed.
+    """
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.rows = {}
+        self.since = None
+
+    def refresh(self) -> int:
+        changed = 0
+        while True:
+            params = {"user_id": self.user_id}
+            if self.since:
+                params["since"] = self.since
+            res = get("/instances/changes", **params)
+            res.raise_for_status()
+            data = res.json()
+            for doc in data["changes"]:
+                self.rows[doc["_id"]] = {field: doc.get(field) for field in INSTANCE_FIELDS}
+            for tomb in data["tombstones"]:
+                row = self.rows.setdefault(tomb["_id"], {"instance_id": tomb["instance_id"]})
+                row["status"] = "terminated"
+                row["public_ip"] = None
+            changed += len(data["changes"]) + len(data["tombstones"])
+            self.since = data["next_since"]
+            if not data["has_more"]:
+                return changed
+
+    def dataframe(self, status: str = None, region: str = None) -> pd.DataFrame:
+        rows = [
+            row for row in self.rows.values()
+            if (not status or row.get("status") == status) and (not region or row.get("region") == region)
+        ]
+        return instances_dataframe(rows)
+
+def get_sync(user_id: str) -> InstanceSync:
+    key = f"instance_sync:{user_id}"
+    if key not in st.session_state:
+        st.session_state[key] = InstanceSync(user_id)
+    return st.session_state[key]
+
+@st.cache_data(ttl=5, show_spinner=False)
+def fetch_logs(level: str = None, account_id: str = None, cursor: str = None, limit: int = 100) -> dict:
+    params = {"limit": limit}
+    if level:
+        params["level"] = level
+    if account_id:
+        params["account_id"] = account_id
+    if cursor:
+        params["cursor"] = cursor
+    res = get("/admin/logs", **params)
+    res.raise_for_status()
+    return res.json()
+
+def logs_dataframe(logs: list) -> pd.DataFrame:
+    df = pd.DataFrame.from_records(logs, columns=["timestamp", "level", "message", "metadata"])
+    return pd.DataFrame({
+        "Time": df["timestamp"].fillna("").astype(str).str.replace("T", " ").str.slice(0, 19),
+        "Level": df["level"].fillna("").str.upper(),
+        "Message": df["message"],
+        "Account": df["metadata"].map(lambda m: (m or {}).get("account_id", "")),
+    })
@@ -1,14 +1,17 @@
 import streamlit as st
 import requests
-import pandas as pd
-import os
-import time
+import uuid
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Since we are running in the same container/network, we use localhost
-API_URL = os.getenv("API_URL", "http://127.0.0.1:8000/api/v1")
+# Imported after load_dotenv so API_URL picks up .env
+from api_client import (
+    fetch_capacity, fetch_instances, fetch_logs, get_sync, instances_dataframe, logs_dataframe, post, wait_for_job
+)
+
+REGIONS = ["us-east-1", "us-west-1", "eu-central-1", "ap-northeast-1"]
+LIVE_REFRESH_SECONDS = 10
 
 st.set_page_config(
     page_title="RentMachine",
@@ -53,56 +56,61 @@ page = st.sidebar.radio("Go to", ["My Instances", "Deploy New", "Admin Panel"])
 st.sidebar.markdown("---")
 st.sidebar.caption("RentMachine v1.0")
 
+def show_instances(load):
+    try:
+        df = load()
+    except requests.HTTPError as e:
+        st.error(f"Failed to fetch instances. API Error: {e.response.status_code}")
+        return
+    except Exception as e:
+        st.error(f"Could not connect to backend. Is it running? Error: {e}")
+        return
+
+    if df.empty:
+        st.info("No instances found. Go to 'Deploy New' to rent one!")
+        return
+    st.dataframe(
+        df, 
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "Public IP": st.column_config.TextColumn("Public IP", help="Connect via SSH"),
+            "Password": st.column_config.TextColumn("Password", help="Root password"),
+        }
+    )
+
 if page == "My Instances":
     st.header("📋 My Instances")
     
-    col1, col2 = st.columns([3, 1])
+    col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
     with col1:
         user_id = st.text_input("User ID", value="user_123", help="Simulating login")
     with col2:
+        status_filter = st.selectbox("Status", ["", "running", "pending", "stopped", "terminated"], format_func=lambda s: s or "All")
+    with col3:
+        region_filter = st.selectbox("Region", ["", *REGIONS], format_func=lambda r: r or "All")
+    with col4:
         st.write("") # Spacer
         st.write("") # Spacer
         if st.button("🔄 Refresh"):
+            fetch_instances.clear()
+            st.session_state.pop(f"instance_sync:{user_id}", None)
             st.rerun()
 
-    try:
-        res = requests.get(f"{API_URL}/instances", params={"user_id": user_id})
-        if res.status_code == 200:
-            instances = res.json()
-            if instances:
-                # Prepare data for DataFrame
-                data = []
-                for inst in instances:
-                    status_icon = "⚪"
-                    if inst['status'] == 'running': status_icon = "🟢"
-                    elif inst['status'] == 'pending': status_icon = "🟡"
-                    elif inst['status'] == 'terminated': status_icon = "🔴"
-                    
-                    data.append({
-                        "ID": inst.get('instance_id', 'N/A'),
-                        "Region": inst.get('region', 'N/A'),
-                        "Public IP": inst.get('public_ip', 'Pending...'),
-                        "Password": inst.get('initial_password', '******'),
-                        "Status": f"{status_icon} {inst.get('status', 'unknown').upper()}",
-                        "Launch Time": inst.get('launch_time', '').split('T')[0]
-                    })
-                
-                df = pd.DataFrame(data)
-                st.dataframe(
-                    df, 
-                    use_container_width=True,
-                    hide_index=True,
-                    column_config={
-                        "Public IP": st.column_config.TextColumn("Public IP", help="Connect via SSH"),
-                        "Password": st.column_config.TextColumn("Password", help="Root password"),
-                    }
-                )
-            else:
-                st.info("No instances found. Go to 'Deploy New' to rent one!")
-        else:
-            st.error(f"Failed to fetch instances. API Error: {res.status_code}")
-    except Exception as e:
-        st.error(f"Could not connect to backend. Is it running? Error: {e}")
+    live = st.toggle("Live updates", help=f"Refresh changed rows every {LIVE_REFRESH_SECONDS}s")
+
+    if live:
+        # Only rows changed since the last poll come over the wire
+        @st.fragment(run_every=LIVE_REFRESH_SECONDS)
+        def live_instances():
+            def load():
+                sync = get_sync(user_id)
+                sync.refresh()
+                return sync.dataframe(status_filter or None, region_filter or None)
+            show_instances(load)
+        live_instances()
+    else:
+        show_instances(lambda: instances_dataframe(fetch_instances(user_id, status_filter or None, region_filter or None)))
 
 elif page == "Deploy New":
     st.header("⚡ Deploy New Instance")
@@ -113,7 +121,17 @@ elif page == "Deploy New":
         
         with col1:
             user_id = st.text_input("User ID", value="user_123")
-            region = st.selectbox("Region", ["us-east-1", "us-west-1", "eu-central-1", "ap-northeast-1"])
+            capacity = fetch_capacity()
+
+            def region_label(name):
+                # No capacity data means the lookup failed; show plain names
+                if not capacity:
+                    return name
+                free = capacity.get(name, 0)
+                return f"{name} ({free} free)" if free else f"{name} (no capacity)"
+
+            regions = REGIONS + sorted(set(capacity) - set(REGIONS))
+            region = st.selectbox("Region", regions, format_func=region_label)
         
         with col2:
             instance_type = st.selectbox("Instance Type", ["t2.micro (1 vCPU, 1GB RAM)", "t3.small (2 vCPU, 2GB RAM)"])
@@ -124,29 +142,57 @@ elif page == "Deploy New":
         
         if st.button("🚀 Launch Instance", type="primary"):
             with st.status("Processing deployment...", expanded=True) as status:
-                st.write("🔍 Checking account availability...")
-                time.sleep(1)
-                st.write("📡 Contacting AWS API...")
+                st.write("📡 Queueing deployment...")
                 
                 try:
-                    res = requests.post(f"{API_URL}/deploy", json={"user_id": user_id, "region": region})
-                    if res.status_code == 200:
-                        data = res.json()["data"]
-                        st.write("✅ Instance launched successfully!")
-                        status.update(label="Deployment Complete!", state="complete", expanded=False)
-                        
-                        st.success(f"Instance Created! ID: `{data['instance_id']}`")
-                        st.balloons()
-                        
-                        st.markdown("### 📝 Next Steps")
-                        st.markdown(f"""
-                        1. Go to **My Instances** to check the status.
-                        2. Wait for the **Public IP** to be assigned (approx. 30s).
-                        3. SSH into your machine using `root` and the generated password.
-                        """)
-                    else:
+                    # A fresh key per click; a resent request for the same click maps to the same job
+                    res = post("/deploy", {"user_id": user_id, "region": region},
+                               headers={"Idempotency-Key": str(uuid.uuid4())})
+                    if res.status_code != 202:
                         status.update(label="Deployment Failed", state="error")
                         st.error(f"Deployment failed: {res.text}")
+                    else:
+                        st.write("⏳ Reserving capacity and contacting AWS API...")
+                        seen = set()
+
+                        def show_progress(job):
+                            if job["status"] not in seen:
+                                seen.add(job["status"])
+                                st.write(f"Job is {job['status']}...")
+
+                        job = wait_for_job(res.json()["job_id"], on_poll=show_progress)
+                        if job["status"] == "succeeded":
+                            data = job["result"]
+                            st.write("✅ Instance launched successfully!")
+                            fetch_instances.clear()
+                            fetch_capacity.clear()
+                            status.update(label="Deployment Complete!", state="complete", expanded=False)
+                            
+                            st.success(f"Instance Created! ID: `{data['instance_id']}`")
+                            st.balloons()
+                            
+                            st.markdown("### 📝 Next Steps")
+                            if data.get("public_ip"):
+                                # Served from the warm pool: already up
+                                st.markdown(f"""
+                                1. Your machine is ready at `{data['public_ip']}`.
+                                2. SSH in as `root` with the password shown in **My Instances**.
+                                """)
+                            else:
+                                st.markdown(f"""
+                                1. Go to **My Instances** to check the status.
+                                2. Wait for the **Public IP** to be assigned (approx. 30s).
+                                3. SSH into your machine using `root` and the generated password.
+                                """)
+                        elif job["status"] == "failed":
+                            status.update(label="Deployment Failed", state="error")
+                            st.error(f"Deployment failed: {job.get('error')}")
+                        else:
+                            status.update(label="Still deploying", state="running", expanded=False)
+                            st.warning(
+                                f"Job `{job['_id']}` is still {job['status']}. "
+                                "Your instance will show up in **My Instances** once it launches."
+                            )
                 except Exception as e:
                     status.update(label="Connection Error", state="error")
                     st.error(f"Error connecting to backend: {e}")
@@ -175,7 +221,7 @@ elif page == "Admin Panel":
                         "total_quota": quota
                     }
                     try:
-                        res = requests.post(f"{API_URL}/admin/accounts", json=payload)
+                        res = post("/admin/accounts", payload)
                         if res.status_code == 200:
                             st.success(f"Account added successfully! ID: {res.json()['id']}")
                         else:
@@ -184,7 +230,41 @@ elif page == "Admin Panel":
                         st.error(f"Connection Error: {e}")
         
         with tab2:
-            st.write("System logs will appear here (Not implemented in this demo).")
+            st.subheader("System Logs")
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col1:
+                level = st.selectbox("Level", ["", "info", "warning", "error"], format_func=lambda l: l.upper() or "All")
+            with col2:
+                account_id = st.text_input("Account ID", help="Only logs about this account")
+            # Cursors of the pages already visited, so Newer can step back
+            pages = st.session_state.setdefault("log_pages", [None])
+            if st.session_state.get("log_filters") != (level, account_id):
+                st.session_state["log_filters"] = (level, account_id)
+                pages[:] = [None]
+            with col3:
+                st.write("") # Spacer
+                st.write("") # Spacer
+                if st.button("🔄 Refresh logs"):
+                    fetch_logs.clear()
+                    pages[:] = [None]
+
+            try:
+                data = fetch_logs(level or None, account_id or None, pages[-1])
+                if data["items"]:
+                    st.dataframe(logs_dataframe(data["items"]), use_container_width=True, hide_index=True)
+                else:
+                    st.info("No log records match.")
+                prev_col, next_col = st.columns(2)
+                with prev_col:
+                    if len(pages) > 1 and st.button("⬅️ Newer"):
+                        pages.pop()
+                        st.rerun()
+                with next_col:
+                    if data["next_cursor"] and st.button("Older ➡️"):
+                        pages.append(data["next_cursor"])
+                        st.rerun()
+            except Exception as e:
+                st.error(f"Could not load logs: {e}")
     else:
         if password:
             st.error("Invalid password")
@@ -0,0 +1,46 @@
+"""
+Tests run the backend against mongomock-motor and the benchmarks' fake
+EC2, in memory.
+
+    pip install -r tests/requirements.txt
+    python -m pytest
+"""
+import benchmarks  # noqa: F401 (sets MONGODB_URL before the backend imports settings)
+from backend.app.services.aws_service import shutdown_executor
+from benchmarks.fake_ec2 import FakeEC2
+from benchmarks.harness import BenchEnvironment, apply_settings
+import asyncio
+import pytest
+
+@pytest.fixture
+def bench():
+    """
+    bench(test, **ec2_options) runs `await test(env)` on a fresh event loop
+    against an empty database and a zero-latency FakeEC2.
+    """
+    def run(test, **ec2_options):
+        async def main():
+            env = BenchEnvironment(FakeEC2(**{"latency": 0, "jitter": 0, "seed": 1, **ec2_options}))
+            await env.start()
+            try:
+                return await test(env)
+            finally:
+                await env.stop()
+        try:
+            return asyncio.run(main())
+        finally:
+            # Concurrency semaphores belong to the loop that just closed
+            shutdown_executor()
+    return run
+
+@pytest.fixture
+def override_settings():
+    """
+    override_settings(**values) for the rest of the test.
+    """
+    saved = {}
+    def apply(**overrides):
+        for key, value in apply_settings(**overrides).items():
+            saved.setdefault(key, value)
+    yield apply
+    apply_settings(**saved)
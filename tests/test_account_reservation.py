@@ -0,0 +1,75 @@
+from backend.app.db.capacity import capacity_index
+from backend.app.db.crud import crud
+from backend.app.db.mongodb import db
+from backend.app.services.account_manager import account_manager
+from collections import Counter
+import asyncio
+import pytest
+
+QUOTAS = [40, 25, 25, 15, 10, 5]
+DEPLOYS = 300
+
+def _run_deploys(bench, strategy: str, count: int = 1):
+    async def test(env):
+        account_ids = []
+        for quota in QUOTAS:
+            account_ids += await env.seed_accounts(1, quota=quota)
+        results = await asyncio.gather(*(
+            account_manager.reserve_account("us-east-1", count, strategy=strategy) for _ in range(DEPLOYS)
+        ))
+        handed_out = Counter()
+        for reserved in results:
+            if reserved:
+                account, slots = reserved
+                handed_out[str(account.id)] += slots
+        remaining = {str(doc["_id"]): doc["remaining_quota"] async for doc in db.db.accounts.find()}
+        return dict(zip(account_ids, QUOTAS)), handed_out, remaining, results
+
+    return bench(test)
+
+def _assert_no_overshoot(seeded, handed_out, remaining):
+    assert sum(handed_out.values()) == sum(QUOTAS)
+    assert dict(handed_out) == seeded
+    assert all(quota == 0 for quota in remaining.values())
+    assert capacity_index.available("us-east-1") == 0
+
+@pytest.mark.parametrize("strategy", ["most_remaining", "round_robin", "weighted_random"])
+def test_parallel_reservations_never_overshoot(bench, strategy):
+    seeded, handed_out, remaining, results = _run_deploys(bench, strategy)
+    _assert_no_overshoot(seeded, handed_out, remaining)
+    assert sum(1 for r in results if r is None) == DEPLOYS - sum(QUOTAS)
+
+@pytest.mark.parametrize("strategy", ["most_remaining", "weighted_random"])
+def test_parallel_batch_reservations_never_overshoot(bench, strategy):
+    # Batches of 4 take whatever is left on an account, never more
+    seeded, handed_out, remaining, results = _run_deploys(bench, strategy, count=4)
+    _assert_no_overshoot(seeded, handed_out, remaining)
+    assert all(0 < slots <= 4 for _, slots in filter(None, results))
+
+def test_weighted_random_retries_and_falls_back_under_contention(bench, monkeypatch):
+    # Every deploy gets the sample as it was before anything was reserved,
+    # as from a lagging read, and yields before acting on it (mongomock
+    # itself never does). Picks keep landing on drained accounts, so deploys
+    # retry and then fall back to the sorted pick.
+    sample = crud.get_reservable_quotas
+    reserve = crud.reserve_account_quota
+    calls = Counter()
+    stale = []
+
+    async def contended_sample(*args, **kwargs):
+        if not stale:
+            stale.append(await sample(*args, **kwargs))
+        await asyncio.sleep(0)
+        return stale[0]
+
+    async def counting_reserve(region, count=1, sort=None, account_id=None, exclude=()):
+        calls["fallback" if sort else "conditional"] += 1
+        return await reserve(region, count, sort=sort, account_id=account_id, exclude=exclude)
+
+    monkeypatch.setattr(crud, "get_reservable_quotas", contended_sample)
+    monkeypatch.setattr(crud, "reserve_account_quota", counting_reserve)
+
+    seeded, handed_out, remaining, results = _run_deploys(bench, "weighted_random")
+    _assert_no_overshoot(seeded, handed_out, remaining)
+    assert calls["conditional"] > DEPLOYS
+    assert calls["fallback"] > 0
@@ -0,0 +1,41 @@
+from backend.app.db.models import InstanceStatus
+from backend.app.db.mongodb import db
+from backend.app.services.monitor_service import monitor_service
+from collections import Counter
+from datetime import datetime, timedelta
+from mongomock_motor import AsyncMongoMockCollection
+import pytest
+
+ACCOUNTS = 3
+
+@pytest.mark.parametrize("per_group", [5, 50])
+def test_one_describe_and_one_bulk_write_per_group(bench, monkeypatch, per_group):
+    bulk_writes = []
+    original = AsyncMongoMockCollection.bulk_write
+
+    async def counting_bulk_write(self, requests, *args, **kwargs):
+        bulk_writes.append(len(requests))
+        return await original(self, requests, *args, **kwargs)
+
+    monkeypatch.setattr(AsyncMongoMockCollection, "bulk_write", counting_bulk_write)
+
+    async def test(env):
+        env.ec2.boot_seconds = 3600
+        account_ids = await env.seed_accounts(ACCOUNTS, quota=per_group)
+        due = {"status": InstanceStatus.PENDING, "next_check_at": datetime.utcnow() - timedelta(seconds=1)}
+        # Half are up in EC2, half still booting, round-robin over the accounts
+        ready = per_group * ACCOUNTS // 2
+        await env.seed_instances(ready, account_ids, ec2_state="running", **due)
+        await env.seed_instances(per_group * ACCOUNTS - ready, account_ids, ec2_state="pending", **due)
+
+        await monitor_service.check_pending_instances()
+        statuses = Counter([doc["status"] async for doc in db.db.instances.find({}, {"status": 1})])
+        return env.ec2.calls.get("DescribeInstances", 0), statuses
+
+    describes, statuses = bench(test)
+    # One group per account, whatever its size
+    assert describes == ACCOUNTS
+    assert len(bulk_writes) == ACCOUNTS
+    assert sum(bulk_writes) == per_group * ACCOUNTS
+    assert statuses[InstanceStatus.RUNNING] == per_group * ACCOUNTS // 2
+    assert statuses[InstanceStatus.PENDING] == per_group * ACCOUNTS - per_group * ACCOUNTS // 2
@@ -0,0 +1,37 @@
+from backend.app.db.models import InstanceStatus
+from backend.app.db.mongodb import db
+from backend.app.services.cluster import cluster
+from backend.app.services.monitor_service import monitor_service
+from datetime import datetime, timedelta
+
+WORKERS = ["worker-a", "worker-b", "worker-c"]
+
+def test_workers_read_disjoint_shares_that_cover_the_backlog(bench, monkeypatch):
+    monkeypatch.setattr(cluster, "members", list(WORKERS))
+
+    async def test(env):
+        # Still booting, so every check ends in a reschedule
+        env.ec2.boot_seconds = 3600
+        account_ids = await env.seed_accounts(12, quota=100, regions=["us-east-1", "eu-west-1"])
+        due = {"status": InstanceStatus.PENDING, "next_check_at": datetime.utcnow() - timedelta(seconds=1)}
+        for region in ("us-east-1", "eu-west-1"):
+            await env.seed_instances(120, account_ids, ec2_state="pending", region=region, **due)
+        # Records no account lists any more: only the leader picks these up
+        await env.seed_instances(6, ["5f0000000000000000000000"], ec2_state="pending", **due)
+        await env.seed_instances(6, account_ids[:1], ec2_state="pending", region="ap-south-1", **due)
+
+        backlogs = {}
+        for worker in WORKERS:
+            monkeypatch.setattr(cluster, "worker_id", worker)
+            monkeypatch.setattr(cluster, "is_leader", worker == WORKERS[0])
+            await monitor_service.check_pending_instances()
+            backlogs[worker] = monitor_service.job_stats["check_pending_instances"].last_backlog
+        attempts = [doc["check_attempts"] async for doc in db.db.instances.find({}, {"check_attempts": 1})]
+        return backlogs, attempts
+
+    backlogs, attempts = bench(test)
+    # Each worker counted (and read) only its own share...
+    assert sum(backlogs.values()) == 252
+    assert all(0 < backlog < 252 for backlog in backlogs.values())
+    # ...and between them every record was checked exactly once
+    assert attempts == [1] * 252
@@ -0,0 +1,20 @@
+from backend.app.db.capacity import capacity_index
+from backend.app.db.crud import crud
+from backend.app.db.mongodb import db
+from backend.app.services.deployment_service import deployment_service
+
+def test_deploys_go_to_mongo_when_the_capacity_index_says_zero(bench):
+    async def test(env):
+        await env.seed_accounts(1, quota=0)
+        await crud.rebuild_capacity_index()
+        # Another worker tops the account up; this process's index hasn't seen it
+        await db.db.accounts.update_many({}, {"$set": {"remaining_quota": 5}})
+        stale = capacity_index.available("us-east-1")
+        single = await deployment_service.deploy_instance("alice", "us-east-1")
+        batch = await deployment_service.deploy_batch("bob", 4, "us-east-1")
+        return stale, single, batch
+
+    stale, single, batch = bench(test)
+    assert stale == 0
+    assert single["instance_id"]
+    assert batch["launched"] == 4
@@ -0,0 +1,37 @@
+from backend.app.db.models import InstanceStatus
+from backend.app.db.mongodb import db
+from backend.app.services.expiry_service import expiry_service
+from botocore.exceptions import ClientError
+from datetime import datetime, timedelta
+import functools
+
+def _expired():
+    return {"expire_at": datetime.utcnow() - timedelta(seconds=1)}
+
+def test_records_that_cannot_expire_back_off(bench):
+    async def test(env):
+        account_ids = await env.seed_accounts(1, quota=10)
+        await env.seed_instances(3, ["5f0000000000000000000000"], **_expired())
+        await env.seed_instances(4, account_ids, **_expired())
+
+        terminate = env.ec2.terminate_instances
+
+        @functools.wraps(terminate)
+        def auth_failure(**kwargs):
+            terminate(**kwargs)
+            raise ClientError({"Error": {"Code": "AuthFailure", "Message": "dead account"}}, "TerminateInstances")
+
+        env.ec2.terminate_instances = auth_failure
+        await expiry_service.expire_instances()
+        await expiry_service.expire_instances()
+        stats = expiry_service.job_stats["expire_instances"]
+        docs = [doc async for doc in db.db.instances.find()]
+        return env.ec2.calls["TerminateInstances"], stats.last_backlog, docs
+
+    terminate_calls, second_backlog, docs = bench(test)
+    # The second tick found nothing due and didn't call EC2 again
+    assert terminate_calls == 1
+    assert second_backlog == 0
+    assert all(doc["status"] == InstanceStatus.RUNNING for doc in docs)
+    assert all(doc["metadata"]["expiry_attempts"] == 1 for doc in docs)
+    assert all(doc["metadata"]["expiry_retry_at"] > datetime.utcnow() for doc in docs)
@@ -0,0 +1,32 @@
+from backend.app.db.indexes import INDEXES, assert_no_collection_scans, ensure_indexes, hot_queries
+from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+import os
+import pytest
+
+# mongomock can't explain(), so the planner check needs a real mongod
+MONGODB_TEST_URL = os.environ.get("MONGODB_TEST_URL")
+
+def _leading_fields(collection: str) -> set:
+    return {next(iter(model.document["key"])) for model in INDEXES.get(collection, [])}
+
+def test_every_hot_query_has_an_eligible_index():
+    # The planner can only use an index whose first field the filter or the
+    # sort mentions; anything else is a collection scan on any server
+    for name, collection, query, sort in hot_queries():
+        fields = set(query) | {field for field, _ in sort or []}
+        assert fields & _leading_fields(collection), f"{name} has no index to use"
+
+@pytest.mark.skipif(not MONGODB_TEST_URL, reason="set MONGODB_TEST_URL to a mongod to explain the hot queries")
+def test_hot_queries_never_collection_scan():
+    async def main():
+        client = AsyncIOMotorClient(MONGODB_TEST_URL)
+        database = client[f"rentmachine_test_{os.getpid()}"]
+        try:
+            await ensure_indexes(database)
+            await assert_no_collection_scans(database)
+        finally:
+            await client.drop_database(database.name)
+            client.close()
+
+    asyncio.run(main())
@@ -0,0 +1,21 @@
+from backend.app.api import endpoints
+from backend.app.core.config import settings
+from datetime import datetime, timedelta
+import json
+
+def test_unscoped_feed_hides_pool_stock_and_passwords(bench):
+    async def test(env):
+        account_ids = await env.seed_accounts(1, quota=10)
+        # Old enough to be past the feed's settle window
+        settled = {"updated_at": datetime.utcnow() - timedelta(seconds=30), "initial_password": "hunter2"}
+        await env.seed_instances(3, account_ids, user_id=settings.WARM_POOL_USER_ID, **settled)
+        await env.seed_instances(2, account_ids, user_id="alice", **settled)
+        unscoped = await endpoints.list_instance_changes(since=None, user_id=None, limit=500)
+        scoped = await endpoints.list_instance_changes(since=None, user_id="alice", limit=500)
+        return json.loads(unscoped.body), json.loads(scoped.body)
+
+    unscoped, scoped = bench(test)
+    assert [change["user_id"] for change in unscoped["changes"]] == ["alice", "alice"]
+    assert all("initial_password" not in change for change in unscoped["changes"])
+    # A user's own feed still carries their passwords, as /instances does
+    assert [change["initial_password"] for change in scoped["changes"]] == ["hunter2", "hunter2"]
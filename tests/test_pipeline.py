@@ -0,0 +1,21 @@
+from backend.app.services.pipeline import run_pipeline
+import asyncio
+
+def test_budget_never_drops_a_pulled_item():
+    # Pulling is what claims an item (auto_replenish leases it), so every
+    # item the source gave up must reach a worker even when the budget runs out
+    pulled, handled = [], []
+
+    async def source():
+        while True:
+            pulled.append(len(pulled))
+            yield pulled[-1]
+
+    async def worker(item):
+        await asyncio.sleep(0.02)
+        handled.append(item)
+
+    result = asyncio.run(run_pipeline(source(), worker, concurrency=2, budget_seconds=0.1))
+    assert result["budget_exhausted"]
+    assert sorted(handled) == pulled
+    assert result["processed"] == len(pulled)
@@ -0,0 +1,84 @@
+from backend.app.services.aws_service import AWSService
+from backend.app.services.rate_limiter import CircuitOpenError, rate_limiter
+from botocore.exceptions import ClientError, EndpointConnectionError
+import asyncio
+import pytest
+import time
+
+ACCOUNT = "6ad4bfa50e8ebf996c05ea84"
+REGION = "us-east-1"
+
+@pytest.fixture
+def fast_breaker(override_settings):
+    override_settings(
+        AWS_BREAKER_FAILURE_THRESHOLD=2, AWS_BREAKER_OPEN_SECONDS=0.05,
+        AWS_CALL_MAX_RETRIES=3, AWS_RETRY_BASE_SECONDS=0.001, AWS_RETRY_MAX_SECONDS=0.005
+    )
+
+def _operation(*outcomes, delay: float = 0):
+    """
+    A fake describe_instances that fails with each outcome in turn (None
+    succeeds) and then keeps succeeding.
+    """
+    remaining = list(outcomes)
+    calls = []
+
+    def describe_instances(**kwargs):
+        calls.append(kwargs)
+        time.sleep(delay)
+        outcome = remaining.pop(0) if remaining else None
+        if outcome == "throttle":
+            raise ClientError({"Error": {"Code": "RequestLimitExceeded", "Message": "slow down"}}, "DescribeInstances")
+        if outcome == "transient":
+            raise EndpointConnectionError(endpoint_url="https://ec2.us-east-1.amazonaws.com")
+        return {"Reservations": []}
+
+    describe_instances.calls = calls
+    return describe_instances
+
+async def _open_circuit(aws: AWSService):
+    with pytest.raises(CircuitOpenError):
+        await aws._call(_operation(*["transient"] * 5))
+    assert rate_limiter.open_accounts(REGION) == [ACCOUNT]
+    await asyncio.sleep(0.06)
+
+def test_throttled_trial_retries_and_closes_the_circuit(bench, fast_breaker):
+    async def test(env):
+        aws = AWSService("AKIABENCH00000000", "secret", REGION, ACCOUNT)
+        await _open_circuit(aws)
+        trial = _operation("throttle")
+        assert await aws._call(trial) == {"Reservations": []}
+        assert len(trial.calls) == 2
+        return rate_limiter.open_accounts(REGION), rate_limiter.stats()["circuits"]
+
+    open_accounts, circuits = bench(test)
+    assert open_accounts == []
+    assert circuits == []
+
+def test_cancelled_trial_lets_the_next_call_through(bench, fast_breaker):
+    async def test(env):
+        aws = AWSService("AKIABENCH00000000", "secret", REGION, ACCOUNT)
+        await _open_circuit(aws)
+        trial = asyncio.create_task(aws._call(_operation(delay=0.1)))
+        await asyncio.sleep(0.02)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        assert rate_limiter.open_accounts(REGION) == []
+        await aws._call(_operation())
+        return rate_limiter.stats()["circuits"]
+
+    assert bench(test) == []
+
+def test_failed_trial_reopens_without_retrying(bench, fast_breaker):
+    async def test(env):
+        aws = AWSService("AKIABENCH00000000", "secret", REGION, ACCOUNT)
+        await _open_circuit(aws)
+        trial = _operation("transient")
+        with pytest.raises(CircuitOpenError):
+            await aws._call(trial)
+        return len(trial.calls), rate_limiter.open_accounts(REGION)
+
+    calls, open_accounts = bench(test)
+    assert calls == 1
+    assert open_accounts == [ACCOUNT]
@@ -0,0 +1,38 @@
+from backend.app.db.mongodb import db
+from backend.app.services.deployment_service import DEFAULT_INSTANCE_TYPE, deployment_service
+from backend.app.services.monitor_service import monitor_service
+from backend.app.services.warm_pool import warm_pool
+from datetime import datetime
+import functools
+
+def test_pool_instances_only_carry_their_own_password(bench, override_settings):
+    override_settings(WARM_POOL_ENABLED=True, WARM_POOL_TARGETS={"us-east-1": {DEFAULT_INSTANCE_TYPE: 3}})
+
+    async def test(env):
+        user_data = {}
+        run_instances = env.ec2.run_instances
+
+        @functools.wraps(run_instances)
+        def recording_run_instances(**kwargs):
+            response = run_instances(**kwargs)
+            for instance in response["Instances"]:
+                user_data[instance["InstanceId"]] = kwargs["UserData"]
+            return response
+
+        env.ec2.run_instances = recording_run_instances
+        await env.seed_accounts(1, quota=10)
+        await warm_pool.refill()
+        await db.db.instances.update_many({}, {"$set": {"next_check_at": datetime.utcnow()}})
+        await monitor_service.check_pending_instances()
+
+        handed = [await deployment_service.deploy_instance(f"user_{i}", "us-east-1") for i in range(3)]
+        passwords = {doc["instance_id"]: doc["initial_password"] async for doc in db.db.instances.find()}
+        return env.ec2.calls["RunInstances"], user_data, passwords, handed
+
+    calls, user_data, passwords, handed = bench(test)
+    assert all(result.get("warm") for result in handed)
+    assert calls == 3
+    for instance_id, script in user_data.items():
+        others = [password for other, password in passwords.items() if other != instance_id]
+        assert passwords[instance_id] in script
+        assert not any(password in script for password in others)